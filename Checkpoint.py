@@ -0,0 +1,166 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+
+# fixed so checkpoints can be read by other Python versions
+PICKLE_PROTOCOL = 4
+
+
+class Checkpoint():
+    """Progress of a merge run persisted in an SQLite file so a failed run can be resumed.
+
+    The file contains
+    - which (pairwise) merge steps, i.e. source databases, have been completed,
+    - the tables of the current step that have been copied,
+    - the merged rows of the current step after their keys have been adjusted.
+      Once they are saved, a resumed step only writes the rows that are not in the target yet.
+
+    'run' identifies the merge run (e.g. the database URLs).
+    Resuming with a checkpoint of a different run raises a ValueError.
+    """
+
+    def __init__(self, path: str, run: Any) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS progress (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS merged_rows ("
+            "table_name TEXT NOT NULL, seq INTEGER NOT NULL, row BLOB NOT NULL, "
+            "PRIMARY KEY (table_name, seq))"
+        )
+        self._connection.commit()
+        saved_run = self._get("run")
+        if saved_run is None:
+            self._set("run", run)
+        elif saved_run != json.loads(json.dumps(run)):
+            self._connection.close()
+            raise ValueError(
+                f"The checkpoint '{path}' belongs to another merge run ({saved_run})."
+            )
+
+    def _get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            result = self._connection.execute(
+                "SELECT value FROM progress WHERE key = ?", (key,)
+            ).fetchone()
+        return default if result is None else json.loads(result[0])
+
+    def _set(self, key: str, value: Any) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO progress (key, value) VALUES (?, ?)",
+                (key, json.dumps(value)),
+            )
+
+    @property
+    def started(self) -> bool:
+        """Whether the target database has been prepared by this run."""
+        return self._get("started", False)
+
+    def start(self) -> None:
+        self._set("started", True)
+
+    @property
+    def completed_steps(self) -> int:
+        return self._get("completed_steps", 0)
+
+    def complete_step(self) -> None:
+        """Forgets the progress of the current step and continues with the next one."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM merged_rows")
+            self._connection.execute(
+                "DELETE FROM progress WHERE key NOT IN ('run', 'started', 'completed_steps')"
+            )
+        self._set("completed_steps", self.completed_steps + 1)
+
+    def common_tables(self, common_tables: Set[str]) -> Set[str]:
+        """Returns the tables the current step merges (instead of copying them).
+        They are determined when the step starts: resuming must not merge tables
+        that have been (partially) copied in the meantime."""
+        saved_common_tables = self._get("common_tables")
+        if saved_common_tables is None:
+            self._set("common_tables", sorted(common_tables))
+            return set(common_tables)
+        return set(saved_common_tables)
+
+    def is_copied(self, table_name: str) -> bool:
+        return table_name in self._get("copied_tables", [])
+
+    def table_copied(self, table_name: str) -> None:
+        with self._lock, self._connection:
+            result = self._connection.execute(
+                "SELECT value FROM progress WHERE key = 'copied_tables'"
+            ).fetchone()
+            copied_tables = [] if result is None else json.loads(result[0])
+            self._connection.execute(
+                "INSERT OR REPLACE INTO progress (key, value) VALUES ('copied_tables', ?)",
+                (json.dumps(copied_tables + [table_name]),),
+            )
+
+    @property
+    def has_merged_rows(self) -> bool:
+        return self._get("merged_table_names") is not None
+
+    def save_merged_rows(self, rows_by_table_name: Dict[str, Iterable[list]]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM merged_rows")
+            for table_name, rows in rows_by_table_name.items():
+                self._connection.executemany(
+                    "INSERT INTO merged_rows (table_name, seq, row) VALUES (?, ?, ?)",
+                    (
+                        (table_name, seq, pickle.dumps(row, protocol=PICKLE_PROTOCOL))
+                        for seq, row in enumerate(rows)
+                    ),
+                )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO progress (key, value) VALUES ('merged_table_names', ?)",
+                (json.dumps(list(rows_by_table_name.keys())),),
+            )
+
+    def merged_table_names(self) -> List[str]:
+        return self._get("merged_table_names", [])
+
+    def iter_merged_rows(
+        self,
+        table_name: str,
+        offset: int = 0,
+        page_size: int = 10000,
+    ) -> Iterator[list]:
+        """Yields the saved merged rows of the table (in their original order)
+        starting with the row at index 'offset'."""
+        while True:
+            with self._lock:
+                page = self._connection.execute(
+                    "SELECT seq, row FROM merged_rows WHERE table_name = ? AND seq >= ? "
+                    "ORDER BY seq LIMIT ?",
+                    (table_name, offset, page_size),
+                ).fetchall()
+            if len(page) == 0:
+                return
+            for _, row in page:
+                yield pickle.loads(row)
+            offset = page[-1][0] + 1
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the merged tables of the current step have been emptied before writing."""
+        return self._get("truncated", False)
+
+    def mark_truncated(self) -> None:
+        self._set("truncated", True)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def remove(self) -> None:
+        """Deletes the checkpoint after the run has been completed."""
+        self.close()
+        os.remove(self.path)
+
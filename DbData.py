@@ -1,4 +1,7 @@
+import copy
+
 from sqlalchemy import inspect
+from sqlalchemy.orm import Session
 
 
 class DbData():
@@ -8,8 +11,34 @@ class DbData():
         self.base = base
         self.session = session
         self.engine = engine
+        # cached db_helpers.ForeignKeyGraph (reset when rereflecting)
+        self.foreign_key_graph = None
+        # names of tables that have been created, altered or dropped since the last reflection
+        self.changed_table_names = set()
+        self._inspector = None
 
-    # Need to always get a new inspector so the latest changes are there.
+    # The inspector caches what it has read from the database.
+    # It is recreated after 'invalidate' so the latest changes are there.
     @property
     def inspector(self):
-        return inspect(self.engine)
+        if self._inspector is None:
+            self._inspector = inspect(self.engine)
+        return self._inspector
+
+    def mark_changed(self, *table_names: str) -> None:
+        """Remembers that the schema of the given tables has changed
+        so only those need to be reflected again (see 'db_helpers.reflect_changed_tables')."""
+        self.changed_table_names.update(table_names)
+        self._inspector = None
+
+    def invalidate(self) -> None:
+        """Drops all cached schema information."""
+        self._inspector = None
+        self.foreign_key_graph = None
+
+    def with_new_session(self) -> "DbData":
+        """Returns a DbData that shares everything but the session with this one.
+        Sessions must not be shared between threads."""
+        db = copy.copy(self)
+        db.session = Session(self.engine)
+        return db
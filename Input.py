@@ -1,8 +1,17 @@
 from strategies import MergeStrategy
+from MergeSettings import MergeSettings
 
 class Input():
 
-    def __init__(self, db_urls: list, target_db_url: str, strategy: MergeStrategy) -> None:
+    def __init__(
+        self,
+        db_urls: list,
+        target_db_url: str,
+        strategy: MergeStrategy,
+        **settings
+    ) -> None:
         self.db_urls = db_urls
         self.target_db_url = target_db_url
         self.strategy = strategy
+        # remaining (optional) keys of the settings file, e.g. 'batch_size'
+        self.settings = MergeSettings(**settings)
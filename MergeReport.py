@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# phases of a merge run (in the order they usually happen)
+PHASES = ("reflect", "read", "hash", "dedup", "remap", "truncate", "insert", "copy", "merge")
+
+# counters of each (phase, table) entry
+COUNTERS = ("seconds", "rows", "duplicates", "bytes")
+
+# hook(phase, table name or None, recorded counters)
+Hook = Callable[[str, Optional[str], Dict[str, float]], None]
+
+
+class MergeReport():
+    """Collects timings and counts per phase and table of a merge run.
+    Every 'record' is passed to the hooks and summed up per (phase, table)
+    for the JSON report ('to_dict', 'write_json').
+    It can be used by several threads. Copies sent to other processes start empty
+    and are not merged back, so the callers of process workers record their phases.
+    """
+
+    def __init__(self, hooks: Optional[List[Hook]] = None, count_bytes: bool = False) -> None:
+        self.hooks = list(hooks or [])
+        # whether the size of the read rows is estimated (see 'estimate_size')
+        self.count_bytes = count_bytes
+        # mapping: (phase, table name) -> counters
+        self._entries: Dict[Tuple[str, Optional[str]], Dict[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        return {"count_bytes": self.count_bytes}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(count_bytes=state["count_bytes"])  # type: ignore
+
+    def record(self, phase: str, table_name: Optional[str] = None, **counters: float) -> None:
+        """Adds the counters (see COUNTERS) to the entry of the phase and table."""
+        if phase not in PHASES:
+            raise ValueError(f"Unknown phase '{phase}'. Available: {', '.join(PHASES)}")
+        with self._lock:
+            entry = self._entries.setdefault(
+                (phase, table_name),
+                {counter: 0 for counter in COUNTERS},
+            )
+            for counter, value in counters.items():
+                entry[counter] += value
+        for hook in self.hooks:
+            hook(phase, table_name, counters)
+
+    @contextmanager
+    def phase(self, phase: str, table_name: Optional[str] = None, **counters: float) -> Iterator[Dict[str, float]]:
+        """Records the time spent in the 'with' block.
+        Counters can be added to the yielded dict inside the block."""
+        counters = dict(counters)
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            self.record(phase, table_name, seconds=time.perf_counter() - start, **counters)
+
+    def get(self, phase: str, table_name: Optional[str] = None) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._entries.get(
+                (phase, table_name),
+                {counter: 0 for counter in COUNTERS},
+            ))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = [
+                {"phase": phase, "table": table_name, **counters}
+                for (phase, table_name), counters in self._entries.items()
+            ]
+        totals: Dict[str, Dict[str, float]] = OrderedDict()
+        for entry in entries:
+            # The 'merge' phase contains all others.
+            total = totals.setdefault(entry["phase"], {counter: 0 for counter in COUNTERS})
+            for counter in COUNTERS:
+                total[counter] += entry[counter]
+        return {"entries": entries, "totals": totals}
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2, default=str)
+
+
+def estimate_size(rows: Iterable[Iterable[Any]]) -> int:
+    """Estimates the number of bytes of the rows' values:
+    the length of strings and bytes and 8 bytes for any other value (except None)."""
+    return sum(
+        len(value) if isinstance(value, (str, bytes)) else 8
+        for row in rows
+        for value in row
+        if value is not None
+    )
@@ -0,0 +1,130 @@
+from typing import Dict, List, Optional
+
+from MergeReport import Hook, MergeReport
+import parallel
+
+
+MERGE_MODES = ("pairwise", "n_way", "incremental")
+
+
+class MergeSettings():
+    """Tuning options for a merge run.
+    Every option has a default so a settings file only needs to list the ones it changes.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        multi_values_insert: bool = False,
+        page_size: int = 10000,
+        row_digest: str = "blake2b",
+        merge_mode: str = "pairwise",
+        source_workers: int = 1,
+        source_executor: str = "process",
+        table_workers: int = 1,
+        max_rows_in_memory: int = 0,
+        spill_directory: str = None,
+        compact_rows: bool = False,
+        sql_merge: bool = False,
+        sql_key_remapping: bool = False,
+        incremental_write: bool = False,
+        checkpoint_file: str = None,
+        merge_state_file: str = None,
+        updated_at_column: str = None,
+        native_copy: bool = False,
+        preserve_primary_keys: bool = False,
+        pool_size: int = None,
+        pool_pre_ping: bool = False,
+        pipeline: bool = False,
+        pipeline_queue_size: int = 2,
+        report_file: str = None,
+        hooks: Optional[List[Hook]] = None,
+        near_duplicate_columns: Optional[Dict[str, List[str]]] = None,
+        near_duplicate_threshold: float = 0.8,
+    ) -> None:
+        if merge_mode not in MERGE_MODES:
+            raise ValueError(
+                f"Unknown merge mode '{merge_mode}'. Available: {', '.join(MERGE_MODES)}"
+            )
+        if merge_mode == "incremental" and merge_state_file is None:
+            raise ValueError("The incremental merge mode requires a merge_state_file.")
+        if source_executor not in parallel.EXECUTOR_KINDS:
+            raise ValueError(
+                f"Unknown source executor '{source_executor}'. "
+                f"Available: {', '.join(parallel.EXECUTOR_KINDS)}"
+            )
+        if source_workers > 1 and merge_mode != "n_way":
+            raise ValueError("source_workers > 1 requires the 'n_way' merge mode.")
+        if source_workers > 1 and source_executor == "process" and row_digest == "builtin":
+            # The digests of the workers are reused by the main process.
+            raise ValueError(
+                "The 'builtin' row digest differs between processes. "
+                "Use another row_digest or source_executor='thread'."
+            )
+        # number of rows sent to the database per executemany/INSERT statement
+        self.batch_size = batch_size
+        # use a single multi-VALUES INSERT per batch if the dialect supports it
+        self.multi_values_insert = multi_values_insert
+        # number of rows fetched per page when streaming tables
+        self.page_size = page_size
+        # name of the digest used to detect duplicate rows ('blake2b' or 'builtin')
+        self.row_digest = row_digest
+        # 'pairwise': merge(merge(db1, db2), db3)...
+        # 'n_way': merge all databases in a single pass (see 'merge.merge_n_way')
+        self.merge_mode = merge_mode
+        # number of databases read and hashed concurrently (only for the 'n_way' merge mode)
+        self.source_workers = source_workers
+        # 'process' (for CPU bound hashing) or 'thread' (for I/O bound reading)
+        self.source_executor = source_executor
+        # number of tables merged/copied/written concurrently
+        # (tables are processed after the tables they reference)
+        self.table_workers = table_workers
+        # maximum number of merged rows per table kept in memory before spilling them to disk
+        # (0 = never spill)
+        self.max_rows_in_memory = max_rows_in_memory
+        # directory of the spill files (default: the system's temporary directory)
+        self.spill_directory = spill_directory
+        # store merged rows column by column (see 'strategies.CompactRowsDict')
+        # unless they are spilled to disk
+        self.compact_rows = compact_rows
+        # merge common tables inside the target database if it can access the source database
+        # (see 'sql_merge'), otherwise fall back to merging in Python
+        self.sql_merge = sql_merge
+        # remap foreign keys of the rows merged in Python with UPDATE statements
+        # on temporary mapping tables in the target database (see 'sql_merge')
+        self.sql_key_remapping = sql_key_remapping
+        # only write the merged rows that differ from the target's rows (with the same primary key)
+        # instead of truncating the target tables and inserting all rows
+        self.incremental_write = incremental_write
+        # SQLite file recording the progress so a failed merge can be resumed (see 'Checkpoint')
+        self.checkpoint_file = checkpoint_file
+        # SQLite file with the state of the previous 'incremental' merges (see 'MergeState')
+        self.merge_state_file = merge_state_file
+        # name of the columns with the last update time of a row (in the tables that have one)
+        # so the 'incremental' mode also finds changed rows (not only new ones)
+        self.updated_at_column = updated_at_column
+        # copy tables that only exist in the source with the databases' bulk mechanisms
+        # if possible (see 'bulk_copy')
+        self.native_copy = native_copy
+        # keep the primary keys of merged rows unless they collide (instead of renumbering all rows)
+        self.preserve_primary_keys = preserve_primary_keys
+        # number of connections kept open per database (default: SQLAlchemy's default)
+        # (engines and their pools are shared by all uses of a database URL, see 'db_helpers')
+        self.pool_size = pool_size
+        # test pooled connections before using them (reconnecting if they have been dropped)
+        self.pool_pre_ping = pool_pre_ping
+        # read, hash and deduplicate (or copy) the pages of a table concurrently (see 'pipeline')
+        self.pipeline = pipeline
+        # maximum number of pages waiting between two stages of the pipeline
+        self.pipeline_queue_size = pipeline_queue_size
+        # path of a JSON file the timings and counts per phase and table are written to
+        # after the merge (see 'MergeReport')
+        self.report_file = report_file
+        # collects the timings and counts of the run and passes them to the hooks
+        # (callables receiving the phase, the table name and the counters)
+        self.report = MergeReport(hooks, count_bytes=report_file is not None or bool(hooks))
+        # mapping: table name -> names of the columns whose values may differ slightly
+        # (e.g. in case or whitespace) in rows that are merged anyway (see 'near_duplicates')
+        self.near_duplicate_columns = near_duplicate_columns or {}
+        # minimum similarity (Jaccard of the character shingles) of near-duplicate columns
+        self.near_duplicate_threshold = near_duplicate_threshold
@@ -0,0 +1,152 @@
+import pickle
+import sqlite3
+from typing import Any, Dict, Iterable, List, Tuple
+
+from db_helpers import batched
+
+
+# fixed so the state can be read by other Python versions
+PICKLE_PROTOCOL = 4
+# stays below SQLite's limit of bound parameters (with the other parameters of a query)
+MAX_PARAMETERS_PER_QUERY = 900
+
+
+class MergeState():
+    """What incremental merges (see 'incremental_merge') remember between runs,
+    persisted in an SQLite file:
+    - high-water marks: the greatest primary key (and update timestamp)
+      read from each table of each source database
+    - primary key mapping: (source, table, old primary key) -> primary key in the target
+    - row digests: (table, digest) -> primary keys of the target rows with that digest
+
+    Sources are identified by strings.
+    Digests are stored as strings because they may exceed SQLite's integers.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS high_water_marks (
+                source TEXT NOT NULL, table_name TEXT NOT NULL, marks BLOB NOT NULL,
+                PRIMARY KEY (source, table_name)
+            );
+            CREATE TABLE IF NOT EXISTS primary_keys (
+                source TEXT NOT NULL, table_name TEXT NOT NULL,
+                old_pk NOT NULL, new_pk NOT NULL,
+                PRIMARY KEY (source, table_name, old_pk)
+            );
+            CREATE INDEX IF NOT EXISTS primary_keys_new_pk ON primary_keys (table_name, new_pk);
+            CREATE TABLE IF NOT EXISTS digests (
+                table_name TEXT NOT NULL, digest TEXT NOT NULL, new_pk NOT NULL,
+                PRIMARY KEY (table_name, digest, new_pk)
+            );
+            CREATE INDEX IF NOT EXISTS digests_new_pk ON digests (table_name, new_pk);
+        """)
+        self._connection.commit()
+
+    @property
+    def empty(self) -> bool:
+        """Whether no merge has been recorded yet."""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM high_water_marks"
+        ).fetchone()[0] == 0
+
+    def high_water_marks(self, source: str, table_name: str) -> Tuple[Any, Any]:
+        """Returns (greatest primary key, greatest update timestamp)
+        of the rows read before ((None, None) if there are none)."""
+        result = self._connection.execute(
+            "SELECT marks FROM high_water_marks WHERE source = ? AND table_name = ?",
+            (source, table_name),
+        ).fetchone()
+        return (None, None) if result is None else pickle.loads(result[0])
+
+    def set_high_water_marks(
+        self,
+        source: str,
+        table_name: str,
+        max_primary_key: Any,
+        max_updated_at: Any = None,
+    ) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO high_water_marks (source, table_name, marks) "
+            "VALUES (?, ?, ?)",
+            (
+                source,
+                table_name,
+                pickle.dumps((max_primary_key, max_updated_at), protocol=PICKLE_PROTOCOL),
+            ),
+        )
+
+    def new_primary_keys(
+        self,
+        source: str,
+        table_name: str,
+        old_primary_keys: Iterable[Any],
+    ) -> Dict[Any, Any]:
+        """Returns the mapping old primary key -> new primary key for the mapped keys."""
+        new_pk_by_old_pk: Dict[Any, Any] = {}
+        for chunk in batched(old_primary_keys, MAX_PARAMETERS_PER_QUERY):
+            new_pk_by_old_pk.update(self._connection.execute(
+                "SELECT old_pk, new_pk FROM primary_keys "
+                "WHERE source = ? AND table_name = ? "
+                f"AND old_pk IN ({', '.join('?' * len(chunk))})",
+                [source, table_name] + chunk,
+            ).fetchall())
+        return new_pk_by_old_pk
+
+    def map_primary_keys(
+        self,
+        source: str,
+        table_name: str,
+        new_pk_by_old_pk: Dict[Any, Any],
+    ) -> None:
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO primary_keys (source, table_name, old_pk, new_pk) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                (source, table_name, old_pk, new_pk)
+                for old_pk, new_pk in new_pk_by_old_pk.items()
+            ),
+        )
+
+    def count_represented_rows(self, table_name: str, new_pk: Any) -> int:
+        """Returns the number of source rows (of all sources) merged into the target row."""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM primary_keys WHERE table_name = ? AND new_pk = ?",
+            (table_name, new_pk),
+        ).fetchone()[0]
+
+    def primary_keys_by_digest(
+        self,
+        table_name: str,
+        digests: Iterable[int],
+    ) -> Dict[int, List[Any]]:
+        """Returns the primary keys of the target rows with the given digests."""
+        primary_keys_by_digest: Dict[int, List[Any]] = {}
+        for chunk in batched(set(str(digest) for digest in digests), MAX_PARAMETERS_PER_QUERY):
+            for digest, new_pk in self._connection.execute(
+                "SELECT digest, new_pk FROM digests "
+                f"WHERE table_name = ? AND digest IN ({', '.join('?' * len(chunk))})",
+                [table_name] + chunk,
+            ):
+                primary_keys_by_digest.setdefault(int(digest), []).append(new_pk)
+        return primary_keys_by_digest
+
+    def set_digest(self, table_name: str, new_pk: Any, digest: int) -> None:
+        """Sets the digest of a target row (replacing its previous digest)."""
+        self._connection.execute(
+            "DELETE FROM digests WHERE table_name = ? AND new_pk = ?",
+            (table_name, new_pk),
+        )
+        self._connection.execute(
+            "INSERT INTO digests (table_name, digest, new_pk) VALUES (?, ?, ?)",
+            (table_name, str(digest), new_pk),
+        )
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
@@ -0,0 +1,159 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Dict, Hashable, Iterable, Iterator, Optional, Tuple
+import weakref
+
+from db_helpers import batched
+
+
+# fixed so equal keys are always pickled to equal bytes
+PICKLE_PROTOCOL = 4
+# types SQLite stores (and compares) natively, other keys are pickled (to bytes)
+NATIVE_TYPES = (int, float, str)
+# number of keys saved per transaction
+KEYS_PER_BATCH = 10000
+# maximum number of keys per lookup statement (below SQLite's bound parameter limit)
+MAX_KEYS_PER_LOOKUP = 500
+
+
+class PrimaryKeyMap():
+    """Mapping (table name, origin, old primary key) -> new primary key
+    kept in a temporary SQLite file (in 'directory' or the default temporary directory)
+    so adjusting the keys of tables larger than the memory does not hold all keys in memory.
+    The file is deleted on 'close'. Safe to use from several threads.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        fd, self.path = tempfile.mkstemp(prefix="keys_", suffix=".sqlite", dir=directory)
+        os.close(fd)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._finalizer = weakref.finalize(self, _remove_file, self._connection, self.path)
+        # The file is private and temporary so durability does not matter.
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute(
+            "CREATE TABLE new_pks (table_name TEXT NOT NULL, origin, old_pk, new_pk, "
+            "PRIMARY KEY (table_name, origin, old_pk)) WITHOUT ROWID"
+        )
+
+    def put_many(self, table_name: str, keys: Iterable[Tuple[Any, Any, Any]]) -> None:
+        """Saves the (origin, old primary key, new primary key) tuples of the table."""
+        # 'keys' is consumed outside of the lock (it may read from this map, see 'preserve').
+        for batch in batched(keys, KEYS_PER_BATCH):
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO new_pks (table_name, origin, old_pk, new_pk) "
+                    "VALUES (?, ?, ?, ?)",
+                    (
+                        (table_name, _encode(origin), _encode(old_pk), _encode(new_pk))
+                        for origin, old_pk, new_pk in batch
+                    ),
+                )
+
+    def get_many(
+        self,
+        table_name: str,
+        keys: Iterable[Tuple[Any, Any]],
+    ) -> Dict[Tuple[Any, Any], Any]:
+        """Returns the new primary keys of the (origin, old primary key) tuples
+        (that have been saved) of the table."""
+        # mapping: origin -> {encoded old primary key: old primary key}
+        old_pks_by_origin: Dict[Hashable, Dict[Any, Any]] = {}
+        for origin, old_pk in keys:
+            old_pks_by_origin.setdefault(origin, {})[_encode(old_pk)] = old_pk
+        new_pks = {}
+        with self._lock:
+            for origin, old_pks in old_pks_by_origin.items():
+                encoded_old_pks = list(old_pks)
+                for start in range(0, len(encoded_old_pks), MAX_KEYS_PER_LOOKUP):
+                    chunk = encoded_old_pks[start:start + MAX_KEYS_PER_LOOKUP]
+                    records = self._connection.execute(
+                        "SELECT old_pk, new_pk FROM new_pks "
+                        "WHERE table_name = ? AND origin = ? "
+                        f"AND old_pk IN ({', '.join('?' * len(chunk))})",
+                        (table_name, _encode(origin), *chunk),
+                    )
+                    for encoded_old_pk, new_pk in records:
+                        new_pks[(origin, old_pks[encoded_old_pk])] = _decode(new_pk)
+        return new_pks
+
+    def preserve(self, candidates: Iterable[Tuple[Any, bool]]) -> Optional[Iterator[int]]:
+        """Like 'merge.get_preserved_primary_keys' for the (old primary key, preferred) tuples
+        of the rows (in order) but without holding them in memory.
+        Returns the new primary keys in the same order or None if they are not all integers.
+        The keys must be consumed before 'preserve' is called again.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DROP TABLE IF EXISTS candidates")
+            self._connection.execute("DROP TABLE IF EXISTS kept_pks")
+            self._connection.execute(
+                "CREATE TABLE candidates (seq INTEGER PRIMARY KEY, pk INTEGER, preferred INTEGER)"
+            )
+            self._connection.execute(
+                "CREATE TABLE kept_pks (pk INTEGER PRIMARY KEY, seq INTEGER NOT NULL UNIQUE)"
+            )
+            non_integers = []
+
+            def candidate_records() -> Iterator[Tuple[int, int, bool]]:
+                for seq, (candidate, preferred) in enumerate(candidates):
+                    if not isinstance(candidate, int) or isinstance(candidate, bool):
+                        non_integers.append(candidate)
+                        return
+                    yield seq, candidate, preferred
+
+            self._connection.executemany(
+                "INSERT INTO candidates (seq, pk, preferred) VALUES (?, ?, ?)",
+                candidate_records(),
+            )
+            if non_integers:
+                return None
+            # The first row (preferred ones first) claiming a key keeps it.
+            self._connection.execute(
+                "INSERT OR IGNORE INTO kept_pks (pk, seq) "
+                "SELECT pk, seq FROM candidates ORDER BY preferred DESC, seq"
+            )
+            max_kept_pk = self._connection.execute("SELECT MAX(pk) FROM kept_pks").fetchone()[0]
+        return self._iter_preserved_pks((max_kept_pk or 0) + 1)
+
+    def _iter_preserved_pks(self, next_pk: int) -> Iterator[int]:
+        seq = 0
+        while True:
+            with self._lock:
+                page = self._connection.execute(
+                    "SELECT candidates.seq, kept_pks.pk FROM candidates "
+                    "LEFT JOIN kept_pks ON kept_pks.seq = candidates.seq "
+                    "WHERE candidates.seq >= ? ORDER BY candidates.seq LIMIT 10000",
+                    (seq, ),
+                ).fetchall()
+            if len(page) == 0:
+                return
+            for _, kept_pk in page:
+                if kept_pk is None:
+                    yield next_pk
+                    next_pk += 1
+                else:
+                    yield kept_pk
+            seq = page[-1][0] + 1
+
+    def close(self) -> None:
+        self._finalizer()
+
+
+def _encode(value: Any) -> Any:
+    if value is None or type(value) in NATIVE_TYPES:
+        return value
+    return pickle.dumps(value, PICKLE_PROTOCOL)
+
+
+def _decode(value: Any) -> Any:
+    return pickle.loads(value) if isinstance(value, bytes) else value
+
+
+def _remove_file(connection: sqlite3.Connection, path: str) -> None:
+    connection.close()
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,163 @@
+"""Measures the throughput and peak memory of the merge's hot paths on synthetic SQLite databases.
+
+Usage (from the repository's root):
+    python3 -m benchmarks.run [--users=10000] [--databases=2] [--duplicate-ratio=0.5]
+        [--orders-per-user=3] [--self-reference-ratio=0.1] [--directory=/tmp] [--json=report.json]
+        [--setting=key=value ...]
+
+Peak memory is measured with tracemalloc, i.e. it covers Python objects only
+and the timings include tracemalloc's overhead (use --no-memory to turn it off).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import yaml
+
+import db_helpers
+from Input import Input
+from merge import adjust_relationships, merge, merge_tables
+from MergeSettings import MergeSettings
+import strategies
+
+from .synthetic_databases import generate_databases
+
+
+def measure(func: Callable[[], Any], trace_memory: bool) -> Tuple[Any, float, int]:
+    """Returns the result of 'func', the elapsed seconds and the peak memory in bytes."""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    settings_dict = {
+        key: yaml.safe_load(value)
+        for key, value in (setting.split("=", 1) for setting in args.setting)
+    }
+    settings = MergeSettings(**settings_dict)
+    database_urls = generate_databases(
+        args.directory,
+        num_databases=args.databases,
+        num_users=args.users,
+        duplicate_ratio=args.duplicate_ratio,
+        orders_per_user=args.orders_per_user,
+        self_reference_ratio=args.self_reference_ratio,
+    )
+    target_path = os.path.join(args.directory, "benchmark_target.db")
+    insert_path = os.path.join(args.directory, "benchmark_insert.db")
+    for path in (target_path, insert_path):
+        if os.path.exists(path):
+            os.remove(path)
+    rows_per_database = args.users * (1 + args.orders_per_user)
+    results = []
+
+    def report(name: str, num_rows: int, seconds: float, peak: int) -> None:
+        result = {
+            "benchmark": name,
+            "rows": num_rows,
+            "seconds": round(seconds, 4),
+            "rows_per_second": round(num_rows / seconds) if seconds > 0 else None,
+            "peak_memory_mb": round(peak / 2**20, 2) if args.memory else None,
+        }
+        results.append(result)
+        print(
+            f"{name:<24} {num_rows:>10} rows {seconds:>9.3f} s "
+            f"{result['rows_per_second'] or 0:>10} rows/s "
+            + (f"{result['peak_memory_mb']:>9.2f} MB" if args.memory else "")
+        )
+
+    # merge_tables + adjust_relationships: 2nd database into the 1st one
+    db = db_helpers.get_reflected_db(database_urls[0])
+    db2 = db_helpers.get_reflected_db(database_urls[1 % len(database_urls)])
+    merged_tables, seconds, peak = measure(
+        lambda: [
+            merge_tables(db2, db, table_name, settings)
+            for table_name in ("users", "orders")
+        ],
+        args.memory,
+    )
+    report("merge_tables", 2 * rows_per_database, seconds, peak)
+    rows_by_table_name, seconds, peak = measure(
+        lambda: adjust_relationships(db, merged_tables),
+        args.memory,
+    )
+    num_merged_rows = sum(len(rows) for rows in rows_by_table_name.values())
+    report("adjust_relationships", num_merged_rows, seconds, peak)
+    for merged_rows in merged_tables:
+        merged_rows.close()
+
+    # insert_rows: the merged rows into an empty database
+    insert_db = db_helpers.get_reflected_db(f"sqlite:///{insert_path}", False)
+    db_helpers.create_tables(db, insert_db, ["users", "orders"])
+
+    def insert_merged_rows() -> None:
+        for table_name in ("users", "orders"):
+            db_helpers.insert_rows(
+                insert_db,
+                db_helpers.get_table(db, table_name),
+                rows_by_table_name[table_name],
+                settings.batch_size,
+                settings.multi_values_insert,
+            )
+
+    _, seconds, peak = measure(insert_merged_rows, args.memory)
+    report("insert_rows", num_merged_rows, seconds, peak)
+    for db_data in (db, db2, insert_db):
+        db_data.session.close()
+
+    # merge: all databases into the target (end to end)
+    input_data = Input(
+        db_urls=database_urls,
+        target_db_url=f"sqlite:///{target_path}",
+        strategy=strategies.SourceMergeStrategy(),
+        **settings_dict,
+    )
+    target, seconds, peak = measure(lambda: merge(input_data), args.memory)
+    target.session.close()
+    report("merge", len(database_urls) * rows_per_database, seconds, peak)
+    return results
+
+
+def parse_args(cli_args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=10000, help="users per database")
+    parser.add_argument("--databases", type=int, default=2, help="number of input databases")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.5)
+    parser.add_argument("--orders-per-user", type=int, default=3, help="foreign key fan-out")
+    parser.add_argument("--self-reference-ratio", type=float, default=0.1)
+    parser.add_argument(
+        "--directory",
+        default=tempfile.gettempdir(),
+        help="where the databases are created",
+    )
+    parser.add_argument("--json", help="path of a JSON file for the results")
+    parser.add_argument(
+        "--setting",
+        action="append",
+        default=[],
+        help="merge setting as key=value (YAML value), e.g. --setting=merge_mode=n_way",
+    )
+    parser.add_argument("--no-memory", dest="memory", action="store_false")
+    return parser.parse_args(cli_args)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    results = run_benchmarks(args)
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
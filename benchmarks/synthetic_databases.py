@@ -0,0 +1,97 @@
+"""Generates SQLite databases with a synthetic schema for the benchmarks.
+
+Schema:
+- users (id, name, email, referrer_id -> users.id): self references may form cycles
+- orders (id, total, user_id -> users.id)
+
+Each database gets 'num_users' users. 'duplicate_ratio' of them are drawn from a pool
+shared by all databases (equal values -> merged), the others only exist in one database.
+Every user has 'orders_per_user' orders (the foreign key fan-out)
+and 'self_reference_ratio' of the users refer to another user of the same database.
+"""
+import os
+import random
+from typing import List
+
+from sqlalchemy import create_engine, Column, ForeignKey, Integer, MetaData, String, Table
+
+import db_helpers
+
+
+def create_schema(metadata: MetaData) -> None:
+    Table(
+        "users",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String),
+        Column("email", String),
+        Column("referrer_id", Integer, ForeignKey("users.id")),
+    )
+    Table(
+        "orders",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        # Using string instead of numeric to avoid sqlalchemy's warning.
+        Column("total", String),
+        Column("user_id", Integer, ForeignKey("users.id")),
+    )
+
+
+def generate_databases(
+    directory: str,
+    num_databases: int = 2,
+    num_users: int = 10000,
+    duplicate_ratio: float = 0.5,
+    orders_per_user: int = 3,
+    self_reference_ratio: float = 0.1,
+    seed: int = 0,
+) -> List[str]:
+    """Creates the databases 'benchmark_<i>.db' in 'directory' (replacing existing ones).
+    Returns their URLs.
+    """
+    rng = random.Random(seed)
+    num_shared_users = int(num_users * duplicate_ratio)
+    shared_users = [
+        (f"shared user {i}", f"shared{i}@example.com")
+        for i in range(num_shared_users)
+    ]
+    database_urls = []
+    for database_index in range(num_databases):
+        path = os.path.join(directory, f"benchmark_{database_index}.db")
+        if os.path.exists(path):
+            os.remove(path)
+        database_url = f"sqlite:///{path}"
+        metadata = MetaData()
+        create_schema(metadata)
+        metadata.create_all(bind=create_engine(database_url))
+        db = db_helpers.get_reflected_db(database_url)
+
+        user_values = rng.sample(shared_users, num_shared_users) + [
+            (f"user {i} of db {database_index}", f"user{i}.{database_index}@example.com")
+            for i in range(num_users - num_shared_users)
+        ]
+        users = []
+        for user_id, (name, email) in enumerate(user_values, start=1):
+            referrer_id = (
+                rng.randint(1, num_users)
+                if rng.random() < self_reference_ratio
+                else None
+            )
+            users.append((user_id, name, email, referrer_id))
+        db_helpers.insert_rows(db, db_helpers.get_table(db, "users"), users)
+
+        # The orders of shared users are shared as well. The foreign keys are not hashed
+        # so the totals must be unique within a database (like the users).
+        orders = (
+            (
+                (user_id - 1) * orders_per_user + i + 1,
+                f"{email} {i}",
+                user_id,
+            )
+            for user_id, (_, email) in enumerate(user_values, start=1)
+            for i in range(orders_per_user)
+        )
+        db_helpers.insert_rows(db, db_helpers.get_table(db, "orders"), orders)
+        db.session.close()
+        database_urls.append(database_url)
+    return database_urls
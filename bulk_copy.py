@@ -0,0 +1,78 @@
+"""Copying whole tables with the databases' native bulk mechanisms
+instead of reading the rows into Python (see 'db_helpers.copy_table'):
+- SQLite: the source file is attached and the rows are copied with INSERT ... SELECT.
+- MySQL: INSERT ... SELECT across databases (schemas) on the same server.
+- PostgreSQL: COPY ... TO STDOUT from the source and COPY ... FROM STDIN into the target
+  (through a temporary file, so the databases may be on different servers).
+"""
+import tempfile
+
+from sqlalchemy import Table, select
+from sqlalchemy.engine.url import URL
+
+import db_helpers
+from DbData import DbData
+import sql_merge
+
+
+# size of the COPY data kept in memory before it is written to the temporary file
+COPY_BUFFER_SIZE = 64 * 1024 * 1024
+
+
+def supports_native_copy(source_url: URL, target_url: URL) -> bool:
+    if sql_merge.supports_sql_merge(source_url, target_url):
+        return True
+    return all(
+        url.get_backend_name() == "postgresql" and url.get_driver_name() == "psycopg2"
+        for url in (source_url, target_url)
+    )
+
+
+def copy_table_natively(source: DbData, target: DbData, table_name: str) -> None:
+    """Like 'db_helpers.copy_table' but the rows do not pass through Python objects.
+    Check 'supports_native_copy' before.
+    """
+    table = db_helpers.create_copied_table(source, target, table_name)
+    if target.engine.dialect.name == "postgresql":
+        _copy_with_postgresql_copy(source, target, table)
+    else:
+        _insert_from_select(source, target, table)
+
+
+def _insert_from_select(source: DbData, target: DbData, table: Table) -> None:
+    connection = target.engine.connect()
+    try:
+        source_schema = sql_merge.attach_source(connection, source)
+        try:
+            source_table = sql_merge.get_source_table(table, source_schema)
+            with connection.begin():
+                connection.execute(table.insert().from_select(
+                    [column.name for column in table.columns],
+                    select(list(source_table.columns)),
+                ))
+        finally:
+            sql_merge.detach_source(connection)
+    finally:
+        connection.close()
+
+
+def _copy_with_postgresql_copy(source: DbData, target: DbData, table: Table) -> None:
+    quote = target.engine.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(column.name) for column in table.columns)
+    source_connection = source.engine.raw_connection()
+    target_connection = target.engine.raw_connection()
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=COPY_BUFFER_SIZE) as data:
+            source_connection.cursor().copy_expert(
+                f"COPY {quote(table.name)} ({columns}) TO STDOUT WITH (FORMAT binary)",
+                data,
+            )
+            data.seek(0)
+            target_connection.cursor().copy_expert(
+                f"COPY {quote(table.name)} ({columns}) FROM STDIN WITH (FORMAT binary)",
+                data,
+            )
+        target_connection.commit()
+    finally:
+        source_connection.close()
+        target_connection.close()
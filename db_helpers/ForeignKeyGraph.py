@@ -0,0 +1,53 @@
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import Column, MetaData, Table
+
+
+class ForeignKeyGraph():
+    """Dependency graph of the foreign keys of a reflected database.
+    For each table it knows which tables reference it (reverse adjacency)
+    together with the referencing columns and their indices within the referencing table.
+    Only foreign keys pointing to primary key columns are regarded.
+
+    The graph is built once per reflection (see 'db_helpers.get_foreign_key_graph').
+    """
+
+    def __init__(self, metadata: MetaData) -> None:
+        # The sorting will place Table objects that have dependencies first,
+        # before the dependencies themselves.
+        self.sorted_tables: List[Table] = list(metadata.sorted_tables)
+        # mapping: referenced table name -> [(referencing table, columns, column indices)]
+        self._referencing: Dict[str, List[Tuple[Table, List[Column], List[int]]]] = {
+            table.name: []
+            for table in self.sorted_tables
+        }
+        # mapping: referencing table name -> names of the tables it references (without itself)
+        self._referenced: Dict[str, Set[str]] = {
+            table.name: set()
+            for table in self.sorted_tables
+        }
+        for candidate in self.sorted_tables:
+            # mapping: referenced table name -> ([columns], [column indices])
+            references: Dict[str, Tuple[List[Column], List[int]]] = {}
+            for i, column in enumerate(candidate.columns):
+                for fk in column.foreign_keys:
+                    if not fk.column.primary_key:
+                        continue
+                    columns, indices = references.setdefault(fk.column.table.name, ([], []))
+                    columns.append(column)
+                    indices.append(i)
+            self._referenced[candidate.name] = set(references) - {candidate.name}
+            for referenced_table_name, (columns, indices) in references.items():
+                self._referencing.setdefault(referenced_table_name, []).append(
+                    (candidate, columns, indices)
+                )
+
+    def referencing(self, table_name: str) -> List[Tuple[Table, List[Column], List[int]]]:
+        """Returns the tables referencing 'table_name' (including the table itself
+        in case of self references), the referencing columns and their indices."""
+        return self._referencing.get(table_name, [])
+
+    def dependencies(self, table_name: str) -> Set[str]:
+        """Returns the names of the tables 'table_name' references (ignoring self references).
+        Their rows must exist before rows of 'table_name' can be inserted."""
+        return self._referenced.get(table_name, set())
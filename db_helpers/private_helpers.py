@@ -1,5 +1,7 @@
+from itertools import islice
 import logging
 import re
+from typing import Iterable, Iterator
 
 from sqlalchemy import Column
 
@@ -26,3 +28,15 @@ def column_types_equal(col_type1, col_type2):
     str_type1 = regex.sub("COLLATE", str_type1)
     str_type2 = regex.sub("COLLATE", str_type2)
     return str_type1 == str_type2
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Splits 'iterable' into lists of at most 'size' items without materializing it."""
+    if size < 1:
+        raise ValueError(f"Batch size must be at least 1 (got {size}).")
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if len(batch) == 0:
+            return
+        yield batch
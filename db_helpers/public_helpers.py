@@ -1,22 +1,44 @@
 import logging
-from typing import Iterable, List, Tuple
+import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from sqlalchemy import MetaData, Table, Column
-from sqlalchemy import create_engine
+from sqlalchemy import bindparam, create_engine, func, select
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import ArgumentError
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 from sqlalchemy.ext.automap import automap_base
 
 from DbData import DbData
-from .private_helpers import columns_equal
+from .private_helpers import batched, columns_equal
+from .ForeignKeyGraph import ForeignKeyGraph
+
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PAGE_SIZE = 10000
+# Most restrictive bound parameter limit of the supported dialects (older SQLite versions).
+MAX_PARAMETERS_PER_STATEMENT = 999
+
+# mapping: (process ID, database URL, pool size, pre-ping) -> shared engine
+_engines: Dict[tuple, Engine] = {}
+_engines_lock = threading.Lock()
 
 
 # @returns [tuple] The reflected base and the session
 # (everything necessary for querying the database).
-def get_reflected_db(database_url: str, prepare_base=True) -> DbData:
+def get_reflected_db(
+    database_url: str,
+    prepare_base=True,
+    pool_size: Optional[int] = None,
+    pool_pre_ping: bool = False,
+) -> DbData:
     Base = automap_base()
     try:
-        engine = create_engine(database_url)
+        engine = get_engine(database_url, pool_size, pool_pre_ping)
     except ArgumentError as e:
         raise ValueError(f"Invalid database url '{database_url}'") from e
     session = Session(engine)
@@ -33,30 +55,268 @@ def get_reflected_db(database_url: str, prepare_base=True) -> DbData:
     return DbData(Base, session, engine)
 
 
-def rereflect(db: DbData) -> None:
-    db.base.prepare(db.engine, reflect=True)
+def get_engine(
+    database_url: str,
+    pool_size: Optional[int] = None,
+    pool_pre_ping: bool = False,
+) -> Engine:
+    """Returns the engine of the URL, shared by all callers (and threads) asking for the same
+    pool options so its connection pool is reused instead of connecting again.
+    'pool_size' is ignored for SQLite, which does not pool file connections.
+    Every process gets its own engines because pooled connections cannot be shared with
+    forked processes. In-memory SQLite databases are never shared (each is a new database).
+    """
+    url = make_url(database_url)
+    options: dict = {"pool_pre_ping": pool_pre_ping}
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return create_engine(url, **options)
+    elif pool_size is not None:
+        options["pool_size"] = pool_size
+    key = (os.getpid(), str(url), pool_size, pool_pre_ping)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(url, **options)
+        return _engines[key]
+
+
+def dispose_engines() -> None:
+    """Closes the pooled connections of the shared engines (of this process)."""
+    with _engines_lock:
+        for (pid, *_), engine in _engines.items():
+            if pid == os.getpid():
+                engine.dispose()
+
+
+def rereflect(db: DbData, table_names: Optional[Set[str]] = None) -> None:
+    """Reflects the given tables (or all tables) again.
+    Tables that do not exist (anymore) are removed from the metadata.
+    """
+    if table_names is None:
+        db.base.prepare(db.engine, reflect=True)
+        db.changed_table_names.clear()
+        db.invalidate()
+        return
+
+    table_names = set(table_names)
+    db.invalidate()
+    existing_table_names = set(db.inspector.get_table_names())
+    metadata = db.base.metadata
+    for table_name in sorted(table_names - existing_table_names):
+        if table_name in metadata.tables:
+            metadata.remove(metadata.tables[table_name])
+    tables_to_reflect = sorted(table_names & existing_table_names)
+    if len(tables_to_reflect) > 0:
+        # Same options as 'prepare(reflect=True)': keep existing columns because mapped classes
+        # (and their relationships) refer to them.
+        metadata.reflect(
+            db.engine,
+            only=tables_to_reflect,
+            extend_existing=True,
+            autoload_replace=False,
+        )
+        # map classes for the newly reflected tables
+        db.base.prepare()
+    db.changed_table_names.difference_update(table_names)
+    db.invalidate()
+
+
+def reflect_changed_tables(db: DbData) -> None:
+    """Reflects only the tables marked as changed (see 'DbData.mark_changed')."""
+    if len(db.changed_table_names) > 0:
+        rereflect(db, db.changed_table_names)
+
+
+def get_db_identity(db: DbData) -> list:
+    """Identifies the database of 'db' without its credentials."""
+    url = db.engine.url
+    return [url.drivername, url.host, url.port, url.database]
+
+
+def get_foreign_key_graph(db: DbData) -> ForeignKeyGraph:
+    """Returns the foreign key graph of 'db'. It is cached until the next 'rereflect'."""
+    if db.foreign_key_graph is None:
+        db.foreign_key_graph = ForeignKeyGraph(db.base.metadata)
+    return db.foreign_key_graph
 
 
 def get_table(db: DbData, table_name: str) -> Table:
     return db.base.metadata.tables[table_name]
 
 
+def count_rows(db: DbData, table: Table) -> int:
+    return db.session.execute(select([func.count()]).select_from(table)).scalar()
+
+
 def truncate_table(db: DbData, table_name: str) -> None:
     # DROP FROM ...
     db.session.execute(get_table(db, table_name).delete())
     db.session.commit()
 
 
-def insert_rows(target: DbData, table: Table, rows: Iterable[tuple]) -> None:
+def insert_rows(
+    target: DbData,
+    table: Table,
+    rows: Iterable[tuple],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    multi_values: bool = False,
+) -> int:
     """'table' argument cannot be the table name as in the other functions
-    because there might be no table object with the wanted name in 'target' yet."""
-    for row in rows:
-        target.session.execute(table.insert(row))
+    because there might be no table object with the wanted name in 'target' yet.
+
+    Rows are sent in batches of 'batch_size' rows using executemany.
+    With 'multi_values' each batch becomes a single INSERT with multiple VALUES clauses
+    (if the dialect supports it) which saves the per-row overhead of some DBAPIs.
+    Returns the number of inserted rows.
+    """
+    column_keys = [column.key for column in table.columns]
+    use_multi_values = (
+        multi_values
+        and target.engine.dialect.supports_multivalues_insert
+        and len(column_keys) > 0
+    )
+    # Keep multi-VALUES statements below the dialect's bound parameter limit.
+    rows_per_statement = max(1, MAX_PARAMETERS_PER_STATEMENT // max(1, len(column_keys)))
+    num_rows = 0
+    for batch in batched(rows, batch_size):
+        params = [dict(zip(column_keys, row)) for row in batch]
+        if use_multi_values:
+            for statement_params in batched(params, rows_per_statement):
+                target.session.execute(table.insert().values(statement_params))
+        else:
+            target.session.execute(table.insert(), params)
+        num_rows += len(batch)
+    target.session.commit()
+    return num_rows
+
+
+def update_rows(
+    target: DbData,
+    table: Table,
+    rows: Iterable[tuple],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> None:
+    """Updates the rows with the primary keys of the given rows (in the 1st column)."""
+    columns = list(table.columns)
+    primary_key = columns[0]
+    statement = (
+        table.update()
+        .where(primary_key == bindparam("_primary_key"))
+        .values({column.key: bindparam(f"_{column.key}") for column in columns[1:]})
+    )
+    for batch in batched(rows, batch_size):
+        target.session.execute(statement, [
+            dict(
+                _primary_key=row[0],
+                **{f"_{column.key}": value for column, value in zip(columns[1:], row[1:])}
+            )
+            for row in batch
+        ])
     target.session.commit()
 
 
+def delete_rows(
+    target: DbData,
+    table: Table,
+    primary_keys: Iterable,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> None:
+    """Deletes the rows with the given primary keys (in the 1st column)."""
+    primary_key = list(table.columns)[0]
+    for batch in batched(primary_keys, min(batch_size, MAX_PARAMETERS_PER_STATEMENT)):
+        target.session.execute(table.delete().where(primary_key.in_(batch)))
+    target.session.commit()
+
+
+def upsert_rows(
+    target: DbData,
+    table: Table,
+    rows: Iterable[tuple],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    existing_primary_keys: Optional[Set] = None,
+) -> None:
+    """Inserts the rows or updates the existing rows with the same primary key (in the 1st column).
+    PostgreSQL and MySQL use their native upsert statements.
+    Other dialects update the rows whose primary keys are in 'existing_primary_keys'
+    (queried for each batch if not given) and insert the others.
+    """
+    columns = list(table.columns)
+    statement = _native_upsert_statement(target, table)
+    for batch in batched(rows, batch_size):
+        if statement is not None:
+            target.session.execute(statement, [
+                dict(zip([column.key for column in columns], row))
+                for row in batch
+            ])
+            continue
+        if existing_primary_keys is None:
+            primary_key = columns[0]
+            existing_batch_primary_keys = set(
+                existing_primary_key
+                for existing_primary_key, in target.session.execute(
+                    select([primary_key]).where(primary_key.in_([row[0] for row in batch]))
+                )
+            )
+        else:
+            existing_batch_primary_keys = existing_primary_keys
+        update_rows(target, table, [row for row in batch if row[0] in existing_batch_primary_keys])
+        insert_rows(target, table, [
+            row for row in batch if row[0] not in existing_batch_primary_keys
+        ])
+    target.session.commit()
+
+
+def _native_upsert_statement(target: DbData, table: Table):
+    columns = list(table.columns)
+    if len(columns) < 2:
+        return None
+    dialect_name = target.engine.dialect.name
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[columns[0]],
+            set_={column.name: statement.excluded[column.name] for column in columns[1:]},
+        )
+    if dialect_name == "mysql":
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update({
+            column.name: statement.inserted[column.name] for column in columns[1:]
+        })
+    return None
+
+
 def get_rows(db: DbData, table_name: str) -> Iterable[tuple]:
-    return db.session.query(db.base.metadata.tables[table_name]).all()
+    return list(iter_rows(db, get_table(db, table_name)))
+
+
+def iter_row_pages(
+    db: DbData,
+    table: Table,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    query: Optional[Select] = None,
+) -> Iterator[List[tuple]]:
+    """Reads 'table' (or the rows selected by 'query') in pages of at most 'page_size' rows.
+    A server-side cursor is requested (for dialects that have one)
+    so the table is never loaded into memory as a whole.
+    """
+    if query is None:
+        query = table.select()
+    result = db.session.execute(
+        query.execution_options(stream_results=True)
+    )
+    try:
+        while True:
+            page = result.fetchmany(page_size)
+            if len(page) == 0:
+                return
+            yield page
+    finally:
+        result.close()
+
+
+def iter_rows(db: DbData, table: Table, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[tuple]:
+    for page in iter_row_pages(db, table, page_size):
+        yield from page
 
 
 def table_structures_equal(source_table: Table, target_table: Table):
@@ -91,36 +351,58 @@ def table_structures_equal(source_table: Table, target_table: Table):
     return num_matching_cols == len(source_table.columns)
 
 
-def copy_table(source: DbData, target: DbData, table_name: str) -> None:
+def copy_table(
+    source: DbData,
+    target: DbData,
+    table_name: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    multi_values: bool = False,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> None:
     # from http://www.tylerlesmann.com/2009/apr/27/copying-databases-across-platforms-sqlalchemy/
-    source_meta = MetaData(bind=source.engine)
-    table = Table(table_name, source_meta, autoload=True)
-    table.metadata.create_all(bind=target.engine)
+    table = create_copied_table(source, target, table_name)
+    rows = iter_rows(source, get_table(source, table_name), page_size)
+    insert_rows(target, table, rows, batch_size, multi_values)
 
-    query = source.session.query(get_table(source, table_name))
-    insert_rows(target, table, query.all())
 
+def create_copied_table(source: DbData, target: DbData, table_name: str) -> Table:
+    """Creates the table of 'source' in 'target' (unless it exists already)
+    together with the tables it references (directly or indirectly).
+    The tables are copied from the source's reflected metadata (not reflected again).
+    Returns the table (which can be used for both databases).
+    """
+    metadata = MetaData()
+    pending_tables = [get_table(source, table_name)]
+    while len(pending_tables) > 0:
+        table = pending_tables.pop()
+        if table.name in metadata.tables:
+            continue
+        table.tometadata(metadata)
+        pending_tables.extend(
+            foreign_key.column.table
+            for foreign_key in table.foreign_keys
+        )
+    metadata.create_all(bind=target.engine)
+    target.mark_changed(*metadata.tables.keys())
+    return metadata.tables[table_name]
 
-def find_referencing_tables_and_columns(db: DbData, table_name: str) -> List[Tuple[Table, List[Column]]]:
-    table = get_table(db, table_name)
-    primary_keys = list(table.primary_key.columns)
-    sorted_tables = db.base.metadata.sorted_tables
-    start_index = sorted_tables.index(table) + 1
-    # list of tables that might have a reference to 'table'
-    candidates = sorted_tables[start_index:]
-    referencing_tables_and_columns = []
-    for candidate in candidates:
-        referencing_columns = [
-            tuple(fk.constraint.columns)[0]
-            for i, fk in enumerate(candidate.foreign_keys)
-            if fk.column in primary_keys
-        ]
-        if len(referencing_columns) > 0:
-            referencing_tables_and_columns.append(
-                (candidate, referencing_columns)
-            )
 
-    print("referencing_tables_and_columns for ", table_name, ":", referencing_tables_and_columns)
-    # fk_set = table.columns[some].foreign_keys
-    # fk.column == referenced column instance (of referenced table)
+def create_tables(source: DbData, target: DbData, table_names: Iterable[str]) -> None:
+    """Creates the given tables of 'source' in 'target' (unless they exist already)."""
+    tables = [get_table(source, table_name) for table_name in table_names]
+    if len(tables) == 0:
+        return
+    source.base.metadata.create_all(bind=target.engine, tables=tables)
+    target.mark_changed(*(table.name for table in tables))
+
+
+def find_referencing_tables_and_columns(db: DbData, table_name: str) -> List[Tuple[Table, List[Column]]]:
+    graph = get_foreign_key_graph(db)
+    referencing_tables_and_columns = [
+        (referencing_table, referencing_columns)
+        for referencing_table, referencing_columns, _ in graph.referencing(table_name)
+    ]
+    logging.debug(
+        f"referencing_tables_and_columns for {table_name}: {referencing_tables_and_columns}"
+    )
     return referencing_tables_and_columns
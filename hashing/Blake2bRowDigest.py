@@ -0,0 +1,52 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from hashlib import blake2b
+import struct
+
+from .RowDigest import RowDigest
+
+
+class Blake2bRowDigest(RowDigest):
+    """Hashes a canonical byte encoding of the values with BLAKE2b.
+    The digests are stable across processes and runs
+    so they can be persisted or shared between workers.
+    """
+
+    def __init__(self, digest_size: int = 16) -> None:
+        self.digest_size = digest_size
+
+    def digest(self, values: tuple) -> int:
+        hasher = blake2b(digest_size=self.digest_size)
+        for value in values:
+            tag, payload = encode_value(value)
+            # The length prefix makes the encoding of a tuple unambiguous.
+            hasher.update(struct.pack(">cQ", tag, len(payload)))
+            hasher.update(payload)
+        return int.from_bytes(hasher.digest(), "big")
+
+
+def encode_value(value) -> tuple:
+    """Returns a type tag and the canonical bytes of 'value'.
+    Values of different types never share an encoding, e.g. 1, '1' and True.
+    """
+    if value is None:
+        return b"N", b""
+    # bool is a subclass of int
+    if isinstance(value, bool):
+        return b"T", b"1" if value else b"0"
+    if isinstance(value, int):
+        return b"I", str(value).encode()
+    if isinstance(value, float):
+        return b"F", repr(value).encode()
+    if isinstance(value, Decimal):
+        return b"M", str(value).encode()
+    if isinstance(value, str):
+        return b"S", value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return b"B", bytes(value)
+    # datetime is a subclass of date
+    if isinstance(value, (datetime, date, time)):
+        return b"D", value.isoformat().encode()
+    if isinstance(value, timedelta):
+        return b"d", repr(value.total_seconds()).encode()
+    return b"R", f"{type(value).__qualname__}:{value!r}".encode("utf-8")
@@ -0,0 +1,11 @@
+from .RowDigest import RowDigest
+
+
+class BuiltinRowDigest(RowDigest):
+    """Uses Python's 'hash'.
+    Fast but strings are hashed with a per-process salt
+    so the digests cannot be persisted or compared across processes.
+    """
+
+    def digest(self, values: tuple) -> int:
+        return hash(values)
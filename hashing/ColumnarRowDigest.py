@@ -0,0 +1,157 @@
+from hashlib import blake2b
+import struct
+from typing import Any, Iterable, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+from .Blake2bRowDigest import encode_value
+from .RowDigest import RowDigest
+
+
+MASK_64 = 2**64 - 1
+# initial digest of a row
+ROW_OFFSET = 0xcbf29ce484222325
+# base of the polynomial hashing of the code points of strings
+STRING_BASE = 0x100000001b3
+# multiplier combining the digests of the columns of a row
+ROW_PRIME = 0x9e3779b97f4a7c15
+# type tags mixed into the digests of the values
+TAG_NONE = 0x6e6f6e65
+TAG_INT = 0x696e74
+TAG_FLOAT = 0x666c6f6174
+TAG_STR = 0x737472
+TAG_OTHER = 0x6f74686572
+# Longer strings are hashed one by one with BLAKE2b
+# (the vectorized hashing works on fixed width arrays of the longest string).
+MAX_VECTORIZED_STRING_LENGTH = 256
+# the vectorized types and the values of their None replacements
+VECTORIZED_TYPES = {int: 0, float: 0.0, str: ""}
+# STRING_BASE ** (i + 1) for the i-th code point of a string
+STRING_POWERS = [pow(STRING_BASE, i + 1, 2**64) for i in range(MAX_VECTORIZED_STRING_LENGTH)]
+
+
+class ColumnarRowDigest(RowDigest):
+    """Hashes whole pages column by column with NumPy (an optional dependency).
+    Integers, floats and strings (that are not too long) are hashed in a vectorized way.
+    Other values, e.g. columns mixing types, are hashed one by one
+    to the same 64 bit values, so a row's digest does not depend on the other rows of its page.
+    The digests are stable across processes and runs.
+    """
+
+    def __init__(self) -> None:
+        if np is None:
+            raise ImportError("The 'columnar' row digest requires NumPy (pip install numpy).")
+
+    def digest(self, values: tuple) -> int:
+        return self.digest_rows([values])[0]
+
+    def digest_rows(self, rows_values: Iterable[tuple]) -> List[int]:
+        rows_values = list(rows_values)
+        num_rows = len(rows_values)
+        if num_rows == 0:
+            return []
+        digests = np.full(num_rows, ROW_OFFSET, dtype=np.uint64)
+        for column in _get_columns(rows_values):
+            digests = _mix(digests * np.uint64(ROW_PRIME) ^ _hash_column(column))
+        return digests.tolist()
+
+
+def _get_columns(rows_values: List[tuple]) -> Iterable["np.ndarray"]:
+    """Returns the columns of the rows as object arrays."""
+    num_columns = len(rows_values[0])
+    # much faster than transposing with zip (which creates a tuple per column)
+    table = np.array(rows_values, dtype=object)
+    if table.shape == (len(rows_values), num_columns):
+        return table.T
+    # Values that are sequences (e.g. arrays) add dimensions.
+    columns = []
+    for column in zip(*rows_values):
+        array = np.empty(len(column), dtype=object)
+        array[:] = column
+        columns.append(array)
+    return columns
+
+
+def _hash_column(column: "np.ndarray") -> "np.ndarray":
+    types = set(map(type, column))
+    none_mask = None
+    if type(None) in types:
+        types.discard(type(None))
+        none_mask = np.equal(column, None)
+    hashes = None
+    if len(types) == 1:
+        column_type = types.pop()
+        if column_type in VECTORIZED_TYPES:
+            values = column
+            if none_mask is not None:
+                values = column.copy()
+                values[none_mask] = VECTORIZED_TYPES[column_type]
+            hashes = _hash_vectorized(values, column_type)
+    if hashes is None:
+        return _mix(np.fromiter(
+            (_pre_hash(value) for value in column),
+            dtype=np.uint64,
+            count=len(column),
+        ))
+    if none_mask is not None:
+        hashes[none_mask] = np.uint64(TAG_NONE)
+    return _mix(hashes)
+
+
+def _hash_vectorized(column: "np.ndarray", column_type: type) -> Optional["np.ndarray"]:
+    """Returns the pre-hashes (see '_pre_hash') of the values (all of 'column_type')
+    or None if they cannot be computed in a vectorized way."""
+    if column_type is int:
+        try:
+            values = column.astype(np.int64)
+        except OverflowError:
+            return None
+        return values.view(np.uint64) ^ np.uint64(TAG_INT)
+    if column_type is float:
+        return column.astype(np.float64).view(np.uint64) ^ np.uint64(TAG_FLOAT)
+    # NumPy's strings drop trailing NUL characters (like '_pre_hash').
+    strings = column.astype(np.str_)
+    lengths = np.char.str_len(strings)
+    if lengths.max() > MAX_VECTORIZED_STRING_LENGTH:
+        return None
+    width = strings.dtype.itemsize // 4
+    code_points = strings.view(np.uint32).reshape(len(column), width).astype(np.uint64)
+    # Shorter strings are padded with zeros which do not change the sum.
+    hashes = code_points @ np.array(STRING_POWERS[:width], dtype=np.uint64)
+    return _mix(hashes ^ lengths.astype(np.uint64)) ^ np.uint64(TAG_STR)
+
+
+def _pre_hash(value: Any) -> int:
+    """Returns the 64 bit value of 'value' that is mixed into the row's digest.
+    Equal to the results of the vectorized hashing of '_hash_vectorized'."""
+    if value is None:
+        return TAG_NONE
+    # bool is a subclass of int
+    if isinstance(value, int) and not isinstance(value, bool) and -2**63 <= value < 2**63:
+        return (value & MASK_64) ^ TAG_INT
+    if isinstance(value, float):
+        return struct.unpack("<Q", struct.pack("<d", value))[0] ^ TAG_FLOAT
+    if isinstance(value, str) and len(value.rstrip("\0")) <= MAX_VECTORIZED_STRING_LENGTH:
+        return _hash_string(value.rstrip("\0")) ^ TAG_STR
+    tag, payload = encode_value(value)
+    hasher = blake2b(tag + payload, digest_size=8)
+    return int.from_bytes(hasher.digest(), "big") ^ TAG_OTHER
+
+
+def _hash_string(value: str) -> int:
+    """Sum of the code points times the powers of STRING_BASE, mixed with the length."""
+    result = sum(ord(character) * power for character, power in zip(value, STRING_POWERS))
+    mixed = _mix(np.array([(result & MASK_64) ^ len(value)], dtype=np.uint64))
+    return int(mixed[0])
+
+
+def _mix(values: "np.ndarray") -> "np.ndarray":
+    """splitmix64's finalizer: spreads every input bit over all output bits."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
@@ -0,0 +1,25 @@
+from operator import itemgetter
+from typing import Sequence
+
+
+class HashingPlan():
+    """Extracts the values of a row that are regarded when hashing it.
+    The regarded column indices are computed once per table
+    so getting the values of a row is a single itemgetter call.
+    """
+
+    def __init__(self, indices: Sequence[int]) -> None:
+        self.indices = tuple(indices)
+        self._num_indices = len(self.indices)
+        self._getter = itemgetter(*self.indices) if self._num_indices > 0 else None
+
+    def __call__(self, row) -> tuple:
+        if self._num_indices > 1:
+            return self._getter(row)
+        # itemgetter returns the bare value for a single index
+        if self._num_indices == 1:
+            return (self._getter(row), )
+        return ()
+
+    def __repr__(self) -> str:
+        return f"HashingPlan(indices={self.indices})"
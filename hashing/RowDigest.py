@@ -0,0 +1,16 @@
+from typing import Iterable, List
+
+
+class RowDigest():
+    """Computes the integer digest of the regarded values of a row.
+    Rows with equal digests are considered to be duplicates
+    (after verifying their values, see RowsDict).
+    """
+
+    def digest(self, values: tuple) -> int:
+        raise NotImplementedError("Must implement 'digest'")
+
+    def digest_rows(self, rows_values: Iterable[tuple]) -> List[int]:
+        """Digests the values of many rows at once (e.g. of a page).
+        The results must be equal to the ones of 'digest'."""
+        return list(map(self.digest, rows_values))
@@ -0,0 +1,58 @@
+from typing import Iterable, List
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import Table
+
+from .HashingPlan import HashingPlan
+from .RowDigest import RowDigest
+from .BuiltinRowDigest import BuiltinRowDigest
+from .Blake2bRowDigest import Blake2bRowDigest
+from .ColumnarRowDigest import ColumnarRowDigest
+
+
+DEFAULT_ROW_DIGEST = Blake2bRowDigest()
+
+
+# mapping: table -> plan (dropped together with the table's metadata)
+_hashing_plans: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def get_indices_for_hashing(table: Table) -> List[int]:
+    return [
+        i for i, column in enumerate(table.columns)
+        if column.primary_key is False and len(column.foreign_keys) == 0
+    ]
+
+
+def get_hashing_plan(table: Table) -> HashingPlan:
+    """Returns the (cached) plan for hashing rows of 'table'.
+    ASSUMPTION: The table's columns do not change while the plan is in use.
+    """
+    plan = _hashing_plans.get(table)
+    if plan is None:
+        plan = HashingPlan(get_indices_for_hashing(table))
+        _hashing_plans[table] = plan
+    return plan
+
+
+def row_digest_for_name(name: str, **kwargs) -> RowDigest:
+    row_digest_by_name = {
+        "blake2b": Blake2bRowDigest,
+        "builtin": BuiltinRowDigest,
+        "columnar": ColumnarRowDigest,
+    }
+    if name not in row_digest_by_name:
+        raise ValueError(
+            f"Unknown row digest '{name}'. "
+            f"Available: {', '.join(sorted(row_digest_by_name))}"
+        )
+    return row_digest_by_name[name](**kwargs)
+
+
+def hash_rows(
+    table: Table,
+    rows: Iterable[tuple],
+    row_digest: RowDigest = DEFAULT_ROW_DIGEST,
+) -> List[int]:
+    """Hashes a whole page of rows at once."""
+    return row_digest.digest_rows(map(get_hashing_plan(table), rows))
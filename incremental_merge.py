@@ -0,0 +1,200 @@
+"""Merging only the rows that are new (or changed) since the previous merge.
+
+The rows of each source table are read beyond the high-water marks stored in the MergeState
+(the greatest primary key and, if the table has the configured update timestamp column,
+the greatest timestamp). Each of these rows is
+- merged into an equal target row (same digest and values) if there is one,
+- updated in place if it has been merged before and is the only row merged into its target row,
+- inserted with a new primary key otherwise.
+Foreign keys are remapped with the primary key mapping remembered from the previous runs.
+Rows that have been merged before keep their target rows, so the target's primary keys are stable.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Table, func, or_, select
+
+import db_helpers
+from DbData import DbData
+import hashing
+from MergeSettings import MergeSettings
+from MergeState import MergeState
+
+
+def merge_new_rows(
+    source: DbData,
+    target: DbData,
+    table_name: str,
+    state: MergeState,
+    settings: MergeSettings,
+) -> None:
+    """Merges the rows of the source table that are new or changed since the last merge.
+    Tables referenced by the table must have been merged before.
+    ASSUMPTION: IDs as primary keys in 1st column.
+    """
+    source_key = json.dumps(db_helpers.get_db_identity(source))
+    table = db_helpers.get_table(source, table_name)
+    target_table = db_helpers.get_table(target, table_name)
+    primary_key = list(table.columns)[0]
+    updated_at = None
+    if settings.updated_at_column is not None and settings.updated_at_column in table.columns:
+        updated_at = table.columns[settings.updated_at_column]
+    max_primary_key, max_updated_at = state.high_water_marks(source_key, table_name)
+    query = table.select().order_by(primary_key)
+    # Nothing has been read before -> read all rows.
+    if max_primary_key is not None:
+        conditions = [primary_key > max_primary_key]
+        if updated_at is not None and max_updated_at is not None:
+            conditions.append(updated_at > max_updated_at)
+        query = query.where(or_(*conditions))
+
+    row_digest = hashing.row_digest_for_name(settings.row_digest)
+    hashing_plan = hashing.get_hashing_plan(table)
+    foreign_keys = _get_foreign_keys(table)
+    target_primary_key = list(target_table.columns)[0]
+    next_primary_key = (
+        target.session.execute(select([func.max(target_primary_key)])).scalar() or 0
+    ) + 1
+    num_merged_rows = 0
+    for page in db_helpers.iter_row_pages(source, table, settings.page_size, query):
+        with settings.report.phase("hash", table_name, rows=len(page)):
+            digests = hashing.hash_rows(table, page, row_digest)
+        old_new_pk_by_old_pk = state.new_primary_keys(
+            source_key,
+            table_name,
+            [row[0] for row in page],
+        )
+        primary_keys_by_digest = state.primary_keys_by_digest(table_name, digests)
+        values_by_primary_key = _get_hashed_values(
+            target,
+            target_table,
+            [pk for pks in primary_keys_by_digest.values() for pk in pks],
+            hashing_plan,
+        )
+
+        new_pk_by_old_pk: Dict[Any, Any] = {}
+        inserted_rows: List[list] = []
+        updated_rows: List[list] = []
+        for row, digest in zip(page, digests):
+            values = hashing_plan(row)
+            equal_primary_key = next(
+                (
+                    pk for pk in primary_keys_by_digest.get(digest, [])
+                    if values_by_primary_key.get(pk) == values
+                ),
+                None,
+            )
+            old_new_pk = old_new_pk_by_old_pk.get(row[0])
+            if equal_primary_key is not None:
+                new_pk_by_old_pk[row[0]] = equal_primary_key
+                continue
+            if (
+                old_new_pk is not None
+                and state.count_represented_rows(table_name, old_new_pk) == 1
+            ):
+                # The changed row is the only one merged into its target row.
+                new_pk = old_new_pk
+                updated_rows.append([new_pk] + list(row[1:]))
+            else:
+                new_pk = next_primary_key
+                next_primary_key += 1
+                inserted_rows.append([new_pk] + list(row[1:]))
+            new_pk_by_old_pk[row[0]] = new_pk
+            state.set_digest(table_name, new_pk, digest)
+            primary_keys_by_digest.setdefault(digest, []).append(new_pk)
+            values_by_primary_key[new_pk] = values
+
+        _remap_foreign_keys(
+            inserted_rows + updated_rows,
+            foreign_keys,
+            state,
+            source_key,
+            table_name,
+            new_pk_by_old_pk,
+        )
+        settings.report.record(
+            "dedup",
+            table_name,
+            rows=len(page),
+            duplicates=len(page) - len(inserted_rows) - len(updated_rows),
+        )
+        with settings.report.phase(
+            "insert",
+            table_name,
+            rows=len(inserted_rows) + len(updated_rows),
+        ):
+            db_helpers.update_rows(target, target_table, updated_rows, settings.batch_size)
+            db_helpers.insert_rows(
+                target,
+                target_table,
+                inserted_rows,
+                settings.batch_size,
+                settings.multi_values_insert,
+            )
+        state.map_primary_keys(source_key, table_name, new_pk_by_old_pk)
+
+        max_primary_key = _max(max_primary_key, page[-1][0])
+        if updated_at is not None:
+            index = list(table.columns).index(updated_at)
+            max_updated_at = _max(max_updated_at, *(row[index] for row in page))
+        state.set_high_water_marks(source_key, table_name, max_primary_key, max_updated_at)
+        state.commit()
+        num_merged_rows += len(page)
+    print("merged", num_merged_rows, "new or changed rows of table", table_name)
+
+
+def _get_foreign_keys(table: Table) -> List[Tuple[int, str]]:
+    """Returns (column index, referenced table name) for the foreign keys
+    that reference primary keys."""
+    return [
+        (index, foreign_key.column.table.name)
+        for index, column in enumerate(table.columns)
+        for foreign_key in column.foreign_keys
+        if foreign_key.column.primary_key
+    ]
+
+
+def _get_hashed_values(
+    target: DbData,
+    target_table: Table,
+    primary_keys: List[Any],
+    hashing_plan: hashing.HashingPlan,
+) -> Dict[Any, tuple]:
+    """Returns the hashed values of the target rows with the given primary keys."""
+    primary_key = list(target_table.columns)[0]
+    values_by_primary_key: Dict[Any, tuple] = {}
+    for batch in db_helpers.batched(primary_keys, db_helpers.MAX_PARAMETERS_PER_STATEMENT):
+        for row in target.session.execute(target_table.select().where(primary_key.in_(batch))):
+            values_by_primary_key[row[0]] = hashing_plan(row)
+    return values_by_primary_key
+
+
+def _remap_foreign_keys(
+    rows: List[list],
+    foreign_keys: List[Tuple[int, str]],
+    state: MergeState,
+    source_key: str,
+    table_name: str,
+    new_pk_by_old_pk: Dict[Any, Any],
+) -> None:
+    for index, referenced_table_name in foreign_keys:
+        old_pks = set(row[index] for row in rows if row[index] is not None)
+        mapping = state.new_primary_keys(source_key, referenced_table_name, old_pks)
+        if referenced_table_name == table_name:
+            # rows referencing rows of the same page
+            mapping.update(new_pk_by_old_pk)
+        for row in rows:
+            fk = row[index]
+            if fk is None:
+                continue
+            try:
+                row[index] = mapping[fk]
+            except KeyError as e:
+                raise ValueError(
+                    f"Could not find a row with primary key {fk} in {referenced_table_name}."
+                ) from e
+
+
+def _max(*values: Optional[Any]) -> Optional[Any]:
+    values = [value for value in values if value is not None]
+    return max(values) if len(values) > 0 else None
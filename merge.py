@@ -1,39 +1,366 @@
+from collections import OrderedDict
 import logging
-from typing import Any, Dict, Iterable, List
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 # from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import inspect, Table
 from sqlalchemy_utils import database_exists, create_database
 
+import bulk_copy
+from Checkpoint import Checkpoint
 import db_helpers
-from strategies import RowsDict, SourceMergeStrategy
+import hashing
+import incremental_merge
+import near_duplicates
+from strategies import CompactRowsDict, RowsDict, SourceMergeStrategy, SpillingRowsDict
 from DbData import DbData
 from Input import Input
+from MergeReport import estimate_size, MergeReport
+from MergeSettings import MergeSettings
+from MergeState import MergeState
+from PrimaryKeyMap import PrimaryKeyMap
+import parallel
+import pipeline
+import sql_merge
 import value_generators
 
 
 def merge(input_data: Input) -> DbData:
-    merge_into_target_db(
-        db_helpers.get_reflected_db(input_data.target_db_url, False),
-        [
-            db_helpers.get_reflected_db(database_url)
+    settings = input_data.settings
+    with settings.report.phase("reflect"):
+        target_db = get_db(input_data.target_db_url, settings, False)
+        reflected_dbs = [
+            get_db(database_url, settings)
             for database_url in input_data.db_urls
         ]
+    return merge_into_target_db(target_db, reflected_dbs, settings)
+
+
+def get_db(database_url: str, settings: MergeSettings, prepare_base: bool = True) -> DbData:
+    """Returns the (reflected) database using the shared engine with the settings' pool options."""
+    return db_helpers.get_reflected_db(
+        database_url,
+        prepare_base,
+        settings.pool_size,
+        settings.pool_pre_ping,
     )
-    return db_helpers.get_reflected_db(input_data.target_db_url, True)
 
 
 # Merge N databases into the target database.
 # merged_db = merge(merge(merge(db1, db2), db3), db4).
 # @param reflected_dbs [list] At least 2 databases.
-def merge_into_target_db(target_db: DbData, reflected_dbs: Iterable[DbData]):
+def merge_into_target_db(
+    target_db: DbData,
+    reflected_dbs: Iterable[DbData],
+    settings: MergeSettings = None,
+):
+    settings = settings or MergeSettings()
+    try:
+        with settings.report.phase("merge"):
+            if settings.merge_mode == "n_way":
+                return merge_n_way(target_db, reflected_dbs, settings)
+            if settings.merge_mode == "incremental":
+                return merge_incrementally(target_db, reflected_dbs, settings)
+            return merge_pairwise(target_db, reflected_dbs, settings)
+    finally:
+        # also for failed merges (to see where they spent their time)
+        if settings.report_file is not None:
+            settings.report.write_json(settings.report_file)
+
+
+def merge_pairwise(
+    target_db: DbData,
+    reflected_dbs: Iterable[DbData],
+    settings: MergeSettings,
+) -> DbData:
+    """Merges the databases one after another into the target:
+    merge(merge(merge(db1, db2), db3), db4).
+    """
+    reflected_dbs = list(reflected_dbs)
+    checkpoint = open_checkpoint(target_db, reflected_dbs, settings)
+    try:
+        if checkpoint is not None and checkpoint.started:
+            print("resuming merge from checkpoint", checkpoint.path)
+            target_db.base.prepare(target_db.engine, reflect=True)
+        else:
+            prepare_target_db(target_db)
+            if checkpoint is not None:
+                checkpoint.start()
+        for index, db in enumerate(reflected_dbs):
+            if checkpoint is not None and index < checkpoint.completed_steps:
+                print("skipping already merged", db.engine.url)
+                continue
+            merge_dbs(db, target_db, settings, checkpoint)
+            # Only tables created by 'copy_table' have to be reflected.
+            with settings.report.phase("reflect"):
+                db_helpers.reflect_changed_tables(target_db)
+            if checkpoint is not None:
+                checkpoint.complete_step()
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.close()
+        raise
+    if checkpoint is not None:
+        checkpoint.remove()
+    return target_db
+
+
+def open_checkpoint(
+    target_db: DbData,
+    reflected_dbs: List[DbData],
+    settings: MergeSettings,
+) -> Optional[Checkpoint]:
+    """Opens the checkpoint of 'settings.checkpoint_file' (if any).
+    The run is identified by the databases (without credentials) and the merge mode."""
+    if settings.checkpoint_file is None:
+        return None
+    return Checkpoint(settings.checkpoint_file, {
+        "target": db_helpers.get_db_identity(target_db),
+        "sources": [db_helpers.get_db_identity(db) for db in reflected_dbs],
+        "merge_mode": settings.merge_mode,
+    })
+
+
+def merge_n_way(
+    target_db: DbData,
+    reflected_dbs: Iterable[DbData],
+    settings: MergeSettings = None,
+) -> DbData:
+    """Merges all databases in a single pass (instead of folding them pairwise).
+    The rows of all databases are hashed into one RowsDict per table
+    with the index of the database as origin.
+    Keys are adjusted once and the target is written once.
+    Databases with higher indices act as 'source' of the ones with lower indices.
+    """
+    settings = settings or MergeSettings()
+    reflected_dbs = list(reflected_dbs)
+    checkpoint = open_checkpoint(target_db, reflected_dbs, settings)
+    if checkpoint is not None and checkpoint.has_merged_rows:
+        print("resuming writing merged tables from checkpoint", checkpoint.path)
+        target_db.base.prepare(target_db.engine, reflect=True)
+        try:
+            write_checkpointed_rows(target_db, checkpoint, settings)
+        except BaseException:
+            checkpoint.close()
+            raise
+        checkpoint.remove()
+        return target_db
     prepare_target_db(target_db)
-    for db in reflected_dbs:
-        merge_dbs(db, target_db)
-        db_helpers.rereflect(target_db)
+
+    table_names, table_names_by_origin = create_target_tables(target_db, reflected_dbs)
+
+    merged_tables_by_name = {
+        table_name: create_rows_dict(db_helpers.get_table(target_db, table_name), settings)
+        for table_name in table_names
+    }
+    if settings.source_workers > 1:
+        row_digest = hashing.row_digest_for_name(settings.row_digest)
+        partial_merged_tables = read_sources_in_parallel(
+            reflected_dbs,
+            table_names_by_origin,
+            settings,
+        )
+        # Combine in the order of the databases like in the sequential case.
+        for partial_merged_tables_by_name in partial_merged_tables:
+            for table_name, partial_merged_rows in partial_merged_tables_by_name.items():
+                merged_rows = merged_tables_by_name[table_name]
+                merged_rows.update(
+                    partial_merged_rows,
+                    lambda row, key_of=merged_rows.key_of: row_digest.digest(key_of(row)),
+                )
+                partial_merged_rows.close()
+    else:
+        for origin, (db, table_names) in enumerate(zip(reflected_dbs, table_names_by_origin)):
+            for table_name in table_names:
+                print("merging table", table_name, "of", db.engine.url)
+                put_table_rows(
+                    merged_tables_by_name[table_name],
+                    db,
+                    db_helpers.get_table(db, table_name),
+                    origin,
+                    settings,
+                )
+    merged_tables = list(merged_tables_by_name.values())
+
+    try:
+        merge_near_duplicate_rows(target_db, merged_tables, settings)
+        replace_with_merged_rows(target_db, merged_tables, settings, checkpoint)
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.close()
+        raise
+    finally:
+        for merged_rows in merged_tables:
+            merged_rows.close()
+    if checkpoint is not None:
+        checkpoint.remove()
     return target_db
 
 
+def merge_incrementally(
+    target_db: DbData,
+    reflected_dbs: Iterable[DbData],
+    settings: MergeSettings,
+) -> DbData:
+    """Merges only the rows that are new or changed since the previous run
+    (remembered in 'settings.merge_state_file', see 'incremental_merge').
+    The target is only cleared if there is no previous run.
+    """
+    reflected_dbs = list(reflected_dbs)
+    state = MergeState(settings.merge_state_file)
+    try:
+        if state.empty:
+            prepare_target_db(target_db)
+        else:
+            target_db.base.prepare(target_db.engine, reflect=True)
+        _, table_names_by_origin = create_target_tables(target_db, reflected_dbs)
+        sorted_tables = db_helpers.get_foreign_key_graph(target_db).sorted_tables
+        for db, table_names in zip(reflected_dbs, table_names_by_origin):
+            for table in sorted_tables:
+                if table.name in table_names:
+                    print("merging new rows of table", table.name, "of", db.engine.url)
+                    incremental_merge.merge_new_rows(db, target_db, table.name, state, settings)
+    finally:
+        state.close()
+    return target_db
+
+
+def create_target_tables(
+    target_db: DbData,
+    reflected_dbs: List[DbData],
+) -> Tuple[List[str], List[List[str]]]:
+    """Creates the tables of all databases in the target.
+    The first database that has a table defines its structure.
+    Returns the names of the tables and, for each database,
+    the names of its tables that can be merged into the target.
+    """
+    # mapping: table name -> database that defines the table's structure in the target
+    defining_db_by_table_name: Dict[str, DbData] = OrderedDict()
+    for db in reflected_dbs:
+        for table in db.base.metadata.sorted_tables:
+            defining_db_by_table_name.setdefault(table.name, db)
+    for db in reflected_dbs:
+        db_helpers.create_tables(
+            db,
+            target_db,
+            [
+                table_name
+                for table_name, defining_db in defining_db_by_table_name.items()
+                if defining_db is db
+            ]
+        )
+    db_helpers.reflect_changed_tables(target_db)
+
+    # tables of each database that can be merged into the target
+    table_names_by_origin: List[List[str]] = []
+    for db in reflected_dbs:
+        table_names = []
+        for table_name in defining_db_by_table_name:
+            if table_name not in db.base.metadata.tables:
+                continue
+            table = db_helpers.get_table(db, table_name)
+            target_table = db_helpers.get_table(target_db, table_name)
+            if db_helpers.table_structures_equal(table, target_table):
+                table_names.append(table_name)
+            else:
+                print(
+                    f"WARNING: not merging table '{table_name}' of {db.engine.url} "
+                    "because its structure is not equal to the target's."
+                )
+        table_names_by_origin.append(table_names)
+
+    return list(defining_db_by_table_name.keys()), table_names_by_origin
+
+
+def read_sources_in_parallel(
+    reflected_dbs: List[DbData],
+    table_names_by_origin: List[List[str]],
+    settings: MergeSettings,
+) -> List[Dict[str, RowsDict]]:
+    """Reads and hashes the tables of all databases concurrently.
+    Returns one partial RowsDict per table for each database (in the order of 'reflected_dbs').
+    Process workers reflect their database themselves because connections cannot be pickled.
+    Their phases are not reported separately, they are recorded as a single 'read' phase.
+    """
+    dbs_and_table_names = list(zip(reflected_dbs, table_names_by_origin))
+    with parallel.create_executor(settings.source_executor, settings.source_workers) as executor:
+        if settings.source_executor == "process":
+            with settings.report.phase("read"):
+                futures = [
+                    executor.submit(
+                        read_source_db,
+                        str(db.engine.url),
+                        origin,
+                        table_names,
+                        settings,
+                    )
+                    for origin, (db, table_names) in enumerate(dbs_and_table_names)
+                ]
+                return [future.result() for future in futures]
+        else:
+            futures = [
+                executor.submit(read_source_tables_in_thread, db, origin, table_names, settings)
+                for origin, (db, table_names) in enumerate(dbs_and_table_names)
+            ]
+        return [future.result() for future in futures]
+
+
+def read_source_db(
+    db_url: str,
+    origin: int,
+    table_names: List[str],
+    settings: MergeSettings,
+) -> Dict[str, RowsDict]:
+    # The engine is kept for the next task of the worker process.
+    db = get_db(db_url, settings)
+    try:
+        return read_source_tables(db, origin, table_names, settings)
+    finally:
+        db.session.close()
+
+
+def read_source_tables_in_thread(
+    db: DbData,
+    origin: int,
+    table_names: List[str],
+    settings: MergeSettings,
+) -> Dict[str, RowsDict]:
+    # Sessions must not be shared between threads.
+    db = db.with_new_session()
+    try:
+        return read_source_tables(db, origin, table_names, settings)
+    finally:
+        db.session.close()
+
+
+def read_source_tables(
+    db: DbData,
+    origin: int,
+    table_names: List[str],
+    settings: MergeSettings,
+) -> Dict[str, RowsDict]:
+    merged_tables_by_name = {}
+    for table_name in table_names:
+        print("merging table", table_name, "of", db.engine.url)
+        table = db_helpers.get_table(db, table_name)
+        merged_rows = create_rows_dict(table, settings)
+        put_table_rows(merged_rows, db, table, origin, settings)
+        merged_tables_by_name[table_name] = merged_rows
+    return merged_tables_by_name
+
+
 # Make sure the database exists. If it already does empty it.
 def prepare_target_db(target_db: DbData):
     base, engine = target_db.base, target_db.engine
@@ -47,6 +374,9 @@ def prepare_target_db(target_db: DbData):
         print("clearing target db")
         print("tables before clearing", inspect(engine).get_table_names())
         base.metadata.drop_all(bind=engine)
+        # Tables that are not created again are removed from the metadata
+        # when reflecting the changed tables.
+        target_db.mark_changed(*base.metadata.tables.keys())
         # For some reason there are still tables in the metadata
         # even though there are none in the database.
         # for table in reversed(base.metadata.sorted_tables):
@@ -56,12 +386,24 @@ def prepare_target_db(target_db: DbData):
         print("tables after clearing", inspect(engine).get_table_names())
 
 
-def merge_dbs(source: DbData, target: DbData) -> None:
+def merge_dbs(
+    source: DbData,
+    target: DbData,
+    settings: MergeSettings = None,
+    checkpoint: Checkpoint = None,
+) -> None:
+    settings = settings or MergeSettings()
+    if checkpoint is not None and checkpoint.has_merged_rows:
+        print("resuming writing merged tables of", source.engine.url)
+        write_checkpointed_rows(target, checkpoint, settings)
+        return
     common_tables = (
         set(table_name for table_name in source.inspector.get_table_names())
         &
         set(table_name for table_name in target.inspector.get_table_names())
     )
+    if checkpoint is not None:
+        common_tables = checkpoint.common_tables(common_tables)
     logging.debug(
         f"common_tables of {source.engine.url} and {target.engine.url}:"
         + str(sorted(common_tables))
@@ -79,31 +421,327 @@ def merge_dbs(source: DbData, target: DbData) -> None:
     # In the case of cycles (B, e.g. tree structures) assigning primary and
     # foreign keys MUST BE 2 STEPS.
 
-    merged_tables = []
+    # The sorting will place Table objects that are referenced first,
+    # before the tables depending on them, representing the order
+    # in which they can be created (and filled).
+    source_graph = db_helpers.get_foreign_key_graph(source)
+    table_names = [table.name for table in source_graph.sorted_tables]
 
-    # The sorting will place Table objects that have dependencies first,
-    # before the dependencies themselves, representing the order
-    # in which they can be created.
-    source_tables = reversed(source.base.metadata.sorted_tables)
-
-    for source_table in source_tables:
-        table_name = source_table.name
-        # source_table = source_tables[table_name]
+    def merge_or_copy_table(table_name: str, source: DbData, target: DbData) -> RowsDict:
         if table_name in common_tables:
             print("merging table", table_name)
-            merged_tables.append(merge_tables(source, target, table_name))
-        else:
-            print("copying table", table_name)
-            db_helpers.copy_table(source, target, table_name)
+            return merge_tables(source, target, table_name, settings)
+        if checkpoint is not None:
+            if checkpoint.is_copied(table_name):
+                return None
+            # The table may have been copied partially before.
+            if table_name in target.inspector.get_table_names():
+                db_helpers.truncate_table(target, table_name)
+        print("copying table", table_name)
+        with settings.report.phase("copy", table_name):
+            if settings.native_copy and bulk_copy.supports_native_copy(
+                source.engine.url,
+                target.engine.url,
+            ):
+                bulk_copy.copy_table_natively(source, target, table_name)
+            elif settings.pipeline:
+                pipeline.copy_table(source, target, table_name, settings)
+            else:
+                db_helpers.copy_table(
+                    source,
+                    target,
+                    table_name,
+                    settings.batch_size,
+                    settings.multi_values_insert,
+                    settings.page_size,
+                )
+        if checkpoint is not None:
+            checkpoint.table_copied(table_name)
+        return None
+
+    if settings.sql_merge and sql_merge.supports_sql_merge(source.engine.url, target.engine.url):
+        for table_name in table_names:
+            if table_name not in common_tables:
+                merge_or_copy_table(table_name, source, target)
+        with settings.report.phase("reflect"):
+            db_helpers.reflect_changed_tables(target)
+        # Deduplicating, remapping and writing happen in one transaction.
+        with settings.report.phase("dedup"):
+            sql_merge.merge_tables_in_sql(
+                source,
+                target,
+                [table_name for table_name in table_names if table_name in common_tables],
+            )
+        return
+
+    if settings.table_workers > 1:
+        merged_table_by_name = parallel.run_in_dependency_order(
+            table_names,
+            source_graph.dependencies,
+            lambda table_name: run_with_new_sessions(
+                merge_or_copy_table,
+                table_name,
+                source,
+                target,
+            ),
+            settings.table_workers,
+        )
+        # Tables may have been created by the workers.
+        target.mark_changed()
+    else:
+        merged_table_by_name = {
+            table_name: merge_or_copy_table(table_name, source, target)
+            for table_name in table_names
+        }
+    merged_tables = [
+        merged_table_by_name[table_name]
+        for table_name in table_names
+        if merged_table_by_name[table_name] is not None
+    ]
+
+    try:
+        merge_near_duplicate_rows(target, merged_tables, settings)
+        replace_with_merged_rows(target, merged_tables, settings, checkpoint)
+    finally:
+        for merged_rows in merged_tables:
+            merged_rows.close()
+
+
+def run_with_new_sessions(func: Callable, table_name: str, *dbs: DbData) -> Any:
+    """Calls 'func' with copies of 'dbs' that have their own sessions (for worker threads)."""
+    dbs_with_new_sessions = [db.with_new_session() for db in dbs]
+    try:
+        return func(table_name, *dbs_with_new_sessions)
+    finally:
+        for db in dbs_with_new_sessions:
+            db.session.close()
+
+
+def replace_with_merged_rows(
+    target: DbData,
+    merged_tables: List[RowsDict],
+    settings: MergeSettings,
+    checkpoint: Checkpoint = None,
+) -> None:
+    """Adjusts the keys of the merged rows and replaces the rows of the target tables with them.
+    With a checkpoint the adjusted rows are saved before the target is changed.
+    """
+    if settings.sql_key_remapping:
+        # single transaction -> nothing to resume
+        with settings.report.phase("remap"):
+            sql_merge.write_merged_tables_remapping_keys_in_sql(target, merged_tables, settings)
+        return
+    # the rows that are in the target already (pairwise) or come from the 1st database
+    preferred_origin = "target" if settings.merge_mode == "pairwise" else 0
+    if settings.max_rows_in_memory <= 0:
+        merged_and_adjusted_relations_tables = adjust_relationships(
+            target,
+            merged_tables,
+            settings.report,
+            settings.preserve_primary_keys,
+            preferred_origin,
+        )
+        write_adjusted_rows(target, merged_and_adjusted_relations_tables, settings, checkpoint)
+        return
+    # Rows may have been spilled to disk, so they are not held in memory either.
+    key_map = PrimaryKeyMap(settings.spill_directory)
+    try:
+        write_adjusted_rows(
+            target,
+            stream_adjusted_rows(
+                target,
+                merged_tables,
+                key_map,
+                settings.page_size,
+                settings.report,
+                settings.preserve_primary_keys,
+                preferred_origin,
+            ),
+            settings,
+            checkpoint,
+        )
+    finally:
+        key_map.close()
+
+
+def write_adjusted_rows(
+    target: DbData,
+    rows_by_table_name: Dict[str, Iterable[list]],
+    settings: MergeSettings,
+    checkpoint: Checkpoint = None,
+) -> None:
+    """Replaces the rows of the target tables with the merged rows (with adjusted keys)."""
+    if checkpoint is not None:
+        checkpoint.save_merged_rows(rows_by_table_name)
+        write_checkpointed_rows(target, checkpoint, settings)
+        return
+    if settings.incremental_write:
+        write_merged_tables_incrementally(target, rows_by_table_name, settings)
+        return
+    # Delete referencing rows before the rows they reference.
+    for table in reversed(db_helpers.get_foreign_key_graph(target).sorted_tables):
+        if table.name in rows_by_table_name:
+            with settings.report.phase("truncate", table.name):
+                db_helpers.truncate_table(target, table.name)
+    write_merged_tables(target, rows_by_table_name, settings)
+
+
+def write_merged_tables(
+    target: DbData,
+    rows_by_table_name: Dict[str, Iterable[list]],
+    settings: MergeSettings,
+) -> None:
+    """Inserts the merged rows into the (empty) target tables.
+    Referenced tables are written before the tables referencing them.
+    """
+    target_graph = db_helpers.get_foreign_key_graph(target)
+    table_names = [
+        table.name
+        for table in target_graph.sorted_tables
+        if table.name in rows_by_table_name
+    ]
+
+    def insert_table_rows(table_name: str, target: DbData) -> None:
+        with settings.report.phase("insert", table_name) as counters:
+            counters["rows"] = db_helpers.insert_rows(
+                target,
+                db_helpers.get_table(target, table_name),
+                rows_by_table_name[table_name],
+                settings.batch_size,
+                settings.multi_values_insert,
+            )
+
+    if settings.table_workers > 1:
+        parallel.run_in_dependency_order(
+            table_names,
+            target_graph.dependencies,
+            lambda table_name: run_with_new_sessions(insert_table_rows, table_name, target),
+            settings.table_workers,
+        )
+    else:
+        for table_name in table_names:
+            insert_table_rows(table_name, target)
 
-    merged_and_adjusted_relations_tables = adjust_relationships(target, merged_tables)
-    for table_name, rows_to_insert in merged_and_adjusted_relations_tables.items():
-        db_helpers.truncate_table(target, table_name)
-        db_helpers.insert_rows(
+
+def write_checkpointed_rows(
+    target: DbData,
+    checkpoint: Checkpoint,
+    settings: MergeSettings,
+) -> None:
+    """Writes the merged rows saved in the checkpoint.
+    Rows that are already in the target tables are skipped so an interrupted write is continued.
+    """
+    merged_table_names = checkpoint.merged_table_names()
+    tables = [
+        table
+        for table in db_helpers.get_foreign_key_graph(target).sorted_tables
+        if table.name in merged_table_names
+    ]
+    if settings.incremental_write:
+        # Writing the difference can simply be repeated.
+        write_merged_tables_incrementally(
             target,
-            db_helpers.get_table(target, table_name),
-            rows_to_insert
+            {table.name: list(checkpoint.iter_merged_rows(table.name)) for table in tables},
+            settings,
         )
+        return
+    if not checkpoint.truncated:
+        # Delete referencing rows before the rows they reference.
+        for table in reversed(tables):
+            with settings.report.phase("truncate", table.name):
+                db_helpers.truncate_table(target, table.name)
+        checkpoint.mark_truncated()
+    for table in tables:
+        # Each batch is committed, so the table contains exactly the rows written so far.
+        num_written_rows = db_helpers.count_rows(target, table)
+        rows = checkpoint.iter_merged_rows(table.name, num_written_rows)
+        with settings.report.phase("insert", table.name) as counters:
+            for batch in db_helpers.batched(rows, settings.batch_size):
+                db_helpers.insert_rows(
+                    target,
+                    table,
+                    batch,
+                    settings.batch_size,
+                    settings.multi_values_insert,
+                )
+                counters["rows"] = counters.get("rows", 0) + len(batch)
+
+
+def write_merged_tables_incrementally(
+    target: DbData,
+    rows_by_table_name: Dict[str, Iterable[list]],
+    settings: MergeSettings,
+) -> None:
+    """Writes only the difference between the rows in the target tables and the merged rows:
+    rows that are equal to the target's row with the same primary key are not written again.
+    """
+    target_graph = db_helpers.get_foreign_key_graph(target)
+    tables = [
+        table
+        for table in target_graph.sorted_tables
+        if table.name in rows_by_table_name
+    ]
+    row_changes_by_table_name = {
+        table.name: get_row_changes(target, table, rows_by_table_name[table.name], settings)
+        for table in tables
+    }
+    # Delete referencing rows before the rows they reference.
+    for table in reversed(tables):
+        deleted_primary_keys = row_changes_by_table_name[table.name].deleted_primary_keys
+        with settings.report.phase("truncate", table.name, rows=len(deleted_primary_keys)):
+            db_helpers.delete_rows(target, table, deleted_primary_keys, settings.batch_size)
+    for table in tables:
+        row_changes = row_changes_by_table_name[table.name]
+        with settings.report.phase("insert", table.name, rows=len(row_changes.changed_rows)):
+            db_helpers.upsert_rows(
+                target,
+                table,
+                row_changes.changed_rows,
+                settings.batch_size,
+                row_changes.existing_primary_keys,
+            )
+
+
+class RowChanges(NamedTuple):
+    # inserted or updated rows
+    changed_rows: List[list]
+    deleted_primary_keys: List[Any]
+    # primary keys of the rows that are kept in the target table
+    existing_primary_keys: Set[Any]
+
+
+def get_row_changes(
+    target: DbData,
+    table: Table,
+    rows: Iterable[list],
+    settings: MergeSettings,
+) -> RowChanges:
+    """Compares the merged rows with the rows in the target table by primary key.
+    ASSUMPTION: IDs as primary keys in 1st column.
+    """
+    # mapping: primary key -> row in the target table
+    existing_rows = {
+        row[0]: tuple(row)
+        for row in db_helpers.iter_rows(target, table, settings.page_size)
+    }
+    changed_rows = []
+    existing_primary_keys = set()
+    num_rows = 0
+    for row in rows:
+        num_rows += 1
+        existing_row = existing_rows.pop(row[0], None)
+        if existing_row is not None:
+            existing_primary_keys.add(row[0])
+        if existing_row != tuple(row):
+            changed_rows.append(row)
+    # The remaining rows have not been merged.
+    deleted_primary_keys = list(existing_rows.keys())
+    logging.debug(
+        f"{table.name}: {len(changed_rows)} changed rows, "
+        f"{num_rows - len(changed_rows)} unchanged rows, "
+        f"{len(deleted_primary_keys)} deleted rows"
+    )
+    return RowChanges(changed_rows, deleted_primary_keys, existing_primary_keys)
 
 
 # Merges 2 tables with the same structure (-> columns).
@@ -117,28 +755,23 @@ def merge_dbs(source: DbData, target: DbData) -> None:
 #   This removes all duplicates.
 # - Renew the primary key (assumed to be an integer id!)
 #   This is later used for the foreign keys.
-def merge_tables(source: DbData, target: DbData, table_name: str) -> RowsDict:
+def merge_tables(
+    source: DbData,
+    target: DbData,
+    table_name: str,
+    settings: MergeSettings = None,
+) -> RowsDict:
+    settings = settings or MergeSettings()
     source_table = db_helpers.get_table(source, table_name)
     target_table = db_helpers.get_table(target, table_name)
 
     # source_table.columns.user_id.foreign_keys
-    # TODO: pass strategy from user input
-    merged_rows = RowsDict(table_name=table_name, strategy=SourceMergeStrategy())
+    merged_rows = create_rows_dict(source_table, settings)
 
     if db_helpers.table_structures_equal(source_table, target_table):
-        for row in source.session.query(source_table).all():
-            merged_rows.put(
-                hash_row(source_table, row),
-                row,
-                "source"
-            )
-        for row in target.session.query(target_table).all():
-            merged_rows.put(
-                hash_row(target_table, row),
-                row,
-                "target"
-            )
-        print("merged:", merged_rows)
+        put_table_rows(merged_rows, source, source_table, "source", settings)
+        put_table_rows(merged_rows, target, target_table, "target", settings)
+        logging.debug(f"merged {table_name} into {len(merged_rows)} rows")
         # rows = adjust_relationships(merged_rows)
         # # truncating does not work...
         # db_helpers.truncate_table(target, table_name)
@@ -151,27 +784,185 @@ def merge_tables(source: DbData, target: DbData, table_name: str) -> RowsDict:
     return merged_rows
 
 
-def hash_row(table: Table, row: tuple) -> int:
-    regarded_indices = get_indices_for_hashing(table)
-    hash_value = hash(tuple(
-        value for i, value in enumerate(row)
-        if i in regarded_indices
-    ))
-    # print("hash for row", row, "=", hash_value)
-    return hash_value
+def create_rows_dict(table: Table, settings: MergeSettings) -> RowsDict:
+    # TODO: pass strategy from user input
+    if settings.max_rows_in_memory > 0:
+        return SpillingRowsDict(
+            table_name=table.name,
+            strategy=SourceMergeStrategy(),
+            key_of=hashing.get_hashing_plan(table),
+            max_rows_in_memory=settings.max_rows_in_memory,
+            directory=settings.spill_directory,
+        )
+    rows_dict_class = CompactRowsDict if settings.compact_rows else RowsDict
+    return rows_dict_class(
+        table_name=table.name,
+        strategy=SourceMergeStrategy(),
+        key_of=hashing.get_hashing_plan(table),
+    )
 
 
-def get_indices_for_hashing(table: Table) -> List[int]:
-    return [
-        i for i, column in enumerate(table.columns)
-        if column.primary_key is False and len(column.foreign_keys) == 0
-    ]
+def put_table_rows(
+    merged_rows: RowsDict,
+    db: DbData,
+    table: Table,
+    origin: Any,
+    settings: MergeSettings,
+) -> None:
+    """Streams all rows of 'table' into 'merged_rows'.
+    Reports the time spent reading, hashing and deduplicating the rows.
+    """
+    if settings.pipeline:
+        pipeline.put_table_rows(merged_rows, db, table, origin, settings)
+        return
+    report = settings.report
+    row_digest = hashing.row_digest_for_name(settings.row_digest)
+    read_seconds = hash_seconds = dedup_seconds = 0.0
+    num_rows = num_bytes = 0
+    num_merged_rows = len(merged_rows)
+    start = time.perf_counter()
+    for page in db_helpers.iter_row_pages(db, table, settings.page_size):
+        read = time.perf_counter()
+        row_hashes = hashing.hash_rows(table, page, row_digest)
+        hashed = time.perf_counter()
+        for row, row_hash in zip(page, row_hashes):
+            merged_rows.put(row_hash, row, origin)
+        deduplicated = time.perf_counter()
+        read_seconds += read - start
+        hash_seconds += hashed - read
+        dedup_seconds += deduplicated - hashed
+        num_rows += len(page)
+        if report.count_bytes:
+            num_bytes += estimate_size(page)
+        start = time.perf_counter()
+    # fetching the last (empty) page
+    read_seconds += time.perf_counter() - start
+    report.record("read", table.name, seconds=read_seconds, rows=num_rows, bytes=num_bytes)
+    report.record("hash", table.name, seconds=hash_seconds, rows=num_rows)
+    report.record(
+        "dedup",
+        table.name,
+        seconds=dedup_seconds,
+        rows=num_rows,
+        duplicates=num_rows - (len(merged_rows) - num_merged_rows),
+    )
+
+
+def merge_near_duplicate_rows(
+    db: DbData,
+    merged_tables: List[RowsDict],
+    settings: MergeSettings,
+) -> None:
+    """Merges the rows of the tables in 'settings.near_duplicate_columns'
+    that only differ slightly in those columns (see 'near_duplicates').
+    The RowsDicts are replaced (in 'merged_tables') by new ones
+    into which the near-duplicates of each group have been put with the same hash.
+    """
+    for index, merged_rows in enumerate(merged_tables):
+        column_names = settings.near_duplicate_columns.get(merged_rows.table_name)
+        if not column_names:
+            continue
+        table = db_helpers.get_table(db, merged_rows.table_name)
+        table_column_names = [column.name for column in table.columns]
+        unknown_column_names = set(column_names) - set(table_column_names)
+        if unknown_column_names:
+            raise ValueError(
+                f"Unknown near-duplicate columns of table '{table.name}': "
+                + ", ".join(sorted(unknown_column_names))
+            )
+        fuzzy_indices = [table_column_names.index(column_name) for column_name in column_names]
+        exact_indices = [
+            i for i in hashing.get_indices_for_hashing(table) if i not in fuzzy_indices
+        ]
+        with settings.report.phase("dedup", table.name) as counters:
+            group_hash_by_row_hash = near_duplicates.find_near_duplicates(
+                (
+                    (row_hash, row, origin)
+                    for row_hash, (row, origin, _) in merged_rows.rows.items()
+                ),
+                fuzzy_indices,
+                exact_indices,
+                settings.near_duplicate_threshold,
+            )
+            grouped_rows = create_rows_dict(table, settings)
+            try:
+                grouped_rows.put_grouped(merged_rows, group_hash_by_row_hash)
+            except BaseException:
+                grouped_rows.close()
+                raise
+            counters["duplicates"] = len(merged_rows) - len(grouped_rows)
+        merged_tables[index] = grouped_rows
+        merged_rows.close()
+
+
+def iter_primary_key_candidates(
+    merged_table: RowsDict,
+    preferred_origin: Any,
+) -> Iterator[Tuple[Any, bool]]:
+    """Yields the primary key each merged row would like to keep
+    (the one of 'preferred_origin' if it has one) and whether it is preferred."""
+    for row, _, primary_keys in merged_table.values():
+        preferred_pk = next(
+            (pk for origin, pk in primary_keys if origin == preferred_origin),
+            None,
+        )
+        yield (row[0], False) if preferred_pk is None else (preferred_pk, True)
 
 
-def adjust_relationships(db: DbData, merged_tables: List[RowsDict]) -> Dict[str, List[Any]]:
+def get_preserved_primary_keys(
+    merged_table: RowsDict,
+    preferred_origin: Any,
+) -> Optional[List[int]]:
+    """Returns the new primary key of each merged row (in the order of 'values'):
+    its old primary key unless another row has kept that key already.
+    Merged rows with a key of 'preferred_origin' keep that one and are served first.
+    The other (colliding) rows get new keys greater than all kept keys.
+    Returns None if the primary keys are not integers.
+    """
+    # (old primary key, whether it is the preferred origin's key) of each row
+    candidates: List[Tuple[int, bool]] = []
+    for candidate, preferred in iter_primary_key_candidates(merged_table, preferred_origin):
+        if not isinstance(candidate, int) or isinstance(candidate, bool):
+            return None
+        candidates.append((candidate, preferred))
+
+    new_pks: List[Optional[int]] = [None] * len(candidates)
+    kept_pks: Set[int] = set()
+    for preferred in (True, False):
+        for index, (candidate, is_preferred) in enumerate(candidates):
+            if is_preferred is preferred and candidate not in kept_pks:
+                kept_pks.add(candidate)
+                new_pks[index] = candidate
+    next_pk = max(kept_pks, default=0) + 1
+    for index, new_pk in enumerate(new_pks):
+        if new_pk is None:
+            new_pks[index] = next_pk
+            next_pk += 1
+    return new_pks  # type: ignore
+
+
+def hash_row(
+    table: Table,
+    row: tuple,
+    row_digest: hashing.RowDigest = hashing.DEFAULT_ROW_DIGEST,
+) -> int:
+    return row_digest.digest(hashing.get_hashing_plan(table)(row))
+
+
+def adjust_relationships(
+    db: DbData,
+    merged_tables: List[RowsDict],
+    report: MergeReport = None,
+    preserve_primary_keys: bool = False,
+    preferred_origin: Any = None,
+) -> Dict[str, List[Any]]:
     """
     Reassigns e.g. primary keys so relationships stay intact.
     The keys are adjusted in the merged_rows RowsDict.
+    The time spent on each table is reported as its 'remap' phase.
+    With 'preserve_primary_keys' rows keep their primary keys unless they collide
+    (see 'get_preserved_primary_keys') and the foreign keys referencing a table
+    whose keys have all been kept are not touched.
 
     The algorithm works like so:
 
@@ -192,6 +983,8 @@ def adjust_relationships(db: DbData, merged_tables: List[RowsDict]) -> Dict[str,
     After this phase all rows have new primary keys and know their old ones.
     We use that information to correct the currently broken foreign keys
     (due to the new primary keys).
+    For that purpose an index (origin, old primary key) -> new primary key is built
+    for each table so finding a related row is a single lookup.
 
     for each table T in reversed(TL) do
     begin
@@ -201,23 +994,32 @@ def adjust_relationships(db: DbData, merged_tables: List[RowsDict]) -> Dict[str,
         begin
             for row R in D's rows do
             begin
-                find related row X in T (the one where the referencing column
-                 has the old primary key)
+                find related row X in T (the one with R's origin where the
+                 referencing column has the old primary key)
                 update the relation
             end
         end
     end
     """
 
-    table_rows_by_name = {}
-    print("merged_tables:", [str(t) for t in merged_tables])
+    # mapping: table name -> rows (the lists stored in the RowsDicts)
+    table_rows_by_name: Dict[str, List[list]] = {}
+    # mapping: table name -> origins of the rows (in the same order)
+    table_origins_by_name: Dict[str, List[Any]] = {}
+    # mapping: table name -> {origin: {old primary key: new primary key}}
+    new_pks_by_table_name: Dict[str, Dict[Any, Dict[Any, Any]]] = {}
+    # names of the tables whose rows all have their old primary keys (of every origin)
+    unchanged_table_names: Set[str] = set()
+    report = report or MergeReport()
+    logging.debug(f"adjusting relationships of {[str(t) for t in merged_tables]}")
     merged_tables_by_name = {
         merged_table.table_name: merged_table
         for merged_table in merged_tables
     }
+    foreign_key_graph = db_helpers.get_foreign_key_graph(db)
     sorted_tables = [
         table
-        for table in db.base.metadata.sorted_tables
+        for table in foreign_key_graph.sorted_tables
         if table.name in merged_tables_by_name
     ]
 
@@ -226,69 +1028,220 @@ def adjust_relationships(db: DbData, merged_tables: List[RowsDict]) -> Dict[str,
     for table in reversed(sorted_tables):
         table_name = table.name
         merged_table = merged_tables_by_name[table_name]
+        start = time.perf_counter()
 
         # ASSUMPTION: IDs as primary keys in 1st column
-        id_generator = value_generators.value_generator_for_type(int)
-        rows_by_old_pks = {}
+        preserved_pks = (
+            get_preserved_primary_keys(merged_table, preferred_origin)
+            if preserve_primary_keys
+            else None
+        )
+        id_generator = (
+            iter(preserved_pks)
+            if preserved_pks is not None
+            else value_generators.value_generator_for_type(int)
+        )
+        rows = []
+        origins = []
+        new_pk_by_old_pk_by_origin: Dict[Any, Dict[Any, Any]] = {}
+        keys_changed = False
         for row, origin, primary_keys in merged_table.values():
-            # row = list(row)
-            # old_pk = row[0]
-            row[0] = next(id_generator)
-            if primary_keys not in rows_by_old_pks:
-                rows_by_old_pks[primary_keys] = []
-            rows_by_old_pks[primary_keys].append((row, origin))
-        table_rows_by_name[table_name] = rows_by_old_pks
+            new_pk = next(id_generator)
+            row[0] = new_pk
+            # All merged rows (of any origin) are now represented by this row.
+            for old_origin, old_pk in primary_keys:
+                if old_origin not in new_pk_by_old_pk_by_origin:
+                    new_pk_by_old_pk_by_origin[old_origin] = {}
+                new_pk_by_old_pk_by_origin[old_origin][old_pk] = new_pk
+                keys_changed = keys_changed or old_pk != new_pk
+            rows.append(row)
+            origins.append(origin)
+        table_rows_by_name[table_name] = rows
+        table_origins_by_name[table_name] = origins
+        new_pks_by_table_name[table_name] = new_pk_by_old_pk_by_origin
+        if not keys_changed:
+            unchanged_table_names.add(table_name)
+        report.record(
+            "remap",
+            table_name,
+            seconds=time.perf_counter() - start,
+            rows=len(rows),
+        )
 
     for referenced_table in sorted_tables:
         referenced_table_name = referenced_table.name
-        referencing_tables = db_helpers.find_referencing_tables_and_columns(db, referenced_table_name)
-        for referencing_table, referencing_columns in referencing_tables:
-            # old_pks contains the primary keys before the merge
-            for _, referencing_rows_with_origin in table_rows_by_name[referencing_table.name].items():
-                for referencing_column in referencing_columns:
-                    ref_col_name = referencing_column.name
-                    fk_idx = [
-                        i
-                        for i, col in enumerate(referencing_table.columns)
-                        if col.name == ref_col_name
-                    ][0]
-
-                    for referencing_row, referencing_origin in referencing_rows_with_origin:
-                        # This is the primary key from after the merge
-                        # but still pointing to the primary key from before the merge.
-                        fk = referencing_row[fk_idx]
-                        referenced_row = None
-                        for old_pks in table_rows_by_name[referenced_table_name]:
-                            # TODO: this is a list of rows instead of a row!
-                            # If we have multiple rows that are referenced how do we know which one is the wanted one?
-                            potentially_referenced_rows = table_rows_by_name[referenced_table_name][old_pks]
-                            if fk in old_pks:
-                                # if fk == 7:
-                                #     import pudb; pudb.set_trace()
-                                for potentially_referenced_row_with_origin in potentially_referenced_rows:
-                                    potentially_referenced_row, potentially_referenced_origin = potentially_referenced_row_with_origin
-                                    # Identify correct row by origin.
-                                    # Or if there is only 1 row the rows from source and target have been merged. So we can take it anyway because the data is the same.
-                                    if referencing_origin == potentially_referenced_origin or len(potentially_referenced_rows) == 1:
-                                        referenced_row = potentially_referenced_row
-                                        break
-
-                        if referenced_row is None:
-                            import pudb; pudb.set_trace()
-                            raise ValueError(
-                                f"Could not find a row with primary key {fk} "
-                                f"in {referenced_table_name}."
-                            )
-
-                        # update row's foreign key value
-                        # ASSUMPTION: IDs as primary keys in 1st column
-                        referencing_row[fk_idx] = referenced_row[0]
-
-    # drop meta info about old primary keys
+        if referenced_table_name in unchanged_table_names:
+            # The foreign keys are valid already.
+            continue
+        new_pk_by_old_pk_by_origin = new_pks_by_table_name[referenced_table_name]
+        referencing_tables = foreign_key_graph.referencing(referenced_table_name)
+        for referencing_table, _, fk_indices in referencing_tables:
+            if referencing_table.name not in table_rows_by_name:
+                logging.warning(
+                    f"not adjusting foreign keys of '{referencing_table.name}' "
+                    f"referencing '{referenced_table_name}' because it has not been merged."
+                )
+                continue
+            start = time.perf_counter()
+            referencing_rows = table_rows_by_name[referencing_table.name]
+            referencing_origins = table_origins_by_name[referencing_table.name]
+            for fk_idx in fk_indices:
+                rows_and_origins = zip(referencing_rows, referencing_origins)
+                for referencing_row, referencing_origin in rows_and_origins:
+                    # This is the primary key from before the merge
+                    # (of the database the referencing row comes from).
+                    fk = referencing_row[fk_idx]
+                    if fk is None:
+                        continue
+                    try:
+                        new_pk = new_pk_by_old_pk_by_origin[referencing_origin][fk]
+                    except KeyError as e:
+                        raise ValueError(
+                            f"Could not find a row with primary key {fk} "
+                            f"in {referenced_table_name}."
+                        ) from e
+                    # update row's foreign key value
+                    referencing_row[fk_idx] = new_pk
+            report.record(
+                "remap",
+                referencing_table.name,
+                seconds=time.perf_counter() - start,
+            )
+
+    return table_rows_by_name
+
+
+def stream_adjusted_rows(
+    db: DbData,
+    merged_tables: List[RowsDict],
+    key_map: PrimaryKeyMap,
+    page_size: int,
+    report: MergeReport = None,
+    preserve_primary_keys: bool = False,
+    preferred_origin: Any = None,
+) -> Dict[str, Iterable[list]]:
+    """Like 'adjust_relationships' for tables larger than the memory:
+    the new primary keys are assigned in one pass over the merged rows (e.g. spilled to disk)
+    and saved in 'key_map' (on disk).
+    The returned rows are read again page by page while they are consumed (e.g. written)
+    and get their new primary and foreign keys from 'key_map'.
+    So the memory used does not grow with the number of rows.
+    """
+    report = report or MergeReport()
+    merged_tables_by_name = {
+        merged_table.table_name: merged_table
+        for merged_table in merged_tables
+    }
+    foreign_key_graph = db_helpers.get_foreign_key_graph(db)
+    sorted_tables = [
+        table
+        for table in foreign_key_graph.sorted_tables
+        if table.name in merged_tables_by_name
+    ]
+    # names of the tables whose rows all have their old primary keys (of every origin)
+    unchanged_table_names: Set[str] = set()
+    for table in reversed(sorted_tables):
+        merged_table = merged_tables_by_name[table.name]
+        with report.phase("remap", table.name) as counters:
+            new_pks: Optional[Iterator[Any]] = None
+            if preserve_primary_keys:
+                new_pks = key_map.preserve(
+                    iter_primary_key_candidates(merged_table, preferred_origin)
+                )
+            if new_pks is None:
+                new_pks = value_generators.value_generator_for_type(int)
+            keys_changed = False
+            num_rows = 0
+
+            def iter_new_keys(merged_table=merged_table, new_pks=new_pks):
+                nonlocal keys_changed, num_rows
+                for (_, _, primary_keys), new_pk in zip(merged_table.values(), new_pks):
+                    num_rows += 1
+                    # All merged rows (of any origin) are now represented by this row.
+                    for old_origin, old_pk in primary_keys:
+                        keys_changed = keys_changed or old_pk != new_pk
+                        yield old_origin, old_pk, new_pk
+
+            key_map.put_many(table.name, iter_new_keys())
+            counters["rows"] = num_rows
+        if not keys_changed:
+            unchanged_table_names.add(table.name)
+
+    # mapping: table name -> (index of the foreign key column, name of the referenced table)
+    foreign_keys_by_table_name: Dict[str, List[Tuple[int, str]]] = {
+        table.name: [] for table in sorted_tables
+    }
+    for referenced_table in sorted_tables:
+        if referenced_table.name in unchanged_table_names:
+            # The foreign keys are valid already.
+            continue
+        for referencing_table, _, fk_indices in foreign_key_graph.referencing(referenced_table.name):
+            if referencing_table.name not in merged_tables_by_name:
+                logging.warning(
+                    f"not adjusting foreign keys of '{referencing_table.name}' "
+                    f"referencing '{referenced_table.name}' because it has not been merged."
+                )
+                continue
+            foreign_keys_by_table_name[referencing_table.name].extend(
+                (fk_idx, referenced_table.name) for fk_idx in fk_indices
+            )
+
     return {
-        table_name: [row for old_pks, rows in rows_by_old_pks.items() for row, origin in rows]
-        for table_name, rows_by_old_pks in table_rows_by_name.items()
+        table.name: iter_adjusted_rows(
+            merged_tables_by_name[table.name],
+            foreign_keys_by_table_name[table.name],
+            key_map,
+            page_size,
+            report,
+        )
+        for table in sorted_tables
     }
-    # sorted_tables
-    # fk_set = table.columns[some].foreign_keys
-    # fk.column == referenced column instance (of referenced table)
+
+
+def iter_adjusted_rows(
+    merged_table: RowsDict,
+    foreign_keys: List[Tuple[int, str]],
+    key_map: PrimaryKeyMap,
+    page_size: int,
+    report: MergeReport,
+) -> Iterator[list]:
+    """Yields the merged rows with the new keys in 'key_map' (see 'stream_adjusted_rows').
+    The keys of a page are looked up together.
+    The time spent (excluding the consumer's) is reported as the table's 'remap' phase.
+    """
+    seconds = 0.0
+    start = time.perf_counter()
+    for page in db_helpers.batched(merged_table.values(), page_size):
+        # Any (origin, old primary key) of an entry has been mapped to its new primary key.
+        new_pks = key_map.get_many(
+            merged_table.table_name,
+            (next(iter(primary_keys)) for _, _, primary_keys in page),
+        )
+        new_fks_by_index = {
+            fk_idx: key_map.get_many(
+                referenced_table_name,
+                ((origin, row[fk_idx]) for row, origin, _ in page if row[fk_idx] is not None),
+            )
+            for fk_idx, referenced_table_name in foreign_keys
+        }
+        rows = []
+        for row, origin, primary_keys in page:
+            row[0] = new_pks[next(iter(primary_keys))]
+            for fk_idx, referenced_table_name in foreign_keys:
+                # This is the primary key from before the merge
+                # (of the database the referencing row comes from).
+                fk = row[fk_idx]
+                if fk is None:
+                    continue
+                try:
+                    row[fk_idx] = new_fks_by_index[fk_idx][(origin, fk)]
+                except KeyError as e:
+                    raise ValueError(
+                        f"Could not find a row with primary key {fk} "
+                        f"in {referenced_table_name}."
+                    ) from e
+            rows.append(row)
+        seconds += time.perf_counter() - start
+        yield from rows
+        start = time.perf_counter()
+    report.record("remap", merged_table.table_name, seconds=seconds)
@@ -0,0 +1,156 @@
+"""Finding rows that are near-duplicates of each other in roughly linear time.
+
+Rows are only compared with candidates found by blocking indexes instead of all other rows:
+- rows whose configured ('fuzzy') columns are equal after normalizing them
+  (see 'normalize', e.g. "Alice Smith " and "alice smith") are near-duplicates
+- otherwise rows whose MinHash signatures (over the character shingles of the normalized
+  columns) are equal in at least one band (locality-sensitive hashing) are candidates.
+  A candidate is a near-duplicate if the Jaccard similarity of the shingles is at least
+  the threshold.
+Both indexes are blocked by the (exact) values of the other hashed columns,
+so only rows that would be duplicates apart from the fuzzy columns are compared.
+"""
+from hashlib import blake2b
+import random
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Sequence, Tuple
+import unicodedata
+
+
+# number of hash functions of a MinHash signature
+NUM_PERMUTATIONS = 32
+# number of signature values per band of the LSH index (NUM_PERMUTATIONS / ROWS_PER_BAND bands)
+ROWS_PER_BAND = 2
+# length of the character shingles
+SHINGLE_SIZE = 3
+# maximum number of earlier rows of the same LSH bucket a row is compared with
+# (bounds the comparisons of very common bands)
+MAX_CANDIDATES_PER_BUCKET = 20
+# prime modulus of the hash functions of the signatures
+MERSENNE_PRIME = 2**61 - 1
+# coefficients (a, b) of the hash functions (a * x + b) % MERSENNE_PRIME
+# (seeded so signatures are stable across processes and runs)
+_random = random.Random(25)
+PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def normalize(value: Any) -> str:
+    """Returns the text of 'value' without accents, case and surrounding/repeated whitespace."""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return " ".join(text.casefold().split())
+
+
+def get_shingles(text: str) -> FrozenSet[str]:
+    """Returns the substrings of length SHINGLE_SIZE of 'text' (or 'text' itself if shorter)."""
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset((text, )) if text else frozenset()
+    return frozenset(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+
+
+def jaccard_similarity(shingles: FrozenSet[str], other_shingles: FrozenSet[str]) -> float:
+    if not shingles and not other_shingles:
+        return 1.0
+    return len(shingles & other_shingles) / len(shingles | other_shingles)
+
+
+def get_signature(shingles: FrozenSet[str]) -> Tuple[int, ...]:
+    """Returns the MinHash signature: the minimum of each hash function over the shingles."""
+    shingle_hashes = [
+        int.from_bytes(blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for shingle in shingles
+    ]
+    return tuple(
+        min((a * shingle_hash + b) % MERSENNE_PRIME for shingle_hash in shingle_hashes)
+        for a, b in PERMUTATIONS
+    )
+
+
+def find_near_duplicates(
+    entries: Iterable[Tuple[Hashable, Sequence, Any]],
+    fuzzy_indices: List[int],
+    exact_indices: List[int],
+    threshold: float,
+) -> Dict[Hashable, Hashable]:
+    """Groups near-duplicate rows. 'entries' are (key, row, origin) tuples.
+    Returns the key of the group's first entry for the keys of the other entries of each group.
+    A group contains at most one row per origin because rows of the same origin
+    are distinct (and merge strategies choose between rows of different origins).
+    """
+    keys: List[Hashable] = []
+    # union-find of the groups
+    parents: List[int] = []
+    origins_by_root: Dict[int, set] = {}
+
+    def find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(index: int, other_index: int) -> bool:
+        """Returns whether the entries are in the same group (afterwards)."""
+        root, other_root = find(index), find(other_index)
+        if root == other_root:
+            return True
+        if origins_by_root[root] & origins_by_root[other_root]:
+            return False
+        # The first entry represents the group.
+        root, other_root = min(root, other_root), max(root, other_root)
+        parents[other_root] = root
+        origins_by_root[root] |= origins_by_root.pop(other_root)
+        return True
+
+    # mapping: (exact values, normalized text) -> index of the first entry
+    first_index_by_text: Dict[Tuple[tuple, str], int] = {}
+    # indices of the entries indexed by MinHash: the first entry of each distinct
+    # normalized text (per exact values) and the entries that could not join its group
+    distinct_text_indices: List[int] = []
+    # (exact values, normalized text) of each entry
+    texts: List[Tuple[tuple, str]] = []
+    for index, (key, row, origin) in enumerate(entries):
+        keys.append(key)
+        parents.append(index)
+        origins_by_root[index] = {origin}
+        text = (
+            tuple(row[i] for i in exact_indices),
+            " ".join(normalize(row[i]) for i in fuzzy_indices),
+        )
+        texts.append(text)
+        first_index = first_index_by_text.setdefault(text, index)
+        if first_index == index or not union(first_index, index):
+            distinct_text_indices.append(index)
+
+    # mapping: (exact values, band number, band values) -> indices of the entries
+    buckets: Dict[Tuple[tuple, int, tuple], List[int]] = {}
+    shingles_by_index: Dict[int, FrozenSet[str]] = {}
+    for index in distinct_text_indices:
+        exact_values, text = texts[index]
+        shingles = get_shingles(text)
+        if not shingles:
+            continue
+        shingles_by_index[index] = shingles
+        signature = get_signature(shingles)
+        compared = set()
+        for band in range(0, NUM_PERMUTATIONS, ROWS_PER_BAND):
+            bucket = buckets.setdefault(
+                (exact_values, band, signature[band:band + ROWS_PER_BAND]),
+                [],
+            )
+            for candidate in bucket[-MAX_CANDIDATES_PER_BUCKET:]:
+                if candidate in compared:
+                    continue
+                compared.add(candidate)
+                if jaccard_similarity(shingles, shingles_by_index[candidate]) >= threshold:
+                    union(candidate, index)
+            bucket.append(index)
+
+    return {
+        keys[index]: keys[find(index)]
+        for index in range(len(keys))
+        if find(index) != index
+    }
@@ -0,0 +1,128 @@
+from concurrent.futures import (
+    Executor,
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Set, Tuple
+
+
+EXECUTOR_KINDS = ("process", "thread")
+# nodes that are run one after another (see 'get_cycles')
+Unit = Tuple[Hashable, ...]
+
+
+def create_executor(kind: str, max_workers: int) -> Executor:
+    """'process' is meant for CPU bound work like hashing,
+    'thread' for I/O bound work (and objects that cannot be pickled)."""
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    raise ValueError(f"Unknown executor '{kind}'. Available: {', '.join(EXECUTOR_KINDS)}")
+
+
+def run_in_dependency_order(
+    nodes: Iterable[Hashable],
+    dependencies_of: Callable[[Hashable], Set[Hashable]],
+    run: Callable[[Hashable], Any],
+    max_workers: int,
+) -> Dict[Hashable, Any]:
+    """Calls 'run' for each node in a thread pool
+    as soon as all of the node's dependencies have been run.
+    Nodes depending on each other (a cycle) are run one after another (in the given order)
+    by the same worker, like in a sequential run.
+    Dependencies that are not in 'nodes' are ignored.
+    Returns the results by node. The first exception of 'run' is raised.
+    """
+    nodes = list(nodes)
+    node_set = set(nodes)
+    dependencies = {
+        node: (set(dependencies_of(node)) & node_set) - {node}
+        for node in nodes
+    }
+    units = get_cycles(nodes, dependencies)
+    unit_of = {node: unit for unit in units for node in unit}
+    remaining_dependencies = {
+        unit: {unit_of[dependency] for node in unit for dependency in dependencies[node]} - {unit}
+        for unit in units
+    }
+    dependents: Dict[Unit, Set[Unit]] = {unit: set() for unit in units}
+    for unit, unit_dependencies in remaining_dependencies.items():
+        for dependency in unit_dependencies:
+            dependents[dependency].add(unit)
+
+    def run_unit(unit: Unit) -> List[Any]:
+        return [run(node) for node in unit]
+
+    results: Dict[Hashable, Any] = {}
+    # in the given order so ties are resolved like in a sequential run
+    ready = [unit for unit in units if len(remaining_dependencies[unit]) == 0]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while len(ready) > 0 or len(running) > 0:
+            for unit in ready:
+                running[executor.submit(run_unit, unit)] = unit
+            ready = []
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                unit = running.pop(future)
+                results.update(zip(unit, future.result()))
+                for dependent in dependents[unit]:
+                    remaining_dependencies[dependent].discard(unit)
+                    if len(remaining_dependencies[dependent]) == 0:
+                        ready.append(dependent)
+    return results
+
+
+def get_cycles(
+    nodes: List[Hashable],
+    dependencies: Dict[Hashable, Set[Hashable]],
+) -> List[Unit]:
+    """Returns the strongly connected components of the dependency graph
+    (nodes that depend on each other, directly or indirectly, or single nodes)
+    in the order of their first node in 'nodes'. The nodes of a component keep their order.
+    """
+    # Tarjan's algorithm (iterative so long chains do not exceed the recursion limit)
+    index_of: Dict[Hashable, int] = {}
+    lowlink: Dict[Hashable, int] = {}
+    stack: List[Hashable] = []
+    on_stack: Set[Hashable] = set()
+    component_of: Dict[Hashable, int] = {}
+    num_components = 0
+    for root in nodes:
+        if root in index_of:
+            continue
+        index_of[root] = lowlink[root] = len(index_of)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(dependencies[root]))]
+        while work:
+            node, children = work[-1]
+            child = next(children, None)
+            if child is not None:
+                if child not in index_of:
+                    index_of[child] = lowlink[child] = len(index_of)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(dependencies[child])))
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[child])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component_of[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
+    nodes_by_component: Dict[int, List[Hashable]] = {}
+    for node in nodes:
+        nodes_by_component.setdefault(component_of[node], []).append(node)
+    return [tuple(component_nodes) for component_nodes in nodes_by_component.values()]
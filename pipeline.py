@@ -0,0 +1,201 @@
+"""Overlapping the reading, hashing/deduplicating and writing of a table with asyncio.
+
+The stages run concurrently and are connected by bounded queues:
+- merging: read pages -> hash pages -> put the rows into the RowsDict
+- copying: read pages -> insert pages into the target
+A stage waits while the next stage has 'pipeline_queue_size' pages left to process,
+so the memory used by the queues stays constant however large the table is.
+
+SQLAlchemy 1.3 has no async engines, so every stage doing blocking work
+runs it in a thread of its own (with its own session) because connections
+must be used by the thread that opened them (SQLite).
+Rows are put into the RowsDict by the event loop's thread only.
+Writing merged rows cannot be overlapped with reading because the new keys
+are only known after all rows have been read (see 'merge.adjust_relationships').
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+from typing import Any, Awaitable, Callable, Iterator, List
+
+from sqlalchemy import Table
+
+import db_helpers
+from DbData import DbData
+import hashing
+from MergeReport import estimate_size
+from MergeSettings import MergeSettings
+from strategies import RowsDict
+
+
+# marks the end of a queue
+END_OF_PAGES = None
+
+
+def put_table_rows(
+    merged_rows: RowsDict,
+    db: DbData,
+    table: Table,
+    origin: Any,
+    settings: MergeSettings,
+) -> None:
+    """Streams all rows of 'table' into 'merged_rows' (like 'merge.put_table_rows')
+    while the next pages are read and hashed."""
+    asyncio.run(_put_table_rows(merged_rows, db, table, origin, settings))
+
+
+def copy_table(source: DbData, target: DbData, table_name: str, settings: MergeSettings) -> None:
+    """Copies the table of 'source' into 'target' (like 'db_helpers.copy_table')
+    while the next pages are read."""
+    table = db_helpers.create_copied_table(source, target, table_name)
+    asyncio.run(_copy_table(source, target, table, settings))
+
+
+async def _put_table_rows(
+    merged_rows: RowsDict,
+    db: DbData,
+    table: Table,
+    origin: Any,
+    settings: MergeSettings,
+) -> None:
+    report = settings.report
+    row_digest = hashing.row_digest_for_name(settings.row_digest)
+    pages: asyncio.Queue = asyncio.Queue(settings.pipeline_queue_size)
+    hashed_pages: asyncio.Queue = asyncio.Queue(settings.pipeline_queue_size)
+
+    async def hash_pages() -> None:
+        seconds = 0.0
+        num_rows = 0
+
+        def hash_page(page: List[tuple]) -> List[int]:
+            nonlocal seconds
+            start = time.perf_counter()
+            row_hashes = hashing.hash_rows(table, page, row_digest)
+            seconds += time.perf_counter() - start
+            return row_hashes
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while True:
+                page = await pages.get()
+                if page is END_OF_PAGES:
+                    break
+                row_hashes = await _run_in_executor(executor, lambda: hash_page(page))
+                await hashed_pages.put((page, row_hashes))
+                num_rows += len(page)
+        await hashed_pages.put(END_OF_PAGES)
+        report.record("hash", table.name, seconds=seconds, rows=num_rows)
+
+    async def put_rows() -> None:
+        seconds = 0.0
+        num_rows = 0
+        num_merged_rows = len(merged_rows)
+        while True:
+            item = await hashed_pages.get()
+            if item is END_OF_PAGES:
+                break
+            page, row_hashes = item
+            start = time.perf_counter()
+            for row, row_hash in zip(page, row_hashes):
+                merged_rows.put(row_hash, row, origin)
+            seconds += time.perf_counter() - start
+            num_rows += len(page)
+            # Let the other stages continue.
+            await asyncio.sleep(0)
+        report.record(
+            "dedup",
+            table.name,
+            seconds=seconds,
+            rows=num_rows,
+            duplicates=num_rows - (len(merged_rows) - num_merged_rows),
+        )
+
+    await _run_stages(
+        _read_pages(db, table, pages, settings),
+        hash_pages(),
+        put_rows(),
+    )
+
+
+async def _copy_table(
+    source: DbData,
+    target: DbData,
+    table: Table,
+    settings: MergeSettings,
+) -> None:
+    pages: asyncio.Queue = asyncio.Queue(settings.pipeline_queue_size)
+
+    async def insert_pages() -> None:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            writing_target = target.with_new_session()
+            try:
+                while True:
+                    page = await pages.get()
+                    if page is END_OF_PAGES:
+                        break
+                    await _run_in_executor(
+                        executor,
+                        lambda page=page: db_helpers.insert_rows(
+                            writing_target,
+                            table,
+                            page,
+                            settings.batch_size,
+                            settings.multi_values_insert,
+                        ),
+                    )
+            finally:
+                await _run_in_executor(executor, writing_target.session.close)
+
+    await _run_stages(_read_pages(source, table, pages, settings), insert_pages())
+
+
+async def _read_pages(
+    db: DbData,
+    table: Table,
+    pages: asyncio.Queue,
+    settings: MergeSettings,
+) -> None:
+    """Puts the pages of 'table' into the queue followed by END_OF_PAGES."""
+    report = settings.report
+    seconds = 0.0
+    num_rows = num_bytes = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        reading_db = db.with_new_session()
+        page_iterator: Iterator[List[tuple]] = db_helpers.iter_row_pages(
+            reading_db,
+            table,
+            settings.page_size,
+        )
+        try:
+            while True:
+                start = time.perf_counter()
+                page = await _run_in_executor(executor, lambda: next(page_iterator, END_OF_PAGES))
+                seconds += time.perf_counter() - start
+                if page is END_OF_PAGES:
+                    break
+                num_rows += len(page)
+                if report.count_bytes:
+                    num_bytes += estimate_size(page)
+                await pages.put(page)
+        finally:
+            # The result and the session must be closed by the thread that used them.
+            await _run_in_executor(executor, page_iterator.close)  # type: ignore
+            await _run_in_executor(executor, reading_db.session.close)
+    await pages.put(END_OF_PAGES)
+    report.record("read", table.name, seconds=seconds, rows=num_rows, bytes=num_bytes)
+
+
+async def _run_in_executor(executor: ThreadPoolExecutor, func: Callable[[], Any]) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(executor, func)
+
+
+async def _run_stages(*stages: Awaitable[None]) -> None:
+    """Runs the stages concurrently. If one fails the others are cancelled
+    (so no stage waits forever for a full or empty queue) and the error is raised."""
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,74 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine, Column, ForeignKey, Integer, String
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.declarative import declarative_base
+
+import bulk_copy
+import db_helpers
+
+
+class BulkCopyTest(unittest.TestCase):
+
+    SQLITE_FILE = "test.db"
+    SQLITE_FILE_TARGET = "test_target.db"
+    DB_URL = f"sqlite:///{SQLITE_FILE}"
+    DB_URL_TARGET = f"sqlite:///{SQLITE_FILE_TARGET}"
+
+    def setUp(self):
+        Base = declarative_base()
+        # pylint: disable=unused-variable
+        class User(Base): # type: ignore
+            __tablename__ = "users"
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+        # pylint: disable=unused-variable
+        class Order(Base): # type: ignore
+            __tablename__ = "orders"
+            id = Column(Integer, primary_key=True)
+            user_id = Column(Integer, ForeignKey("users.id"))
+
+        Base.metadata.create_all(bind=create_engine(self.DB_URL))
+        self.db = db_helpers.get_reflected_db(self.DB_URL)
+        self.target = db_helpers.get_reflected_db(self.DB_URL_TARGET)
+        db_helpers.insert_rows(self.db, db_helpers.get_table(self.db, "users"), [
+            (1, "testuser1"),
+            (2, "testuser2"),
+        ])
+        db_helpers.insert_rows(self.db, db_helpers.get_table(self.db, "orders"), [
+            (1, 2),
+        ])
+
+    def tearDown(self):
+        os.remove(self.SQLITE_FILE)
+        os.remove(self.SQLITE_FILE_TARGET)
+
+    ###########################################################################
+    # TESTS
+    def test_supports_native_copy(self):
+        def supports(source_url, target_url):
+            return bulk_copy.supports_native_copy(make_url(source_url), make_url(target_url))
+
+        self.assertTrue(supports("sqlite:///source.db", "sqlite:///target.db"))
+        self.assertFalse(supports("sqlite://", "sqlite:///target.db"))
+        self.assertTrue(supports(
+            "postgresql://user:pw@host1/source",
+            "postgresql://user:pw@host2/target",
+        ))
+        self.assertFalse(supports(
+            "postgresql+pg8000://user:pw@host1/source",
+            "postgresql://user:pw@host2/target",
+        ))
+
+    def test_copy_table_natively(self):
+        for table_name in ("users", "orders"):
+            bulk_copy.copy_table_natively(self.db, self.target, table_name)
+        self.assertEqual(self.target.changed_table_names, {"users", "orders"})
+        db_helpers.reflect_changed_tables(self.target)
+        self.assertEqual(
+            db_helpers.get_rows(self.target, "users"),
+            [(1, "testuser1"), (2, "testuser2")],
+        )
+        self.assertEqual(db_helpers.get_rows(self.target, "orders"), [(1, 2)])
@@ -0,0 +1,61 @@
+import os
+import unittest
+
+from Checkpoint import Checkpoint
+
+
+class CheckpointTest(unittest.TestCase):
+
+    CHECKPOINT_FILE = "test_checkpoint.db"
+    RUN = {"sources": ["a", "b"]}
+
+    def tearDown(self):
+        if os.path.exists(self.CHECKPOINT_FILE):
+            os.remove(self.CHECKPOINT_FILE)
+
+    ###########################################################################
+    # TESTS
+    def test_progress_is_persisted(self):
+        checkpoint = Checkpoint(self.CHECKPOINT_FILE, self.RUN)
+        self.assertFalse(checkpoint.started)
+        checkpoint.start()
+        self.assertEqual(checkpoint.common_tables({"users"}), {"users"})
+        checkpoint.table_copied("orders")
+        checkpoint.close()
+
+        checkpoint = Checkpoint(self.CHECKPOINT_FILE, self.RUN)
+        self.assertTrue(checkpoint.started)
+        self.assertEqual(checkpoint.completed_steps, 0)
+        # determined by the first call
+        self.assertEqual(checkpoint.common_tables({"users", "orders"}), {"users"})
+        self.assertTrue(checkpoint.is_copied("orders"))
+        self.assertFalse(checkpoint.is_copied("users"))
+
+        checkpoint.complete_step()
+        self.assertEqual(checkpoint.completed_steps, 1)
+        self.assertTrue(checkpoint.started)
+        self.assertFalse(checkpoint.is_copied("orders"))
+        self.assertEqual(checkpoint.common_tables({"orders"}), {"orders"})
+        checkpoint.remove()
+        self.assertFalse(os.path.exists(self.CHECKPOINT_FILE))
+
+    def test_merged_rows(self):
+        checkpoint = Checkpoint(self.CHECKPOINT_FILE, self.RUN)
+        self.assertFalse(checkpoint.has_merged_rows)
+        rows = [[1, "testuser1", "pw1"], [2, "testuser2", "pw2"], [3, "testuser3", "pw3"]]
+        checkpoint.save_merged_rows({"users": rows, "orders": []})
+        self.assertTrue(checkpoint.has_merged_rows)
+        self.assertEqual(checkpoint.merged_table_names(), ["users", "orders"])
+        self.assertEqual(list(checkpoint.iter_merged_rows("users")), rows)
+        self.assertEqual(list(checkpoint.iter_merged_rows("users", 1, page_size=1)), rows[1:])
+        self.assertEqual(list(checkpoint.iter_merged_rows("orders")), [])
+        checkpoint.complete_step()
+        self.assertFalse(checkpoint.has_merged_rows)
+        checkpoint.close()
+
+    def test_other_run(self):
+        Checkpoint(self.CHECKPOINT_FILE, self.RUN).close()
+        self.assertRaises(
+            ValueError,
+            lambda: Checkpoint(self.CHECKPOINT_FILE, {"sources": ["a", "c"]}),
+        )
@@ -0,0 +1,71 @@
+import pickle
+import unittest
+
+from strategies import CompactRowsDict, MergeStrategy, RowsDict
+
+
+class PseudoMergeStrategy(MergeStrategy):
+
+    def _choose_row(self, *rows_data) -> tuple:
+        return rows_data[0][0]
+
+
+class CompactRowsDictTest(unittest.TestCase):
+
+    @classmethod
+    def get_test_rows(cls):
+        return [
+            (0, (1, "source0"), "source"),
+            (0, (2, "source0"), "target"),
+            (1, (3, "source2"), "source"),
+            (2, ("pk3", "target0"), "target"),
+            (0, (4, "source0"), "target"),
+        ]
+
+    def setUp(self):
+        self.rows_dict = CompactRowsDict("pseudo_table", PseudoMergeStrategy())
+        self.reference = RowsDict("pseudo_table", PseudoMergeStrategy())
+        for row_hash, row, origin in self.get_test_rows():
+            self.rows_dict.put(row_hash, row, origin)
+            self.reference.put(row_hash, row, origin)
+
+    ###########################################################################
+    # TESTS
+    def test_rows_view_equals_rows_dict(self):
+        self.assertEqual(list(self.rows_dict.rows.items()), list(self.reference.rows.items()))
+        self.assertEqual(self.rows_dict.get(0), self.reference.get(0))
+        self.assertIsNone(self.rows_dict.get(3))
+        self.assertEqual(list(self.rows_dict), list(self.reference))
+        self.assertEqual(len(self.rows_dict), 3)
+
+    def test_values(self):
+        self.assertEqual(
+            [
+                (row, origin, frozenset(primary_keys))
+                for row, origin, primary_keys in self.rows_dict.values()
+            ],
+            list(self.reference.values())
+        )
+
+    def test_get_rows(self):
+        self.assertEqual(list(self.rows_dict.get_rows()), list(self.reference.get_rows()))
+
+    def test_compact_storage(self):
+        # one origin code per origin, non-integer primary keys fall back to a list
+        self.assertEqual(self.rows_dict._origins, ["source", "target"])
+        self.assertEqual(list(self.rows_dict._origin_codes), [0, 0, 1])
+        self.assertEqual(list(self.rows_dict._primary_keys), [1, 3, "pk3"])
+        self.assertEqual(self.rows_dict._more_primary_keys, {0: [(1, 2), (1, 4)]})
+
+    def test_update(self):
+        other = CompactRowsDict("pseudo_table", PseudoMergeStrategy())
+        other.put(1, (5, "source2"), "other")
+        self.rows_dict.update(other, hash)
+        self.assertEqual(
+            self.rows_dict.get(1),
+            ([3, "source2"], "source", frozenset([("source", 3), ("other", 5)]))
+        )
+
+    def test_pickle(self):
+        unpickled = pickle.loads(pickle.dumps(self.rows_dict))
+        self.assertEqual(list(unpickled.rows.items()), list(self.reference.rows.items()))
@@ -1,7 +1,7 @@
 import os
 import unittest
 
-from sqlalchemy import create_engine, Column, ForeignKey, Integer, Numeric, String, Table
+from sqlalchemy import create_engine, Column, ForeignKey, Integer, MetaData, Numeric, String, Table
 from sqlalchemy.ext.declarative import declarative_base
 
 import db_helpers
@@ -67,6 +67,17 @@ class DbHelpersTest(unittest.TestCase):
             return db_helpers.get_reflected_db("asdf")
         self.assertRaises(ValueError, invalid_db_url)
 
+    def test_engines_are_shared(self):
+        engine = db_helpers.get_engine(self.DB_URL)
+        self.assertIs(engine, self.db.engine)
+        self.assertIs(db_helpers.get_reflected_db(self.DB_URL).engine, engine)
+        # pool options
+        self.assertIsNot(db_helpers.get_engine(self.DB_URL, pool_pre_ping=True), engine)
+        # ignored by SQLite
+        self.assertIsNotNone(db_helpers.get_engine(self.DB_URL, pool_size=2))
+        # every in-memory database is a new one
+        self.assertIsNot(db_helpers.get_engine(self.DB2_URL), self.db2.engine)
+
     def test_get_table(self):
         user_table = db_helpers.get_table(self.db, "users")
         order_table = db_helpers.get_table(self.db, "orders")
@@ -85,10 +96,71 @@ class DbHelpersTest(unittest.TestCase):
         queried_rows = self.db.session.query(self.tables["users"]).all()
         self.assertEqual(queried_rows, DbHelpersTest.get_test_data())
 
+    def test_insert_rows_in_batches(self):
+        for multi_values in (False, True):
+            db_helpers.truncate_table(self.db, "users")
+            db_helpers.insert_rows(
+                self.db,
+                db_helpers.get_table(self.db, "users"),
+                # generator to make sure rows are not required to be a list
+                (row for row in DbHelpersTest.get_test_data()),
+                batch_size=2,
+                multi_values=multi_values,
+            )
+            queried_rows = self.db.session.query(self.tables["users"]).all()
+            self.assertEqual(queried_rows, DbHelpersTest.get_test_data())
+
+    def test_update_and_delete_rows(self):
+        users = db_helpers.get_table(self.db, "users")
+        db_helpers.insert_rows(self.db, users, DbHelpersTest.get_test_data())
+        db_helpers.update_rows(self.db, users, [(2, "testuser2", "new pw2")], batch_size=1)
+        db_helpers.delete_rows(self.db, users, [1, 3], batch_size=1)
+        queried_rows = self.db.session.query(self.tables["users"]).all()
+        self.assertEqual(queried_rows, [(2, "testuser2", "new pw2")])
+
+    def test_upsert_rows(self):
+        users = db_helpers.get_table(self.db, "users")
+        for existing_primary_keys in (None, {1, 2}):
+            db_helpers.truncate_table(self.db, "users")
+            db_helpers.insert_rows(self.db, users, DbHelpersTest.get_test_data()[:2])
+            db_helpers.upsert_rows(
+                self.db,
+                users,
+                [(2, "testuser2", "new pw2"), (3, "testuser3", "pw3")],
+                batch_size=1,
+                existing_primary_keys=existing_primary_keys,
+            )
+            queried_rows = self.db.session.query(self.tables["users"]).all()
+            self.assertEqual(queried_rows, [
+                (1, "testuser1", "pw1"),
+                (2, "testuser2", "new pw2"),
+                (3, "testuser3", "pw3"),
+            ])
+
+    def test_batched(self):
+        self.assertEqual(
+            list(db_helpers.batched(range(5), 2)),
+            [[0, 1], [2, 3], [4]]
+        )
+        self.assertEqual(list(db_helpers.batched([], 2)), [])
+        self.assertRaises(ValueError, lambda: list(db_helpers.batched([1], 0)))
+
     def test_get_rows(self):
         self.test_insert_rows()
         self.assertEqual(db_helpers.get_rows(self.db, "users"), DbHelpersTest.get_test_data())
 
+    def test_iter_row_pages(self):
+        self.test_insert_rows()
+        pages = list(db_helpers.iter_row_pages(self.db, self.tables["users"], page_size=2))
+        self.assertEqual(
+            pages,
+            [DbHelpersTest.get_test_data()[:2], DbHelpersTest.get_test_data()[2:]]
+        )
+        self.assertEqual(
+            list(db_helpers.iter_rows(self.db, self.tables["users"], page_size=2)),
+            DbHelpersTest.get_test_data()
+        )
+
     def test_truncate_table(self):
         self.test_insert_rows()
         db_helpers.truncate_table(self.db, "users")
@@ -107,9 +179,27 @@ class DbHelpersTest(unittest.TestCase):
         )
         # no model because no 2nd reflection has taken place
         self.assertNotIn("users", self.db2.base.metadata)
-        # re-reflecting does NOT work...
-        # self.db2 = db_helpers.get_reflected_db(self.DB2_URL)
-        # self.assertIn("users", self.db2.base.metadata)
+        self.assertEqual(self.db2.changed_table_names, {"users"})
+        # only the copied table is reflected
+        db_helpers.reflect_changed_tables(self.db2)
+        self.assertIn("users", self.db2.base.metadata)
+        self.assertEqual(self.db2.changed_table_names, set())
+        self.assertEqual(db_helpers.get_rows(self.db2, "users"), DbHelpersTest.get_test_data())
+
+    def test_copy_table_with_referenced_tables(self):
+        db_helpers.copy_table(self.db, self.db2, "orders")
+        self.assertEqual(set(self.db2.inspector.get_table_names()), {"orders", "users"})
+        self.assertEqual(self.db2.changed_table_names, {"orders", "users"})
+        foreign_keys = self.db2.inspector.get_foreign_keys("orders")
+        self.assertEqual([foreign_key["referred_table"] for foreign_key in foreign_keys], ["users"])
+
+    def test_rereflect_removes_dropped_tables(self):
+        self.tables["orders"].drop(bind=self.db.engine)
+        self.db.mark_changed("orders")
+        db_helpers.reflect_changed_tables(self.db)
+        self.assertNotIn("orders", self.tables)
+        self.assertIn("users", self.tables)
+        self.assertEqual(self.db.inspector.get_table_names(), ["users"])
 
     def test_table_structures_equal(self):
         self.assertTrue(db_helpers.table_structures_equal(
@@ -134,3 +224,32 @@ class DbHelpersTest(unittest.TestCase):
             db_helpers.find_referencing_tables_and_columns(self.db, "orders"),
             []
         )
+
+    def test_get_foreign_key_graph(self):
+        graph = db_helpers.get_foreign_key_graph(self.db)
+        self.assertIs(db_helpers.get_foreign_key_graph(self.db), graph)
+        [[table, columns, indices]] = graph.referencing("users")
+        self.assertEqual(
+            [table.name, [col.name for col in columns], indices],
+            ["orders", ["user_id"], [3]]
+        )
+        # reflecting again invalidates the graph
+        db_helpers.rereflect(self.db)
+        self.assertIsNot(db_helpers.get_foreign_key_graph(self.db), graph)
+
+    def test_foreign_key_graph_with_self_reference(self):
+        metadata = MetaData()
+        Table(
+            "categories",
+            metadata,
+            Column("id", Integer, primary_key=True),
+            Column("name", String),
+            Column("parent_id", Integer, ForeignKey("categories.id")),
+        )
+        graph = db_helpers.ForeignKeyGraph(metadata)
+        [[table, columns, indices]] = graph.referencing("categories")
+        self.assertEqual(
+            [table.name, [col.name for col in columns], indices],
+            ["categories", ["parent_id"], [2]]
+        )
+        self.assertEqual(graph.referencing("unknown"), [])
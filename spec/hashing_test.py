@@ -0,0 +1,122 @@
+import unittest
+
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table
+
+import hashing
+from merge import hash_row
+
+try:
+    import numpy  # noqa: F401 pylint: disable=unused-import
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+
+class HashingTest(unittest.TestCase):
+
+    def setUp(self):
+        metadata = MetaData()
+        self.users = Table(
+            "users",
+            metadata,
+            Column("id", Integer, primary_key=True),
+            Column("name", String),
+        )
+        self.orders = Table(
+            "orders",
+            metadata,
+            Column("id", Integer, primary_key=True),
+            Column("items", String),
+            Column("total", String),
+            Column("user_id", Integer, ForeignKey("users.id")),
+        )
+        self.keys_only = Table(
+            "keys_only",
+            metadata,
+            Column("id", Integer, primary_key=True),
+        )
+
+    ###########################################################################
+    # TESTS
+    def test_get_indices_for_hashing(self):
+        self.assertEqual(hashing.get_indices_for_hashing(self.users), [1])
+        self.assertEqual(hashing.get_indices_for_hashing(self.orders), [1, 2])
+        self.assertEqual(hashing.get_indices_for_hashing(self.keys_only), [])
+
+    def test_hashing_plan(self):
+        self.assertEqual(hashing.get_hashing_plan(self.users)((1, "a")), ("a", ))
+        self.assertEqual(hashing.get_hashing_plan(self.orders)((1, "i", "2.0", 3)), ("i", "2.0"))
+        self.assertEqual(hashing.get_hashing_plan(self.keys_only)((1, )), ())
+
+    def test_hashing_plan_is_cached(self):
+        self.assertIs(
+            hashing.get_hashing_plan(self.orders),
+            hashing.get_hashing_plan(self.orders)
+        )
+
+    def test_hash_rows(self):
+        rows = [(1, "i", "2.0", 3), (2, "i", "2.0", 4), (3, "j", "2.0", 3)]
+        hashes = hashing.hash_rows(self.orders, rows)
+        self.assertEqual(hashes, [hash_row(self.orders, row) for row in rows])
+        # keys are ignored
+        self.assertEqual(hashes[0], hashes[1])
+        self.assertNotEqual(hashes[0], hashes[2])
+
+    def test_blake2b_row_digest(self):
+        row_digest = hashing.Blake2bRowDigest()
+        # stable across processes (unlike 'hash' for strings)
+        self.assertEqual(
+            row_digest.digest(("a", 1, None)),
+            103921960223522634625595761685175813934
+        )
+        # values of different types never collide by encoding
+        self.assertEqual(
+            len({row_digest.digest(values) for values in [(1, ), ("1", ), (True, ), (1.0, )]}),
+            4
+        )
+        # the encoding of tuples is unambiguous
+        self.assertNotEqual(row_digest.digest(("ab", "c")), row_digest.digest(("a", "bc")))
+
+    def test_row_digest_for_name(self):
+        self.assertIsInstance(hashing.row_digest_for_name("blake2b"), hashing.Blake2bRowDigest)
+        self.assertIsInstance(hashing.row_digest_for_name("builtin"), hashing.BuiltinRowDigest)
+        self.assertRaises(ValueError, lambda: hashing.row_digest_for_name("md5"))
+
+    @unittest.skipUnless(numpy_available, "requires NumPy")
+    def test_columnar_row_digest(self):
+        row_digest = hashing.ColumnarRowDigest()
+        rows_values = [
+            ("a", 1, 1.5),
+            ("a", 1, 1.5),
+            ("b", 1, 1.5),
+            ("a", None, 1.5),
+            ("a" * 1000, 2**70, None),
+            ("ä\0", -1, 0.0),
+        ]
+        digests = row_digest.digest_rows(rows_values)
+        self.assertEqual(digests[0], digests[1])
+        self.assertEqual(len(set(digests)), 5)
+        # independent of the other rows of the page
+        # (vectorized columns vs. mixed types vs. single rows)
+        self.assertEqual(digests, [row_digest.digest(values) for values in rows_values])
+        self.assertEqual(
+            row_digest.digest_rows([("a", 1, 1.5), (1, "a", True)])[0],
+            digests[0],
+        )
+        self.assertEqual(row_digest.digest_rows([]), [])
+        self.assertEqual(row_digest.digest(()), row_digest.digest(()))
+        # stable across processes
+        self.assertEqual(row_digest.digest(("a", 1, None)), 4628679937993626651)
+        self.assertEqual(
+            len({row_digest.digest(values) for values in [(1, ), ("1", ), (True, ), (1.0, )]}),
+            4
+        )
+
+    @unittest.skipUnless(numpy_available, "requires NumPy")
+    def test_hash_rows_with_columnar_row_digest(self):
+        row_digest = hashing.row_digest_for_name("columnar")
+        rows = [(1, "i", "2.0", 3), (2, "i", "2.0", 4), (3, "j", None, 3)]
+        hashes = hashing.hash_rows(self.orders, rows, row_digest)
+        self.assertEqual(hashes, [hash_row(self.orders, row, row_digest) for row in rows])
+        self.assertEqual(hashes[0], hashes[1])
+        self.assertNotEqual(hashes[0], hashes[2])
@@ -0,0 +1,82 @@
+import json
+import os
+import unittest
+
+from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+import db_helpers
+from Input import Input
+from merge import merge
+from MergeState import MergeState
+import strategies
+
+
+class IncrementalMergeTest(unittest.TestCase):
+
+    SQLITE_FILE = "test.db"
+    SQLITE_FILE_TARGET = "test_target.db"
+    MERGE_STATE_FILE = "test_merge_state.db"
+    DB_URL = f"sqlite:///{SQLITE_FILE}"
+    DB_URL_TARGET = f"sqlite:///{SQLITE_FILE_TARGET}"
+
+    def setUp(self):
+        Base = declarative_base()
+        # pylint: disable=unused-variable
+        class Item(Base): # type: ignore
+            __tablename__ = "items"
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+            updated_at = Column(Integer)
+
+        Base.metadata.create_all(bind=create_engine(self.DB_URL))
+        self.db = db_helpers.get_reflected_db(self.DB_URL)
+        self.items = db_helpers.get_table(self.db, "items")
+        db_helpers.insert_rows(self.db, self.items, [
+            (1, "item1", 1),
+            (2, "item2", 1),
+        ])
+
+    def tearDown(self):
+        for path in (self.SQLITE_FILE, self.SQLITE_FILE_TARGET, self.MERGE_STATE_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def merge(self):
+        target = merge(Input(
+            db_urls=[self.DB_URL],
+            target_db_url=self.DB_URL_TARGET,
+            strategy=strategies.SourceMergeStrategy(),
+            merge_mode="incremental",
+            merge_state_file=self.MERGE_STATE_FILE,
+            updated_at_column="updated_at",
+        ))
+        rows = sorted(tuple(row) for row in db_helpers.get_rows(target, "items"))
+        target.session.close()
+        return rows
+
+    ###########################################################################
+    # TESTS
+    def test_changed_rows(self):
+        self.assertEqual(self.merge(), [(1, "item1", 1), (2, "item2", 1)])
+
+        self.db.session.execute(
+            self.items.update().where(self.items.c.id == 2).values(name="item2 v2", updated_at=2)
+        )
+        self.db.session.commit()
+        db_helpers.insert_rows(self.db, self.items, [(3, "item3", 2)])
+        # The changed row is updated in place.
+        self.assertEqual(
+            self.merge(),
+            [(1, "item1", 1), (2, "item2 v2", 2), (3, "item3", 2)],
+        )
+
+    def test_merge_state(self):
+        self.merge()
+        state = MergeState(self.MERGE_STATE_FILE)
+        self.assertFalse(state.empty)
+        source = json.dumps(db_helpers.get_db_identity(self.db))
+        self.assertEqual(state.high_water_marks(source, "items"), (2, 1))
+        self.assertEqual(state.new_primary_keys(source, "items", [1, 2, 3]), {1: 1, 2: 2})
+        self.assertEqual(state.count_represented_rows("items", 1), 1)
+        state.close()
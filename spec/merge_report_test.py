@@ -0,0 +1,52 @@
+import pickle
+import unittest
+
+from MergeReport import estimate_size, MergeReport
+
+
+class MergeReportTest(unittest.TestCase):
+
+    ###########################################################################
+    # TESTS
+    def test_records_are_summed_up_per_phase_and_table(self):
+        report = MergeReport()
+        report.record("read", "users", seconds=1.0, rows=10)
+        report.record("read", "users", seconds=0.5, rows=5, bytes=100)
+        report.record("read", "orders", rows=3)
+        self.assertEqual(
+            report.get("read", "users"),
+            {"seconds": 1.5, "rows": 15, "duplicates": 0, "bytes": 100},
+        )
+        self.assertEqual(report.get("dedup", "users")["rows"], 0)
+        report_dict = report.to_dict()
+        self.assertEqual(
+            [(entry["phase"], entry["table"]) for entry in report_dict["entries"]],
+            [("read", "users"), ("read", "orders")],
+        )
+        self.assertEqual(report_dict["totals"]["read"]["rows"], 18)
+
+    def test_phase_records_time_and_counters(self):
+        recorded = []
+        report = MergeReport([lambda *args: recorded.append(args)])
+        with report.phase("insert", "users", rows=2) as counters:
+            counters["bytes"] = 16
+        entry = report.get("insert", "users")
+        self.assertGreater(entry["seconds"], 0)
+        self.assertEqual((entry["rows"], entry["bytes"]), (2, 16))
+        self.assertEqual(len(recorded), 1)
+        phase, table_name, counters = recorded[0]
+        self.assertEqual((phase, table_name, counters["rows"]), ("insert", "users", 2))
+
+    def test_unknown_phase(self):
+        self.assertRaises(ValueError, lambda: MergeReport().record("unknown"))
+
+    def test_pickled_report_is_empty(self):
+        report = MergeReport([print], count_bytes=True)
+        report.record("read", "users", rows=1)
+        copy = pickle.loads(pickle.dumps(report))
+        self.assertEqual(copy.to_dict()["entries"], [])
+        self.assertEqual(copy.hooks, [])
+        self.assertTrue(copy.count_bytes)
+
+    def test_estimate_size(self):
+        self.assertEqual(estimate_size([(1, "abc", None), (2, b"de", 1.5)]), 8 + 3 + 8 + 2 + 8)
@@ -1,3 +1,4 @@
+import json
 import os
 from typing import Dict, List, Union
 import unittest
@@ -8,9 +9,15 @@ from sqlalchemy.ext.declarative import declarative_base
 
 import db_helpers
 from Input import Input
-from merge import merge
+from merge import get_preserved_primary_keys, merge
 import strategies
 
+try:
+    import numpy  # noqa: F401 pylint: disable=unused-import
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
 
 class MergeTest(unittest.TestCase):
 
@@ -89,8 +96,380 @@ class MergeTest(unittest.TestCase):
     # TESTS
     def test_source_merge(self):
         input_data = Input(**self.get_input_kwargs(), strategy=strategies.SourceMergeStrategy())
-        target = merge(input_data)
+        self.assert_source_merged(merge(input_data))
+
+    def test_n_way_merge(self):
+        input_data = Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            merge_mode="n_way",
+        )
+        self.assert_source_merged(merge(input_data))
+
+    def test_n_way_merge_with_parallel_sources(self):
+        for source_executor in ("thread", "process"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode="n_way",
+                source_workers=2,
+                source_executor=source_executor,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    def test_merge_with_parallel_tables(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                table_workers=2,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    def test_merge_spilling_rows_to_disk(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                max_rows_in_memory=2,
+                source_workers=2 if merge_mode == "n_way" else 1,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    def test_merge_spilling_rows_to_disk_equals_merge_in_memory(self):
+        for settings in (
+            {"preserve_primary_keys": True},
+            {"incremental_write": True},
+            {"table_workers": 2},
+            {"merge_mode": "n_way", "preserve_primary_keys": True},
+        ):
+            rows_by_max_rows_in_memory = []
+            for max_rows_in_memory in (0, 2):
+                input_data = Input(
+                    **self.get_input_kwargs(),
+                    strategy=strategies.SourceMergeStrategy(),
+                    max_rows_in_memory=max_rows_in_memory,
+                    **settings,
+                )
+                target = merge(input_data)
+                rows_by_max_rows_in_memory.append({
+                    table_name: db_helpers.get_rows(target, table_name)
+                    for table_name in ("users", "orders")
+                })
+                target.session.close()
+                os.remove(self.SQLITE_FILE_TARGET)
+            self.assertEqual(rows_by_max_rows_in_memory[1], rows_by_max_rows_in_memory[0])
+
+    def test_merge_with_compact_rows(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                compact_rows=True,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    def test_merge_in_sql(self):
+        input_data = Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            sql_merge=True,
+        )
+        self.assert_source_merged(merge(input_data))
+
+    def test_merge_in_sql_equals_merge_in_python(self):
+        rows_by_settings = []
+        for settings in (
+            {},
+            {"sql_merge": True},
+            {"sql_key_remapping": True},
+            {"incremental_write": True},
+        ):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                **settings,
+            )
+            target = merge(input_data)
+            rows_by_settings.append({
+                table_name: db_helpers.get_rows(target, table_name)
+                for table_name in ("users", "orders")
+            })
+            target.session.close()
+            os.remove(self.SQLITE_FILE_TARGET)
+        self.assertEqual(rows_by_settings[1], rows_by_settings[0])
+        self.assertEqual(rows_by_settings[2], rows_by_settings[0])
+        self.assertEqual(rows_by_settings[3], rows_by_settings[0])
+
+    def test_merge_with_key_remapping_in_sql(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                sql_key_remapping=True,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    def test_merge_with_incremental_write(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                incremental_write=True,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    def test_resume_merge_from_checkpoint(self):
+        checkpoint_file = "test_checkpoint.db"
+        orders2 = db_helpers.get_table(self.db2, "orders")
+        # references a user that does not exist
+        db_helpers.insert_rows(self.db2, orders2, [(7, "9.99", 99)])
+        input_data = Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            checkpoint_file=checkpoint_file,
+        )
+        self.assertRaises(ValueError, lambda: merge(input_data))
+        self.assertTrue(os.path.exists(checkpoint_file))
+
+        # Fix the data and resume: the first database has been merged already.
+        self.db2.session.execute(orders2.delete().where(orders2.c.id == 7))
+        self.db2.session.commit()
+        self.assert_source_merged(merge(input_data))
+        self.assertFalse(os.path.exists(checkpoint_file))
+
+    def test_incremental_merge(self):
+        merge_state_file = "test_merge_state.db"
+        input_data = Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            merge_mode="incremental",
+            merge_state_file=merge_state_file,
+        )
+
+        def rows_of(target, table_name):
+            return set(tuple(row) for row in db_helpers.get_rows(target, table_name))
+
+        try:
+            target = merge(input_data)
+            self.assert_source_merged(target)
+            users = rows_of(target, "users")
+            orders = rows_of(target, "orders")
+            target.session.close()
+
+            # Nothing changed -> nothing is merged.
+            target = merge(input_data)
+            self.assertEqual(rows_of(target, "users"), users)
+            self.assertEqual(rows_of(target, "orders"), orders)
+            target.session.close()
+
+            db_helpers.insert_rows(self.db2, db_helpers.get_table(self.db2, "users"), [
+                (8, "testuser8", "pw8"),
+                # duplicate of a user of the 1st database
+                (9, "testuser1", "pw1"),
+            ])
+            db_helpers.insert_rows(self.db2, db_helpers.get_table(self.db2, "orders"), [
+                (8, "8.00", 8),
+                (9, "9.00", 9),
+            ])
+            target = merge(input_data)
+            new_users = rows_of(target, "users") - users
+            new_orders = rows_of(target, "orders") - orders
+            # The previously merged rows are still there (with the same primary keys).
+            self.assertTrue(users <= rows_of(target, "users"))
+            self.assertEqual([user[1:] for user in new_users], [("testuser8", "pw8")])
+            new_user_id = list(new_users)[0][0]
+            user1_id = [user[0] for user in users if user[1:] == ("testuser1", "pw1")][0]
+            self.assertEqual(
+                set(order[1:] for order in new_orders),
+                {("8.00", new_user_id), ("9.00", user1_id)},
+            )
+        finally:
+            os.remove(merge_state_file)
+
+    def test_incremental_merge_requires_state_file(self):
+        self.assertRaises(ValueError, lambda: Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            merge_mode="incremental",
+        ))
+
+    def test_invalid_source_workers(self):
+        for settings in (
+            {"merge_mode": "n_way", "source_workers": 2, "source_executor": "fiber"},
+            # ignored by the pairwise mode
+            {"merge_mode": "pairwise", "source_workers": 2},
+            # digests of the workers could not be compared
+            {"merge_mode": "n_way", "source_workers": 2, "row_digest": "builtin"},
+        ):
+            self.assertRaises(ValueError, lambda: Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                **settings,
+            ))
+        Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            merge_mode="n_way",
+            source_workers=2,
+            source_executor="thread",
+            row_digest="builtin",
+        )
+
+    def test_merge_with_pipeline(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                pipeline=True,
+                page_size=1,
+                pipeline_queue_size=1,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    @unittest.skipUnless(numpy_available, "requires NumPy")
+    def test_merge_with_columnar_row_digest(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                row_digest="columnar",
+                source_workers=2 if merge_mode == "n_way" else 1,
+            )
+            self.assert_source_merged(merge(input_data))
+
+    def test_merge_preserving_primary_keys(self):
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                preserve_primary_keys=True,
+            )
+            target = merge(input_data)
+            self.assert_source_merged(target)
+            # Only the colliding rows of the 2nd database get new keys.
+            self.assertEqual(sorted(db_helpers.get_rows(target, "users")), [
+                (1, "testuser1", "pw1"),
+                (2, "testuser2 with more data", "pw2"),
+                (3, "testuser3", "pw3"),
+                (4, "testuser4", "pw4"),
+                (5, "testuser2", "pw21"),
+                (6, "testuser3 with more data", "pw3"),
+            ])
+            self.assertEqual(sorted(db_helpers.get_rows(target, "orders")), [
+                (1, "30.12", 1),
+                (2, "12.39", 2),
+                (3, "42.00", 3),
+                (4, "43.00", 4),
+                (5, "51.10", 6),
+                (6, "1.18", 4),
+                (7, "13.37", 5),
+            ])
+            target.session.close()
+
+    def test_get_preserved_primary_keys(self):
+        merged_rows = strategies.RowsDict(
+            table_name="users",
+            strategy=strategies.SourceMergeStrategy(),
+            key_of=lambda row: (row[1], ),
+        )
+        merged_rows.put(1, [1, "a"], "source")
+        merged_rows.put(2, [2, "b"], "source")
+        merged_rows.put(3, [8, "c"], "source")
+        merged_rows.put(1, [5, "a"], "target")
+        merged_rows.put(4, [2, "d"], "target")
+        # 'a' keeps the target's key, 'd' is preferred over 'b'
+        self.assertEqual(get_preserved_primary_keys(merged_rows, "target"), [5, 9, 8, 2])
+        self.assertEqual(get_preserved_primary_keys(merged_rows, None), [1, 2, 8, 9])
+
+    def test_merge_near_duplicates(self):
+        db_helpers.insert_rows(self.db2, db_helpers.get_table(self.db2, "users"), [
+            (8, " TestUser1  ", "pw1"),
+        ])
+        db_helpers.insert_rows(self.db2, db_helpers.get_table(self.db2, "orders"), [
+            (7, "9.99", 8),
+        ])
+        for merge_mode in ("pairwise", "n_way"):
+            input_data = Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode=merge_mode,
+                near_duplicate_columns={"users": ["name"]},
+            )
+            target = merge(input_data)
+            users = db_helpers.get_rows(target, "users")
+            # The 2nd database's row is chosen by the SourceMergeStrategy.
+            self.assertEqual(
+                sorted(user[1:] for user in users),
+                [
+                    (" TestUser1  ", "pw1"),
+                    ("testuser2", "pw21"),
+                    ("testuser2 with more data", "pw2"),
+                    ("testuser3", "pw3"),
+                    ("testuser3 with more data", "pw3"),
+                    ("testuser4", "pw4"),
+                ],
+            )
+            user = target.session.query(self.User).filter_by(password="pw1").one()
+            self.assertEqual({order.total for order in user.orders}, {"30.12", "9.99"})
+            target.session.close()
+
+    def test_merge_with_native_copy(self):
+        input_data = Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            native_copy=True,
+        )
+        self.assert_source_merged(merge(input_data))
+
+    def test_merge_report(self):
+        report_file = "test_report.json"
+        recorded_phases = []
+        input_data = Input(
+            **self.get_input_kwargs(),
+            strategy=strategies.SourceMergeStrategy(),
+            report_file=report_file,
+            hooks=[lambda phase, table_name, counters: recorded_phases.append(phase)],
+        )
+        try:
+            self.assert_source_merged(merge(input_data))
+            with open(report_file) as file:
+                report = json.load(file)
+        finally:
+            if os.path.exists(report_file):
+                os.remove(report_file)
+        entries = {(entry["phase"], entry["table"]): entry for entry in report["entries"]}
+        # The 1st database is copied, the 2nd one is merged into it.
+        self.assertIn(("copy", "users"), entries)
+        self.assertEqual(entries[("read", "users")]["rows"], 7)
+        self.assertEqual(entries[("dedup", "users")]["duplicates"], 1)
+        self.assertEqual(entries[("insert", "users")]["rows"], 6)
+        self.assertGreater(entries[("read", "users")]["bytes"], 0)
+        self.assertEqual(
+            set(report["totals"].keys()),
+            {"reflect", "copy", "read", "hash", "dedup", "remap", "truncate", "insert", "merge"},
+        )
+        self.assertEqual(recorded_phases[-1], "merge")
+        self.assertEqual(set(recorded_phases), set(report["totals"].keys()))
+
+    def test_invalid_merge_mode(self):
+        def invalid_merge_mode():
+            return Input(
+                **self.get_input_kwargs(),
+                strategy=strategies.SourceMergeStrategy(),
+                merge_mode="unknown",
+            )
+        self.assertRaises(ValueError, invalid_merge_mode)
 
+    def assert_source_merged(self, target):
         def strip_ids(rows):
             return [row[1:] for row in rows]
 
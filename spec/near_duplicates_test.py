@@ -0,0 +1,68 @@
+import unittest
+
+from near_duplicates import (
+    find_near_duplicates,
+    get_shingles,
+    get_signature,
+    jaccard_similarity,
+    normalize,
+)
+from strategies import RowsDict, SourceMergeStrategy
+
+
+class NearDuplicatesTest(unittest.TestCase):
+
+    ###########################################################################
+    # TESTS
+    def test_normalize(self):
+        self.assertEqual(normalize("  Alice   SMITH "), "alice smith")
+        self.assertEqual(normalize("Renée Straße"), "renee strasse")
+        self.assertEqual(normalize(42), "42")
+        self.assertEqual(normalize(None), "")
+
+    def test_shingles_and_similarity(self):
+        self.assertEqual(get_shingles("abcd"), {"abc", "bcd"})
+        self.assertEqual(get_shingles("ab"), {"ab"})
+        self.assertEqual(get_shingles(""), set())
+        self.assertEqual(jaccard_similarity(get_shingles("abcd"), get_shingles("abce")), 1 / 3)
+        # stable across runs
+        self.assertEqual(get_signature(get_shingles("abcd")), get_signature(frozenset({"bcd", "abc"})))
+
+    def test_find_near_duplicates(self):
+        entries = [
+            (10, (1, "Alice Smith ", "pw1"), "target"),
+            (11, (2, "Bob", "pw2"), "target"),
+            (20, (1, "alice  smith", "pw1"), "source"),
+            # same name but another password
+            (21, (2, "bob", "pw3"), "source"),
+            (22, (3, "testuser 1", "pw4"), "source"),
+            (12, (3, "testuser1", "pw4"), "target"),
+            (23, (4, "something else", "pw4"), "source"),
+        ]
+        self.assertEqual(
+            find_near_duplicates(entries, [1], [2], threshold=0.6),
+            {20: 10, 12: 22},
+        )
+        # too dissimilar
+        self.assertEqual(find_near_duplicates(entries, [1], [2], threshold=0.7), {20: 10})
+
+    def test_rows_of_the_same_origin_are_not_grouped(self):
+        entries = [
+            (1, (1, "Alice"), "source"),
+            (2, (2, "alice"), "source"),
+            (3, (3, "ALICE"), "target"),
+        ]
+        self.assertEqual(find_near_duplicates(entries, [1], [], threshold=0.8), {3: 1})
+
+    def test_put_grouped(self):
+        merged_rows = RowsDict("users", SourceMergeStrategy(), key_of=lambda row: (row[1], ))
+        merged_rows.put(10, (1, "Alice "), "source")
+        merged_rows.put(20, (2, "Bob"), "source")
+        merged_rows.put(30, (5, "alice"), "target")
+        grouped_rows = RowsDict("users", SourceMergeStrategy(), key_of=lambda row: (row[1], ))
+        grouped_rows.put_grouped(merged_rows, {30: 10})
+        self.assertEqual(dict(grouped_rows.rows), {
+            10: ([1, "Alice "], "source", frozenset({("source", 1), ("target", 5)})),
+            20: ([2, "Bob"], "source", frozenset({("source", 2)})),
+        })
+        self.assertIsNotNone(grouped_rows.key_of)
@@ -0,0 +1,79 @@
+import threading
+import unittest
+
+import parallel
+
+
+class ParallelTest(unittest.TestCase):
+
+    ###########################################################################
+    # TESTS
+    def test_create_executor(self):
+        with parallel.create_executor("thread", 2) as executor:
+            self.assertEqual(executor.submit(sum, [1, 2]).result(), 3)
+        self.assertRaises(ValueError, lambda: parallel.create_executor("fiber", 2))
+
+    def test_run_in_dependency_order(self):
+        # a <- b <- d, a <- c <- d (and a self reference)
+        dependencies = {
+            "a": {"a"},
+            "b": {"a"},
+            "c": {"a", "unknown"},
+            "d": {"b", "c"},
+        }
+        lock = threading.Lock()
+        finished = []
+
+        def run(node):
+            with lock:
+                for dependency in dependencies[node] - {node, "unknown"}:
+                    self.assertIn(dependency, finished)
+                finished.append(node)
+            return node.upper()
+
+        results = parallel.run_in_dependency_order(
+            ["d", "c", "b", "a"],
+            dependencies.get,
+            run,
+            max_workers=3,
+        )
+        self.assertEqual(results, {"a": "A", "b": "B", "c": "C", "d": "D"})
+        self.assertEqual(finished[0], "a")
+        self.assertEqual(finished[-1], "d")
+
+    def test_run_in_dependency_order_with_cycle(self):
+        # a <- b <- c <- b, c <- d
+        dependencies = {"a": set(), "b": {"a", "c"}, "c": {"b"}, "d": {"c"}}
+        lock = threading.Lock()
+        finished = []
+
+        def run(node):
+            with lock:
+                finished.append(node)
+            return node.upper()
+
+        results = parallel.run_in_dependency_order(
+            ["a", "c", "b", "d"],
+            dependencies.get,
+            run,
+            max_workers=2,
+        )
+        self.assertEqual(results, {"a": "A", "b": "B", "c": "C", "d": "D"})
+        # The cycle is run in the given order.
+        self.assertEqual(finished, ["a", "c", "b", "d"])
+
+    def test_get_cycles(self):
+        self.assertEqual(
+            parallel.get_cycles(
+                ["a", "b", "c", "d", "e"],
+                {"a": {"c"}, "b": set(), "c": {"d"}, "d": {"a", "b"}, "e": {"e"}},
+            ),
+            [("a", "c", "d"), ("b", ), ("e", )],
+        )
+
+    def test_run_in_dependency_order_raises(self):
+        def fail(node):
+            raise RuntimeError(node)
+        def run_failing():
+            return parallel.run_in_dependency_order(["a"], lambda node: set(), fail, 2)
+        self.assertRaises(RuntimeError, run_failing)
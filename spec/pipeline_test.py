@@ -0,0 +1,86 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine, Column, Integer, String
+from sqlalchemy.ext.declarative import declarative_base
+
+import db_helpers
+from merge import create_rows_dict, put_table_rows
+from MergeSettings import MergeSettings
+import pipeline
+
+
+class PipelineTest(unittest.TestCase):
+
+    SQLITE_FILE = "test.db"
+    SQLITE_FILE_TARGET = "test_target.db"
+    DB_URL = f"sqlite:///{SQLITE_FILE}"
+    DB_URL_TARGET = f"sqlite:///{SQLITE_FILE_TARGET}"
+
+    def setUp(self):
+        Base = declarative_base()
+        # pylint: disable=unused-variable
+        class User(Base): # type: ignore
+            __tablename__ = "users"
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+        # left by other tests
+        if os.path.exists(self.SQLITE_FILE_TARGET):
+            os.remove(self.SQLITE_FILE_TARGET)
+        Base.metadata.create_all(bind=create_engine(self.DB_URL))
+        self.db = db_helpers.get_reflected_db(self.DB_URL)
+        self.target = db_helpers.get_reflected_db(self.DB_URL_TARGET)
+        self.rows = [(i, f"user {i % 7}") for i in range(1, 51)]
+        db_helpers.insert_rows(self.db, db_helpers.get_table(self.db, "users"), self.rows)
+        self.settings = MergeSettings(page_size=3, pipeline_queue_size=1)
+
+    def tearDown(self):
+        self.db.session.close()
+        self.target.session.close()
+        os.remove(self.SQLITE_FILE)
+        if os.path.exists(self.SQLITE_FILE_TARGET):
+            os.remove(self.SQLITE_FILE_TARGET)
+
+    ###########################################################################
+    # TESTS
+    def test_put_table_rows(self):
+        table = db_helpers.get_table(self.db, "users")
+        merged_rows = create_rows_dict(table, self.settings)
+        pipelined_merged_rows = create_rows_dict(table, self.settings)
+        put_table_rows(merged_rows, self.db, table, "source", self.settings)
+        pipeline.put_table_rows(pipelined_merged_rows, self.db, table, "source", self.settings)
+        self.assertEqual(len(pipelined_merged_rows), 7)
+        self.assertEqual(
+            [(tuple(row), primary_keys) for row, _, primary_keys in pipelined_merged_rows.values()],
+            [(tuple(row), primary_keys) for row, _, primary_keys in merged_rows.values()],
+        )
+        dedup = self.settings.report.get("dedup", "users")
+        self.assertEqual((dedup["rows"], dedup["duplicates"]), (100, 86))
+
+    def test_copy_table(self):
+        pipeline.copy_table(self.db, self.target, "users", self.settings)
+        db_helpers.reflect_changed_tables(self.target)
+        self.assertEqual(db_helpers.get_rows(self.target, "users"), self.rows)
+        self.assertEqual(self.settings.report.get("read", "users")["rows"], 50)
+
+    def test_errors_of_a_stage_are_raised(self):
+        table = db_helpers.get_table(self.db, "users")
+
+        class FailingRowsDict():
+            def __len__(self):
+                return 0
+
+            def put(self, *args):
+                raise ValueError("failed")
+
+        self.assertRaises(
+            ValueError,
+            lambda: pipeline.put_table_rows(
+                FailingRowsDict(),
+                self.db,
+                table,
+                "source",
+                self.settings,
+            ),
+        )
@@ -0,0 +1,65 @@
+from decimal import Decimal
+import os
+import unittest
+
+from merge import get_preserved_primary_keys
+from PrimaryKeyMap import PrimaryKeyMap
+import strategies
+
+
+class PrimaryKeyMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key_map = PrimaryKeyMap()
+
+    def tearDown(self):
+        self.key_map.close()
+
+    ###########################################################################
+    # TESTS
+    def test_get_many(self):
+        self.key_map.put_many("users", [
+            ("source", 1, 3),
+            ("target", 1, 1),
+            (0, "a", 2),
+            (1, Decimal("1.5"), 4),
+        ])
+        self.key_map.put_many("orders", [("source", 1, 5)])
+        self.assertEqual(
+            self.key_map.get_many(
+                "users",
+                [("source", 1), ("target", 1), (0, "a"), (1, Decimal("1.5")), ("source", 2)],
+            ),
+            {("source", 1): 3, ("target", 1): 1, (0, "a"): 2, (1, Decimal("1.5")): 4},
+        )
+        self.assertEqual(self.key_map.get_many("orders", [("source", 1)]), {("source", 1): 5})
+
+    def test_preserve_equals_get_preserved_primary_keys(self):
+        merged_rows = strategies.RowsDict(
+            table_name="users",
+            strategy=strategies.SourceMergeStrategy(),
+            key_of=lambda row: (row[1], ),
+        )
+        merged_rows.put(1, [1, "a"], "source")
+        merged_rows.put(2, [2, "b"], "source")
+        merged_rows.put(3, [8, "c"], "source")
+        merged_rows.put(1, [5, "a"], "target")
+        merged_rows.put(4, [2, "d"], "target")
+        for preferred_origin in ("target", None):
+            candidates = [
+                (row[0], False) if preferred_origin is None else next(
+                    ((pk, True) for origin, pk in primary_keys if origin == preferred_origin),
+                    (row[0], False),
+                )
+                for row, _, primary_keys in merged_rows.values()
+            ]
+            self.assertEqual(
+                list(self.key_map.preserve(candidates)),
+                get_preserved_primary_keys(merged_rows, preferred_origin),
+            )
+        self.assertIsNone(self.key_map.preserve([(1, False), ("a", False)]))
+
+    def test_close_removes_file(self):
+        self.assertTrue(os.path.exists(self.key_map.path))
+        self.key_map.close()
+        self.assertFalse(os.path.exists(self.key_map.path))
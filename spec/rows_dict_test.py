@@ -47,9 +47,50 @@ class RowsDictTest(unittest.TestCase):
         self.assertEqual(
             list(self.rows_dict.rows.items()),
             [
-                (0, (["pk0", "source0"], "source", frozenset(["pk0", "pk1"]))),
-                (1, (["pk2", "source2"], "source", frozenset(["pk2"]))),
-                (2, (["pk3", "target0"], "target", frozenset(["pk3"]))),
+                (
+                    0,
+                    (["pk0", "source0"], "source", frozenset([("source", "pk0"), ("source", "pk1")]))
+                ),
+                (1, (["pk2", "source2"], "source", frozenset([("source", "pk2")]))),
+                (2, (["pk3", "target0"], "target", frozenset([("target", "pk3")]))),
+            ]
+        )
+
+    def test_put_with_hash_collision(self):
+        rows_dict = RowsDict(
+            "pseudo_table",
+            PseudoMergeStrategy(),
+            key_of=lambda row: tuple(row[1:])
+        )
+        rows_dict.put(0, ("pk0", "a"), "source")
+        # same hash but different values
+        rows_dict.put(0, ("pk1", "b"), "source")
+        # duplicate of the 2nd row
+        rows_dict.put(0, ("pk2", "b"), "target")
+        self.assertEqual(
+            list(rows_dict.rows.items()),
+            [
+                (0, (["pk0", "a"], "source", frozenset([("source", "pk0")]))),
+                # the origin is the one of the chosen row
+                (1, (["pk1", "b"], "source", frozenset([("source", "pk1"), ("target", "pk2")]))),
+            ]
+        )
+
+    def test_update(self):
+        self.test_put()
+        other = RowsDict("pseudo_table", PseudoMergeStrategy())
+        other.put(2, ("pk4", "target0"), "target")
+        other.put(3, ("pk5", "target1"), "target")
+        # 3 might be a moved entry (2 is occupied) so its hash is recomputed
+        self.rows_dict.update(other, lambda row: {"target0": 2, "target1": 3}[row[1]])
+        self.assertEqual(
+            list(self.rows_dict.rows.items())[2:],
+            [
+                (
+                    2,
+                    (["pk3", "target0"], "target", frozenset([("target", "pk3"), ("target", "pk4")]))
+                ),
+                (3, (["pk5", "target1"], "target", frozenset([("target", "pk5")]))),
             ]
         )
 
@@ -57,10 +98,16 @@ class RowsDictTest(unittest.TestCase):
         self.test_put()
         self.assertEqual(
             self.rows_dict.get(0),
-            (["pk0", "source0"], "source", frozenset(["pk0", "pk1"]))
+            (["pk0", "source0"], "source", frozenset([("source", "pk0"), ("source", "pk1")]))
+        )
+        self.assertEqual(
+            self.rows_dict.get(1),
+            (["pk2", "source2"], "source", frozenset([("source", "pk2")]))
+        )
+        self.assertEqual(
+            self.rows_dict.get(2),
+            (["pk3", "target0"], "target", frozenset([("target", "pk3")]))
         )
-        self.assertEqual(self.rows_dict.get(1), (["pk2", "source2"], "source", frozenset(["pk2"])))
-        self.assertEqual(self.rows_dict.get(2), (["pk3", "target0"], "target", frozenset(["pk3"])))
 
     def test_get_rows(self):
         self.test_put()
@@ -0,0 +1,77 @@
+import os
+import pickle
+import unittest
+
+from strategies import MergeStrategy, SpillingRowsDict
+
+
+class PseudoMergeStrategy(MergeStrategy):
+
+    def _choose_row(self, *rows_data) -> tuple:
+        return rows_data[0][0]
+
+
+class SpillingRowsDictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows_dict = SpillingRowsDict(
+            "pseudo_table",
+            PseudoMergeStrategy(),
+            max_rows_in_memory=2,
+        )
+
+    def tearDown(self):
+        self.rows_dict.close()
+
+    def put_test_rows(self):
+        for i in range(5):
+            self.rows_dict.put(i, (f"pk{i}", f"value{i}"), "source")
+        # duplicate of a spilled row
+        self.rows_dict.put(0, ("pk5", "value0"), "target")
+
+    ###########################################################################
+    # TESTS
+    def test_put_spills(self):
+        self.assertFalse(self.rows_dict.rows.spilled)
+        self.put_test_rows()
+        self.assertTrue(self.rows_dict.rows.spilled)
+        self.assertTrue(os.path.exists(self.rows_dict.rows.path))
+        self.assertEqual(len(self.rows_dict.rows), 5)
+        # insertion order is kept
+        self.assertEqual(list(self.rows_dict), [0, 1, 2, 3, 4])
+        self.assertEqual(
+            self.rows_dict.get(0),
+            (["pk0", "value0"], "source", frozenset([("source", "pk0"), ("target", "pk5")]))
+        )
+        self.assertEqual(
+            list(self.rows_dict.get_rows()),
+            [[f"pk{i}", f"value{i}"] for i in range(5)]
+        )
+
+    def test_close_removes_file(self):
+        self.put_test_rows()
+        path = self.rows_dict.rows.path
+        self.rows_dict.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_pickle(self):
+        self.put_test_rows()
+        path = self.rows_dict.rows.path
+        # e.g. returned from a worker process
+        unpickled = pickle.loads(pickle.dumps(self.rows_dict))
+        self.assertNotEqual(unpickled.rows.path, path)
+        self.assertEqual(list(unpickled.get_rows()), [[f"pk{i}", f"value{i}"] for i in range(5)])
+        # The original can still be used.
+        self.rows_dict.put(5, ("pk6", "value5"), "source")
+        self.assertEqual(len(self.rows_dict), 6)
+        self.assertEqual(len(unpickled), 5)
+        unpickled_path = unpickled.rows.path
+        unpickled.close()
+        self.assertFalse(os.path.exists(unpickled_path))
+        self.assertTrue(os.path.exists(path))
+
+    def test_invalid_budget(self):
+        self.assertRaises(
+            ValueError,
+            lambda: SpillingRowsDict("pseudo_table", PseudoMergeStrategy(), max_rows_in_memory=0)
+        )
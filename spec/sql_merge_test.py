@@ -0,0 +1,29 @@
+import unittest
+
+from sqlalchemy.engine.url import make_url
+
+import sql_merge
+
+
+class SqlMergeTest(unittest.TestCase):
+
+    ###########################################################################
+    # TESTS
+    def test_supports_sql_merge(self):
+        def supports(source_url, target_url):
+            return sql_merge.supports_sql_merge(make_url(source_url), make_url(target_url))
+
+        self.assertTrue(supports("sqlite:///source.db", "sqlite:///target.db"))
+        self.assertFalse(supports("sqlite://", "sqlite:///target.db"))
+        self.assertTrue(supports(
+            "mysql://user:pw@localhost/source",
+            "mysql://user:pw@localhost/target",
+        ))
+        self.assertFalse(supports(
+            "mysql://user:pw@localhost/source",
+            "mysql://user:pw@otherhost/target",
+        ))
+        self.assertFalse(supports(
+            "mysql://user:pw@localhost/source",
+            "postgresql://user:pw@localhost/target",
+        ))
@@ -57,3 +57,8 @@ class StrategyTest(unittest.TestCase):
             return strategy.choose_row(*rows_datas[2])
         self.assertRaises(ValueError, raises)
         self.assertEqual(strategy.choose_row(*rows_datas[3]), ["target3.1"])
+
+    def test_merge_database_indices(self):
+        rows_data = [(("db1",), 1), (("db0",), 0), (("db2",), 2)]
+        self.assertEqual(strategies.SourceMergeStrategy().choose_row(*rows_data), ["db2"])
+        self.assertEqual(strategies.TargetMergeStrategy().choose_row(*rows_data), ["db0"])
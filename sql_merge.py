@@ -0,0 +1,416 @@
+"""Merging tables inside the database (instead of reading all rows into Python).
+
+This works if the source database can be queried through a connection to the target database:
+- SQLite: the source file is attached to the target's connection.
+- MySQL: source and target are databases (schemas) on the same server.
+
+For each table the rows of source and target are staged in a temporary table,
+duplicates (equal non-key columns) are grouped with GROUP BY and each group gets a new primary key.
+(origin, old primary key) -> new primary key mappings are stored in temporary mapping tables
+which are used to remap the foreign keys. Finally the target table is replaced by one row per group.
+The results equal the ones of the Python path with the SourceMergeStrategy.
+
+'write_merged_tables_remapping_keys_in_sql' uses the same temporary tables
+for rows merged in Python, so only the key remapping happens inside the database.
+"""
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    Table,
+    and_,
+    exists,
+    func,
+    literal_column,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.url import URL
+
+import db_helpers
+from DbData import DbData
+import hashing
+from MergeSettings import MergeSettings
+from strategies import RowsDict
+import value_generators
+
+
+# alias of the attached source database (SQLite only)
+SOURCE_SCHEMA_ALIAS = "merge_source"
+
+# origin codes in the staged rows; staged in this order so source rows are preferred
+SOURCE_ORIGIN = 0
+TARGET_ORIGIN = 1
+
+# first SQLite version supporting UPDATE ... FROM
+SQLITE_UPDATE_FROM_VERSION = (3, 33, 0)
+
+
+def supports_sql_merge(source_url: URL, target_url: URL) -> bool:
+    """Checks if the target database can query the source database directly."""
+    if source_url.get_backend_name() != target_url.get_backend_name():
+        return False
+    backend = target_url.get_backend_name()
+    if backend == "sqlite":
+        # in-memory databases cannot be attached to another connection
+        return source_url.database not in (None, "", ":memory:")
+    if backend == "mysql":
+        return (
+            source_url.host == target_url.host
+            and source_url.port == target_url.port
+            and source_url.username == target_url.username
+            and source_url.password == target_url.password
+            and source_url.database != target_url.database
+        )
+    return False
+
+
+def merge_tables_in_sql(source: DbData, target: DbData, table_names: List[str]) -> None:
+    """Merges the given tables of 'source' into the ones of 'target' (like 'merge.merge_tables'
+    followed by 'merge.adjust_relationships' and writing the merged rows).
+    ASSUMPTION: IDs as primary keys in 1st column.
+    """
+    graph = db_helpers.get_foreign_key_graph(target)
+    tables = [table for table in graph.sorted_tables if table.name in table_names]
+    connection = target.engine.connect()
+    try:
+        source_schema = attach_source(connection, source)
+        try:
+            with connection.begin():
+                _merge_in_transaction(connection, graph, tables, source_schema)
+        finally:
+            detach_source(connection)
+    finally:
+        connection.close()
+    target.session.expire_all()
+
+
+def write_merged_tables_remapping_keys_in_sql(
+    target: DbData,
+    merged_tables: List[RowsDict],
+    settings: MergeSettings,
+) -> None:
+    """Replaces the rows of the target tables with the merged rows
+    (like 'merge.adjust_relationships' followed by truncating and writing the tables).
+    New primary keys are assigned in Python but the foreign keys are remapped
+    with a few set-based UPDATE statements inside the database.
+    ASSUMPTION: IDs as primary keys in 1st column.
+    """
+    graph = db_helpers.get_foreign_key_graph(target)
+    merged_tables_by_name = {
+        merged_table.table_name: merged_table
+        for merged_table in merged_tables
+    }
+    tables = [table for table in graph.sorted_tables if table.name in merged_tables_by_name]
+    connection = target.engine.connect()
+    try:
+        with connection.begin():
+            temp_metadata = MetaData()
+            staged_tables: Dict[str, "StagedTable"] = {}
+            # mapping: origin -> integer code (origins may be e.g. strings)
+            origin_codes: Dict[Any, int] = {}
+            try:
+                for table in tables:
+                    print("staging merged table", table.name)
+                    staged = StagedTable(table, temp_metadata)
+                    staged.create(connection)
+                    staged_tables[table.name] = staged
+                    staged.stage_merged_rows(
+                        connection,
+                        merged_tables_by_name[table.name],
+                        origin_codes,
+                        settings.batch_size,
+                    )
+                _remap_foreign_keys(connection, graph, tables, staged_tables)
+                _replace_rows(connection, tables, staged_tables)
+            finally:
+                for staged in staged_tables.values():
+                    staged.drop(connection)
+    finally:
+        connection.close()
+    target.session.expire_all()
+
+
+def attach_source(connection: Connection, source: DbData) -> str:
+    """Makes the source database accessible through the target's connection.
+    Returns the schema of the source tables."""
+    if connection.dialect.name == "sqlite":
+        # must happen outside of a transaction
+        connection.execute(
+            text(f"ATTACH DATABASE :path AS {SOURCE_SCHEMA_ALIAS}"),
+            path=source.engine.url.database,
+        )
+        return SOURCE_SCHEMA_ALIAS
+    return source.engine.url.database
+
+
+def detach_source(connection: Connection) -> None:
+    if connection.dialect.name == "sqlite":
+        connection.execute(text(f"DETACH DATABASE {SOURCE_SCHEMA_ALIAS}"))
+
+
+def _merge_in_transaction(
+    connection: Connection,
+    graph: db_helpers.ForeignKeyGraph,
+    tables: List[Table],
+    source_schema: str,
+) -> None:
+    temp_metadata = MetaData()
+    staged_tables: Dict[str, "StagedTable"] = {}
+    try:
+        for table in tables:
+            print("merging table", table.name, "in the database")
+            staged = StagedTable(table, temp_metadata)
+            staged.create(connection)
+            staged_tables[table.name] = staged
+            staged.stage_rows(connection, get_source_table(table, source_schema), SOURCE_ORIGIN)
+            staged.stage_rows(connection, table, TARGET_ORIGIN)
+            staged.group_duplicates(connection)
+            staged.map_primary_keys(connection)
+            staged.remove_duplicates(connection)
+
+        _remap_foreign_keys(connection, graph, tables, staged_tables)
+        _replace_rows(connection, tables, staged_tables)
+    finally:
+        for staged in staged_tables.values():
+            staged.drop(connection)
+
+
+def _remap_foreign_keys(
+    connection: Connection,
+    graph: db_helpers.ForeignKeyGraph,
+    tables: List[Table],
+    staged_tables: Dict[str, "StagedTable"],
+) -> None:
+    for referenced_table in tables:
+        for referencing_table, columns, _ in graph.referencing(referenced_table.name):
+            if referencing_table.name not in staged_tables:
+                logging.warning(
+                    f"not adjusting foreign keys of '{referencing_table.name}' "
+                    f"referencing '{referenced_table.name}' because it has not been merged."
+                )
+                continue
+            for column in columns:
+                staged_tables[referencing_table.name].remap_foreign_key(
+                    connection,
+                    column.name,
+                    staged_tables[referenced_table.name],
+                )
+
+
+def _replace_rows(
+    connection: Connection,
+    tables: List[Table],
+    staged_tables: Dict[str, "StagedTable"],
+) -> None:
+    # Delete referencing rows before the rows they reference.
+    for table in reversed(tables):
+        connection.execute(table.delete())
+    for table in tables:
+        staged_tables[table.name].write(connection)
+
+
+def get_source_table(table: Table, source_schema: str) -> Table:
+    """Returns a table with the structure of 'table' in the source database."""
+    return Table(
+        table.name,
+        MetaData(),
+        *[Column(column.name, column.type) for column in table.columns],
+        schema=source_schema
+    )
+
+
+class StagedTable():
+    """Temporary tables used to merge one table:
+    - rows: the rows of source and target with their origin and old/new primary key
+    - groups: one row per group of duplicates, the new primary key is the group's id
+      (only used by 'merge_tables_in_sql')
+    - mapping: (origin, old primary key) -> new primary key
+    """
+
+    def __init__(self, table: Table, metadata: MetaData) -> None:
+        self.table = table
+        self.primary_key = list(table.columns)[0]
+        self.hashed_column_names = [
+            list(table.columns)[i].name
+            for i in hashing.get_indices_for_hashing(table)
+        ]
+        self.rows = Table(
+            f"_merge_rows_{table.name}",
+            metadata,
+            Column("_merge_id", Integer, primary_key=True, autoincrement=True),
+            Column("_merge_origin", Integer, nullable=False),
+            Column("_merge_old_pk", self.primary_key.type),
+            Column("_merge_new_pk", Integer),
+            *[Column(column.name, column.type) for column in table.columns],
+            prefixes=["TEMPORARY"]
+        )
+        # The hashed values are copied because MySQL cannot refer to
+        # a temporary table more than once in the same query.
+        self.groups = Table(
+            f"_merge_groups_{table.name}",
+            metadata,
+            Column("new_pk", Integer, primary_key=True, autoincrement=True),
+            Column("representative_id", Integer, nullable=False),
+            *[Column(name, table.columns[name].type) for name in self.hashed_column_names],
+            prefixes=["TEMPORARY"]
+        )
+        self.mapping = Table(
+            f"_merge_map_{table.name}",
+            metadata,
+            Column("origin", Integer, primary_key=True, autoincrement=False),
+            Column("old_pk", self.primary_key.type, primary_key=True, autoincrement=False),
+            Column("new_pk", Integer, nullable=False),
+            prefixes=["TEMPORARY"]
+        )
+
+    def create(self, connection: Connection) -> None:
+        for table in (self.rows, self.groups, self.mapping):
+            table.create(bind=connection)
+
+    def drop(self, connection: Connection) -> None:
+        for table in (self.rows, self.groups, self.mapping):
+            table.drop(bind=connection, checkfirst=True)
+
+    def stage_rows(self, connection: Connection, table: Table, origin: int) -> None:
+        primary_key = table.columns[self.primary_key.name]
+        connection.execute(self.rows.insert().from_select(
+            ["_merge_origin", "_merge_old_pk"] + [column.name for column in table.columns],
+            select(
+                [literal_column(str(origin)), primary_key.label("_merge_old_pk")]
+                + list(table.columns)
+            )
+            .order_by(primary_key)
+        ))
+
+    def stage_merged_rows(
+        self,
+        connection: Connection,
+        merged_rows: RowsDict,
+        origin_codes: Dict[Any, int],
+        batch_size: int = db_helpers.DEFAULT_BATCH_SIZE,
+    ) -> None:
+        """Stages the chosen rows of 'merged_rows' with new primary keys
+        and maps the primary keys of all rows they represent to the new ones.
+        'origin_codes' is shared by all tables so origins are encoded consistently."""
+        column_names = [column.name for column in self.table.columns]
+        id_generator = value_generators.value_generator_for_type(int)
+        for batch in db_helpers.batched(merged_rows.values(), batch_size):
+            staged_rows = []
+            mappings = []
+            for row, origin, primary_keys in batch:
+                new_pk = next(id_generator)
+                staged_row = dict(zip(column_names, row))
+                staged_row.update(
+                    _merge_origin=origin_codes.setdefault(origin, len(origin_codes)),
+                    _merge_old_pk=row[0],
+                    _merge_new_pk=new_pk,
+                )
+                staged_rows.append(staged_row)
+                mappings.extend(
+                    {
+                        "origin": origin_codes.setdefault(old_origin, len(origin_codes)),
+                        "old_pk": old_pk,
+                        "new_pk": new_pk,
+                    }
+                    for old_origin, old_pk in primary_keys
+                )
+            connection.execute(self.rows.insert(), staged_rows)
+            connection.execute(self.mapping.insert(), mappings)
+
+    def group_duplicates(self, connection: Connection) -> None:
+        """Creates one group per distinct combination of hashed values.
+        The first staged row (source rows before target rows) represents the group
+        and the groups are numbered in that order (like the RowsDict's insertion order)."""
+        first_id = func.min(self.rows.c._merge_id)
+        hashed_columns = [self.rows.c[name] for name in self.hashed_column_names]
+        connection.execute(self.groups.insert().from_select(
+            ["representative_id"] + self.hashed_column_names,
+            select([first_id] + hashed_columns)
+            .group_by(*hashed_columns)
+            .order_by(first_id)
+        ))
+
+    def map_primary_keys(self, connection: Connection) -> None:
+        same_group = and_(*[
+            self.groups.c[name].isnot_distinct_from(self.rows.c[name])
+            for name in self.hashed_column_names
+        ])
+        connection.execute(self.rows.update().values(
+            _merge_new_pk=select([self.groups.c.new_pk]).where(same_group).as_scalar()
+        ))
+        connection.execute(self.mapping.insert().from_select(
+            ["origin", "old_pk", "new_pk"],
+            select([
+                self.rows.c._merge_origin,
+                self.rows.c._merge_old_pk,
+                self.rows.c._merge_new_pk,
+            ])
+        ))
+
+    def remove_duplicates(self, connection: Connection) -> None:
+        """Keeps only the representative row of each group."""
+        connection.execute(self.rows.delete().where(
+            self.rows.c._merge_id.notin_(select([self.groups.c.representative_id]))
+        ))
+
+    def remap_foreign_key(
+        self,
+        connection: Connection,
+        column_name: str,
+        referenced: "StagedTable",
+    ) -> None:
+        column = self.rows.c[column_name]
+        mapping = referenced.mapping
+        mapped = and_(
+            mapping.c.origin == self.rows.c._merge_origin,
+            mapping.c.old_pk == column,
+        )
+        num_unmapped = connection.execute(
+            select([func.count()])
+            .select_from(self.rows)
+            .where(and_(column.isnot(None), ~exists().where(mapped)))
+        ).scalar()
+        if num_unmapped > 0:
+            raise ValueError(
+                f"Could not find rows with primary keys referenced by {num_unmapped} rows "
+                f"of {self.table.name}.{column_name} in {referenced.table.name}."
+            )
+        logging.debug(f"remapping {self.table.name}.{column_name} in the database")
+        dialect = connection.dialect
+        if dialect.name != "sqlite":
+            # UPDATE ... FROM (PostgreSQL) / UPDATE ... JOIN (MySQL)
+            connection.execute(
+                self.rows.update().values({column_name: mapping.c.new_pk}).where(mapped)
+            )
+        elif dialect.dbapi.sqlite_version_info >= SQLITE_UPDATE_FROM_VERSION:
+            # SQLAlchemy does not render UPDATE ... FROM for SQLite.
+            quote = dialect.identifier_preparer.quote
+            connection.execute(text(
+                f"UPDATE {quote(self.rows.name)} "
+                f"SET {quote(column_name)} = {quote(mapping.name)}.new_pk "
+                f"FROM {quote(mapping.name)} "
+                f"WHERE {mapped.compile(dialect=dialect)}"
+            ))
+        else:
+            connection.execute(
+                self.rows.update()
+                .where(column.isnot(None))
+                .values({column_name: select([mapping.c.new_pk]).where(mapped).as_scalar()})
+            )
+
+    def write(self, connection: Connection) -> None:
+        """Inserts the staged rows with their new primary keys."""
+        columns = list(self.table.columns)
+        connection.execute(self.table.insert().from_select(
+            [column.name for column in columns],
+            select(
+                [self.rows.c._merge_new_pk]
+                + [self.rows.c[column.name] for column in columns[1:]]
+            )
+            .order_by(self.rows.c._merge_new_pk)
+        ))
@@ -0,0 +1,176 @@
+from array import array
+from collections.abc import Mapping
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .MergeStrategy import MergeStrategy
+from .RowsDict import RowsDict
+
+
+# array type codes
+ORIGIN_CODE_TYPE = "H"
+PRIMARY_KEY_TYPE = "q"
+
+
+class CompactRowsDict(RowsDict):
+    """RowsDict that stores its entries column by column instead of one tuple per entry:
+    rows in a list, origins as small integer codes and the first old primary key of each entry
+    in typed arrays. Only entries that represent several merged rows need additional objects.
+
+    'rows' is a read-only view that provides the same entries as RowsDict.rows.
+    'values' yields the entries with the primary keys as tuple instead of a frozenset.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        strategy: MergeStrategy,
+        key_of: Optional[Callable[[tuple], tuple]] = None,
+    ) -> None:
+        super().__init__(table_name, strategy, key_of)
+        # mapping: row hash -> slot (index into the lists/arrays below)
+        self._slots: Dict[Any, int] = {}
+        self._rows: List[list] = []
+        self._origin_codes = array(ORIGIN_CODE_TYPE)
+        self._primary_key_origin_codes = array(ORIGIN_CODE_TYPE)
+        # becomes a list if a primary key is not a (64 bit) integer
+        self._primary_keys: Any = array(PRIMARY_KEY_TYPE)
+        # mapping: slot -> [(origin code, primary key)] of all but the first merged row
+        self._more_primary_keys: Dict[int, List[Tuple[int, Any]]] = {}
+        self._origins: List[Any] = []
+        self._origin_codes_by_origin: Dict[Any, int] = {}
+
+    @property  # type: ignore
+    def rows(self) -> Mapping:
+        return CompactRowsView(self)
+
+    @rows.setter
+    def rows(self, _value) -> None:
+        # RowsDict.__init__ assigns its OrderedDict which is not used.
+        pass
+
+    def _origin_code(self, origin) -> int:
+        code = self._origin_codes_by_origin.get(origin)
+        if code is None:
+            code = len(self._origins)
+            self._origins.append(origin)
+            self._origin_codes_by_origin[origin] = code
+        return code
+
+    def _append_primary_key(self, primary_key) -> None:
+        if isinstance(self._primary_keys, array):
+            try:
+                self._primary_keys.append(primary_key)
+                return
+            except (TypeError, OverflowError):
+                self._primary_keys = list(self._primary_keys)
+        self._primary_keys.append(primary_key)
+
+    def put(self, row_hash: int, row: tuple, origin: str) -> None:
+        self._put_primary_keys(row_hash, row, origin, ((origin, row[0]), ))
+
+    def _put_entry(self, row_hash: int, row: tuple, origin: str, primary_keys: frozenset) -> None:
+        self._put_primary_keys(row_hash, row, origin, primary_keys)
+
+    def _put_primary_keys(
+        self,
+        row_hash: int,
+        row: tuple,
+        origin: str,
+        primary_keys: Iterable[Tuple[Any, Any]],
+    ) -> None:
+        row_hash = self._resolve_collisions(row_hash, row)
+        slot = self._slots.get(row_hash)
+        if slot is None:
+            slot = len(self._rows)
+            self._slots[row_hash] = slot
+            self._rows.append(list(row))
+            self._origin_codes.append(self._origin_code(origin))
+            primary_keys = iter(primary_keys)
+            first_origin, first_primary_key = next(primary_keys)
+            self._primary_key_origin_codes.append(self._origin_code(first_origin))
+            self._append_primary_key(first_primary_key)
+            self._add_primary_keys(slot, primary_keys)
+            return
+
+        prev_row = self._rows[slot]
+        prev_origin = self._origins[self._origin_codes[slot]]
+        chosen_row = self.strategy.choose_row((prev_row, prev_origin), (row, origin))
+        if chosen_row[0] != row[0] and chosen_row[0] != prev_row[0]:
+            raise ValueError(
+                "The row returned by a merge strategy must have the primary of either row."
+            )
+        self._rows[slot] = chosen_row
+        # Foreign keys of the chosen row refer to rows of its origin.
+        if chosen_row == list(row):
+            self._origin_codes[slot] = self._origin_code(origin)
+        self._add_primary_keys(slot, primary_keys)
+
+    def _add_primary_keys(self, slot: int, primary_keys: Iterable[Tuple[Any, Any]]) -> None:
+        known_primary_keys = None
+        for origin, primary_key in primary_keys:
+            if known_primary_keys is None:
+                known_primary_keys = set(self._primary_keys_of(slot))
+            if (origin, primary_key) not in known_primary_keys:
+                known_primary_keys.add((origin, primary_key))
+                self._more_primary_keys.setdefault(slot, []).append(
+                    (self._origin_code(origin), primary_key)
+                )
+
+    def _primary_keys_of(self, slot: int) -> Iterator[Tuple[Any, Any]]:
+        origins = self._origins
+        yield origins[self._primary_key_origin_codes[slot]], self._primary_keys[slot]
+        for origin_code, primary_key in self._more_primary_keys.get(slot, ()):
+            yield origins[origin_code], primary_key
+
+    def _resolve_collisions(self, row_hash: int, row: tuple) -> int:
+        if self.key_of is None:
+            return row_hash
+        key_of = self.key_of
+        slots = self._slots
+        while row_hash in slots and key_of(self._rows[slots[row_hash]]) != key_of(row):
+            logging.warning(
+                f"hash collision in table '{self.table_name}' "
+                f"for {str(tuple(row))} and {str(tuple(self._rows[slots[row_hash]]))}"
+            )
+            row_hash += 1
+        return row_hash
+
+    def _entry(self, slot: int) -> Tuple[list, Any, Tuple[Tuple[Any, Any], ...]]:
+        return (
+            self._rows[slot],
+            self._origins[self._origin_codes[slot]],
+            tuple(self._primary_keys_of(slot)),
+        )
+
+    def get_rows(self) -> Iterable[list]:
+        return iter(self._rows)
+
+    def values(self):
+        return (self._entry(slot) for slot in range(len(self._rows)))
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class CompactRowsView(Mapping):
+    """Read-only 'RowsDict.rows' compatible view of a CompactRowsDict."""
+
+    def __init__(self, rows_dict: CompactRowsDict) -> None:
+        self._rows_dict = rows_dict
+
+    def __getitem__(self, row_hash):
+        row, origin, primary_keys = self._rows_dict._entry(self._rows_dict._slots[row_hash])
+        return row, origin, frozenset(primary_keys)
+
+    def __contains__(self, row_hash) -> bool:
+        return row_hash in self._rows_dict._slots
+
+    def __iter__(self):
+        return iter(self._rows_dict._slots)
+
+    def __len__(self) -> int:
+        return len(self._rows_dict._slots)
@@ -1,5 +1,6 @@
 from collections import OrderedDict
-from typing import Iterable, Tuple, Union
+import logging
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
 
 from .MergeStrategy import MergeStrategy
 
@@ -8,12 +9,24 @@ class RowsDict():
     """This class is a wrapper around a ordered dictionary `rows`.
     Each instance is associated with a table with 'self.table_name'.
     Rows are merged according to 'self.strategy'.
+
+    If 'key_of' is given (a function returning the hashed values of a row, e.g. a HashingPlan)
+    rows with equal hashes are only merged if their hashed values are equal, too.
+    Otherwise the hash is a collision and the row is stored under the next free (integer) key.
     """
 
-    def __init__(self, table_name: str, strategy: MergeStrategy) -> None:
+    def __init__(
+        self,
+        table_name: str,
+        strategy: MergeStrategy,
+        key_of: Optional[Callable[[tuple], tuple]] = None,
+    ) -> None:
         self.table_name = table_name
         self.strategy = strategy
+        self.key_of = key_of
         # mapping: row hash -> (chosen_row: list, origin: str, primary_keys: set)
+        # 'origin' is the origin of the chosen row.
+        # 'primary_keys' contains (origin, primary key) tuples of all rows merged into the entry.
         self.rows: OrderedDict = OrderedDict()
 
     def get(self, key) -> Union[Tuple[tuple, str], None]:
@@ -22,25 +35,73 @@ class RowsDict():
     # TODO: use db_helper for finding primary key
     # ASSUMPTION: IDs as primary keys in 1st column
     def put(self, row_hash: int, row: tuple, origin: str) -> None:
+        self._put_entry(row_hash, row, origin, frozenset(((origin, row[0]), )))
+
+    def _put_entry(self, row_hash: int, row: tuple, origin: str, primary_keys: frozenset) -> None:
+        """Puts a row that represents the rows with the given (origin, primary key) tuples."""
+        row_hash = self._resolve_collisions(row_hash, row)
         if row_hash in self.rows:
             chosen_row = self.strategy.choose_row(
                 self.rows[row_hash][0:2],
                 (row, origin),
             )
-            prev_row, _, _ = self.rows[row_hash]
+            prev_row, prev_origin, prev_primary_keys = self.rows[row_hash]
             if chosen_row[0] != row[0] and chosen_row[0] != prev_row[0]:
                 raise ValueError(
                     "The row returned by a merge strategy must have the primary of either row."
                 )
             self.rows[row_hash] = (
                 chosen_row,
-                origin,
-                # Keep primary keys of both given rows.
+                # Foreign keys of the chosen row refer to rows of its origin.
+                origin if chosen_row == list(row) else prev_origin,
+                # Keep primary keys of all merged rows.
                 # The 'chosen_row' should always have the primary key of either given row.
-                frozenset((prev_row[0], row[0]))
+                prev_primary_keys | primary_keys
             )
         else:
-            self.rows[row_hash] = (list(row), origin, frozenset((row[0], )))
+            self.rows[row_hash] = (list(row), origin, primary_keys)
+
+    def update(self, other: "RowsDict", digest_of: Callable[[list], int]) -> None:
+        """Merges all entries of 'other' (e.g. built by another worker) into this RowsDict.
+        Entries of 'other' that may have been moved by a hash collision
+        are put with their original hash which is recomputed with 'digest_of'.
+        """
+        for row_hash, (row, origin, primary_keys) in other.rows.items():
+            if row_hash - 1 in other.rows:
+                row_hash = digest_of(row)
+            self._put_entry(row_hash, row, origin, primary_keys)
+
+    def put_grouped(self, other: "RowsDict", group_hash_by_row_hash: Dict[int, int]) -> None:
+        """Puts all entries of 'other' (of the same class) into this (empty) RowsDict.
+        Entries whose hashes are in 'group_hash_by_row_hash' are merged (by the strategy)
+        into the entry with the mapped hash, e.g. near-duplicates (see 'near_duplicates').
+        The values are not compared (see 'key_of') because they may differ.
+        """
+        key_of = self.key_of
+        self.key_of = None
+        try:
+            for row_hash, (row, origin, primary_keys) in other.rows.items():
+                self._put_entry(
+                    group_hash_by_row_hash.get(row_hash, row_hash),
+                    row,
+                    origin,
+                    primary_keys,
+                )
+        finally:
+            self.key_of = key_of
+
+    def _resolve_collisions(self, row_hash: int, row: tuple) -> int:
+        """Returns the key 'row' must be stored under (linear probing)."""
+        if self.key_of is None:
+            return row_hash
+        key_of = self.key_of
+        while row_hash in self.rows and key_of(self.rows[row_hash][0]) != key_of(row):
+            logging.warning(
+                f"hash collision in table '{self.table_name}' "
+                f"for {str(tuple(row))} and {str(tuple(self.rows[row_hash][0]))}"
+            )
+            row_hash += 1
+        return row_hash
 
     def get_rows(self) -> Iterable[list]:
         return (row for row_hash, (row, origin, primary_keys) in self.rows.items())
@@ -48,6 +109,9 @@ class RowsDict():
     def values(self):
         return self.rows.values()
 
+    def close(self) -> None:
+        """Releases resources held by the rows (see SpillingRowsDict)."""
+
     def __str__(self) -> str:
         rows = list(self.rows.values())
         return (
@@ -57,3 +121,6 @@ class RowsDict():
 
     def __iter__(self):
         return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
@@ -30,10 +30,17 @@ class SourceMergeStrategy(MergeStrategy):
     Since there is a foreign key on `contact_person_id` the hash of the two
     users is identical. When filling the hash dictionary the source must be
     preferred when collisions happen.
+
+    When merging N databases at once the origins are database indices.
+    Then the database with the highest index is regarded as the source
+    (like in the pairwise merge(merge(db1, db2), db3) where db3 is the last source).
     """
 
     def _choose_row(self, *rows_data) -> tuple:
         for row, source in rows_data:
             if source == "source":
                 return row
+        origins = [origin for _, origin in rows_data]
+        if all(isinstance(origin, int) for origin in origins):
+            return rows_data[origins.index(max(origins))][0]
         raise ValueError("Found no row with source 'source'")
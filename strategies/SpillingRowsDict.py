@@ -0,0 +1,219 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import os
+import pickle
+import sqlite3
+import tempfile
+from typing import Any, Callable, Iterator, Optional, Tuple
+import weakref
+
+from .MergeStrategy import MergeStrategy
+from .RowsDict import RowsDict
+
+
+# fixed so equal keys are always pickled to equal bytes
+PICKLE_PROTOCOL = 4
+
+
+class SpillingRowsDict(RowsDict):
+    """RowsDict that keeps at most 'max_rows_in_memory' rows in memory.
+    When there are more rows all of them are spilled to a temporary SQLite file
+    (in 'directory' or the default temporary directory) which is deleted on 'close'.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        strategy: MergeStrategy,
+        key_of: Optional[Callable[[tuple], tuple]] = None,
+        max_rows_in_memory: int = 100000,
+        directory: Optional[str] = None,
+    ) -> None:
+        super().__init__(table_name, strategy, key_of)
+        self.rows = SpillingRows(max_rows_in_memory, directory)  # type: ignore
+
+    def close(self) -> None:
+        self.rows.close()
+
+
+class SpillingRows(MutableMapping):
+    """Ordered mapping (row hash -> entry) used as 'SpillingRowsDict.rows'.
+    Entries are ordered by their first insertion like in an OrderedDict.
+    Entries read from the file are copies, i.e. they must be set again after changing them.
+    """
+
+    def __init__(self, max_rows_in_memory: int, directory: Optional[str] = None) -> None:
+        if max_rows_in_memory < 1:
+            raise ValueError(f"max_rows_in_memory must be at least 1 (got {max_rows_in_memory}).")
+        self.max_rows_in_memory = max_rows_in_memory
+        self.directory = directory
+        self.path: Optional[str] = None
+        # mapping: key -> (insertion number, entry)
+        self._memory: OrderedDict = OrderedDict()
+        self._next_seq = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._finalizer = None
+        # (key, (found, insertion number, entry)) of the last lookup
+        # because 'in' is usually followed by '[]'
+        self._last_lookup: Optional[Tuple[Any, Tuple[bool, Any, Any]]] = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._connection is not None
+
+    def _open(self) -> None:
+        fd, self.path = tempfile.mkstemp(prefix="rows_", suffix=".sqlite", dir=self.directory)
+        os.close(fd)
+        self._connect()
+        self._connection.execute(
+            "CREATE TABLE rows (key BLOB PRIMARY KEY, seq INTEGER NOT NULL, entry BLOB NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX rows_seq ON rows (seq)")
+
+    def _connect(self) -> None:
+        # The file is private and temporary so durability does not matter.
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._finalizer = weakref.finalize(self, _remove_file, self._connection, self.path)
+
+    def close(self) -> None:
+        if self._finalizer is not None:
+            self._finalizer()
+        self._connection = None
+        self._memory.clear()
+        self._last_lookup = None
+
+    def _lookup(self, key) -> Tuple[bool, Any, Any]:
+        """Returns (found, insertion number, entry)."""
+        if key in self._memory:
+            seq, entry = self._memory[key]
+            return True, seq, entry
+        if self._connection is None:
+            return False, None, None
+        record = self._connection.execute(
+            "SELECT seq, entry FROM rows WHERE key = ?",
+            (pickle.dumps(key, PICKLE_PROTOCOL), ),
+        ).fetchone()
+        if record is None:
+            return False, None, None
+        return True, record[0], pickle.loads(record[1])
+
+    def _cached_lookup(self, key) -> Tuple[bool, Any, Any]:
+        if self._last_lookup is not None and self._last_lookup[0] == key:
+            return self._last_lookup[1]
+        result = self._lookup(key)
+        self._last_lookup = (key, result)
+        return result
+
+    def __contains__(self, key) -> bool:
+        return self._cached_lookup(key)[0]
+
+    def __getitem__(self, key):
+        found, _, entry = self._cached_lookup(key)
+        if not found:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key, entry) -> None:
+        found, seq, _ = self._cached_lookup(key)
+        if not found:
+            seq = self._next_seq
+            self._next_seq += 1
+        self._memory[key] = (seq, entry)
+        self._last_lookup = None
+        if len(self._memory) > self.max_rows_in_memory:
+            self._flush()
+
+    def __delitem__(self, key) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._memory.pop(key, None)
+        if self._connection is not None:
+            self._connection.execute(
+                "DELETE FROM rows WHERE key = ?",
+                (pickle.dumps(key, PICKLE_PROTOCOL), ),
+            )
+        self._last_lookup = None
+
+    def _flush(self) -> None:
+        """Moves all entries from memory to the file."""
+        if self._connection is None:
+            self._open()
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO rows (key, seq, entry) VALUES (?, ?, ?)",
+            (
+                (
+                    pickle.dumps(key, PICKLE_PROTOCOL),
+                    seq,
+                    pickle.dumps(entry, pickle.HIGHEST_PROTOCOL),
+                )
+                for key, (seq, entry) in self._memory.items()
+            )
+        )
+        self._connection.commit()
+        self._memory.clear()
+        self._last_lookup = None
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:  # type: ignore
+        if self._connection is None:
+            for key, (_, entry) in self._memory.items():
+                yield key, entry
+            return
+        self._flush()
+        cursor = self._connection.execute("SELECT key, entry FROM rows ORDER BY seq")
+        try:
+            while True:
+                records = cursor.fetchmany(1000)
+                if len(records) == 0:
+                    return
+                for key, entry in records:
+                    yield pickle.loads(key), pickle.loads(entry)
+        finally:
+            cursor.close()
+
+    def values(self) -> Iterator[Any]:  # type: ignore
+        return (entry for _, entry in self.items())
+
+    def __iter__(self) -> Iterator[Any]:
+        return (key for key, _ in self.items())
+
+    def __len__(self) -> int:
+        if self._connection is None:
+            return len(self._memory)
+        self._flush()
+        return self._connection.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def __getstate__(self) -> dict:
+        """The unpickled copy (e.g. returned from a worker process) gets a snapshot of the file
+        so this mapping can still be used (and removes its own file on 'close')."""
+        state = dict(self.__dict__, _connection=None, _finalizer=None, _last_lookup=None)
+        if self._connection is not None:
+            state["path"] = self._snapshot()
+        state["_spilled"] = self._connection is not None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        spilled = state.pop("_spilled")
+        self.__dict__.update(state)
+        if spilled:
+            self._connect()
+
+    def _snapshot(self) -> str:
+        """Copies the file (with SQLite's online backup) and returns the copy's path."""
+        fd, path = tempfile.mkstemp(prefix="rows_", suffix=".sqlite", dir=self.directory)
+        os.close(fd)
+        # e.g. pending deletes
+        self._connection.commit()
+        snapshot = sqlite3.connect(path)
+        try:
+            self._connection.backup(snapshot)
+        finally:
+            snapshot.close()
+        return path
+
+
+def _remove_file(connection: sqlite3.Connection, path: str) -> None:
+    connection.close()
+    if os.path.exists(path):
+        os.remove(path)
@@ -2,10 +2,15 @@ from .MergeStrategy import MergeStrategy
 
 
 class TargetMergeStrategy(MergeStrategy):
-    """Does the opposite of what the SourceMergeStrategy does."""
+    """Does the opposite of what the SourceMergeStrategy does.
+    For database indices as origins the lowest index is chosen.
+    """
 
     def _choose_row(self, *rows_data) -> tuple:
         for row, source in rows_data:
             if source == "target":
                 return row
+        origins = [origin for _, origin in rows_data]
+        if all(isinstance(origin, int) for origin in origins):
+            return rows_data[origins.index(min(origins))][0]
         raise ValueError("Found no row with source 'target'")
@@ -2,3 +2,5 @@ from .MergeStrategy import MergeStrategy
 from .SourceMergeStrategy import SourceMergeStrategy
 from .TargetMergeStrategy import TargetMergeStrategy
 from .RowsDict import RowsDict
+from .SpillingRowsDict import SpillingRowsDict
+from .CompactRowsDict import CompactRowsDict